@@ -0,0 +1,120 @@
+"""
+Build or extend the per-pixel history cubes served by /get_timeseries.
+
+    python -m app.ingest_cube --cube-dir /data/cube --variable chl --start 2016-05-01
+    python -m app.ingest_cube --cube-dir /data/cube            # append new days, all variables
+
+Each daily LIS_{date}_{variable}.tif under the format_url layout is read
+once and appended to the tiled CUBE_DIR/{variable}/{year}.npy. Days already
+in the cube are skipped, so re-running only appends what is new. Days the
+origin answers 404 for are recorded as missing; an incremental run re-checks
+the last CUBE_RECHECK_DAYS of them (--retry-missing re-checks all in range).
+Other read errors are not recorded, so the day is tried again next run.
+"""
+import argparse
+import datetime
+import logging
+import os
+
+import numpy as np
+import rasterio
+import requests
+from rasterio.errors import RasterioIOError
+
+from app.utils.cube_utils import CUBE_DIR, PixelCube
+from app.utils.insitu_utils import INSITU_VARIABLES
+from app.utils.time_utils import generate_dates_in_range
+from app.utils.url_utils import format_google_url, format_url
+
+logger = logging.getLogger(__name__)
+
+# Days before the newest checked day that an incremental run checks again,
+# so rasters published late replace their "missing" entries.
+CUBE_RECHECK_DAYS = int(os.environ.get("CUBE_RECHECK_DAYS", "14"))
+
+def _is_missing(url: str) -> bool:
+    """True only if the origin says there is no object at url; errors may be transient, so they are not."""
+    if not url.startswith(("http://", "https://")):
+        return not os.path.exists(url)
+    try:
+        response = requests.get(url, headers={"Range": "bytes=0-0"}, timeout=30)
+    except requests.RequestException:
+        return False
+    return response.status_code in (404, 410)
+
+def read_day(url: str):
+    """
+    Return (dataset profile bits, float32 band with NaN for no-data), or None
+    if the raster does not exist. Other read errors are raised.
+    """
+    url = format_google_url(url)
+    try:
+        with rasterio.Env(GDAL_DISABLE_READDIR_ON_OPEN="EMPTY_DIR"):
+            with rasterio.open(url) as src:
+                data = src.read(1).astype("float32")
+                data[data == -9999] = np.nan
+                if src.nodata is not None:
+                    data[data == src.nodata] = np.nan
+                return (src.crs, src.transform, src.shape), data
+    except RasterioIOError as e:
+        if not _is_missing(url):
+            raise
+        logger.info(f"No raster for {url}: {str(e)}")
+        return None
+
+def ingest(cube_dir: str, variable: str, start: str = None, end: str = None,
+           retry_missing: bool = False) -> int:
+    """
+    Ingest [start, end]. By default end is yesterday and start is
+    CUBE_RECHECK_DAYS before the newest checked day, so missing days in that
+    window are checked again along with the new ones.
+    """
+    cube = PixelCube(cube_dir, variable)
+    cube.refresh()
+    if end is None:
+        end = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+    if start is None:
+        checked = cube.dates | cube.missing
+        if not checked:
+            raise SystemExit(f"{variable}: cube is empty, pass --start for the initial ingest")
+        newest = datetime.date.fromisoformat(max(checked))
+        start = (newest - datetime.timedelta(days=CUBE_RECHECK_DAYS)).isoformat()
+        retry_missing = True
+
+    written = 0
+    for date in generate_dates_in_range(start, end):
+        if date in cube.dates or (date in cube.missing and not retry_missing):
+            continue
+        try:
+            day = read_day(format_url(date, variable))
+        except RasterioIOError as e:
+            logger.warning(f"{variable} {date}: read failed, not recorded: {str(e)}")
+            continue
+        if day is None:
+            cube.write_day(date, None)
+            continue
+        grid, data = day
+        cube.init_grid(*grid)
+        cube.write_day(date, data)
+        written += 1
+        logger.info(f"{variable} {date}: ingested")
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cube-dir", default=CUBE_DIR, required=CUBE_DIR is None)
+    parser.add_argument("--variable", action="append", choices=INSITU_VARIABLES,
+                        help="Variable to ingest (repeatable; default: all)")
+    parser.add_argument("--start", help="First date, YYYY-MM-DD")
+    parser.add_argument("--end", help="Last date, YYYY-MM-DD (default: yesterday)")
+    parser.add_argument("--retry-missing", action="store_true",
+                        help="Re-check every day in range recorded as missing (incremental runs re-check recent ones)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for variable in args.variable or INSITU_VARIABLES:
+        written = ingest(args.cube_dir, variable, args.start, args.end, args.retry_missing)
+        logger.info(f"{variable}: {written} new days")
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,98 @@
-from fastapi import FastAPI, Query, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 import pandas as pd
+import asyncio
+import hashlib
+import json
 import logging
-import requests
-import tempfile
-from io import BytesIO
+import time
 from datetime import datetime, timedelta
 import numpy as np
 from typing import List, Dict, Optional
-import rasterio
-from rasterio import features
-from rasterio.errors import RasterioIOError
 import os
-from typing import List
-import requests
 from pydantic import BaseModel
-import urllib.request
+from shapely.geometry import box
 
 
-from app.utils.raster_utils import get_pixel_value, get_transect_values
-from app.utils.url_utils import format_url
+from app.utils.raster_utils import get_pixel_value, get_pixel_values, get_transect_values
+from app.utils.url_utils import format_google_url, format_url
 from app.utils.time_utils import generate_dates_in_range
+from app.utils.timeseries_utils import fetch_timeseries
+from app.utils.dataset_cache import DATASET_CACHE
+from app.utils.block_cache import block_cache_stats, object_version
+from app.utils.mask_cache import MASK_CACHE
+from app.utils.composite_utils import COMPOSITE_STATS, composite, composite_window_stats, encode_composite_geotiff
+from app.utils.subset_utils import COLORMAPS, SUBSET_MAX_SIZE, SUBSET_MEDIA_TYPES, render_subset
+from app.utils.executor_utils import (
+    ExecutorBusy, ExecutorError, ExecutorTimeout, executor_stats, run_cpu, run_io, shutdown_executors
+)
+from app.utils.insitu_utils import INSITU_VARIABLES, InsituIndex
+from app.utils.spatial_index import parse_polygon
+from app.utils.insitu_loader import INSITU_REFRESH_SECONDS, load_insitu_frame
+from app.utils.matchup_utils import MATCHUP_MAX_CV, MATCHUP_MIN_VALID, MATCHUP_WINDOW, matchups_csv, run_matchups
+from app.utils.metrics_utils import (
+    BYTES_READ, REQUEST_LATENCY, REQUESTS, RESPONSE_BYTES, ProfiledJSONResponse, render_metrics, start_profile
+)
+from app.utils.polygon_utils import get_polygon_stats as polygon_stats, iter_polygon_timeseries, prepare_polygon_mask
+from app.utils.response_cache import RESPONSE_CACHE, normalize_params
 
 
 class PolygonRequest(BaseModel):
     url: str
     polygon: dict  # GeoJSON polygon geometry
 
-def is_valid(x):
-    if isinstance(x, (list, np.ndarray)):
-        return len(x) > 0 and x[0] is not None
-    return pd.notnull(x)
+class PointQuery(BaseModel):
+    lat: float
+    lon: float
+    date: Optional[str] = None  # YYYY-MM-DD, overrides the request date
+
+class BatchValueRequest(BaseModel):
+    points: List[PointQuery]
+    url: Optional[str] = None  # raster for points without a date
+    variable: Optional[str] = None  # with date/point dates, resolved via format_url
+    date: Optional[str] = None
+
+class InsituPolygonRequest(BaseModel):
+    variable: str
+    polygon: dict  # GeoJSON Polygon or MultiPolygon geometry
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    layout: str = "rows"  # rows or columns, as for /get_insitu_data
+
+class PolygonTimeseriesRequest(BaseModel):
+    polygon: dict  # GeoJSON polygon geometry
+    variable: str
+    start_date: str
+    end_date: str
+
+MAX_BATCH_POINTS = int(os.environ.get("MAX_BATCH_POINTS", "10000"))
+# Distinct rasters one batch may read, and how many of them it reads at once,
+# so a single request cannot fill the io queue
+MAX_BATCH_RASTERS = int(os.environ.get("MAX_BATCH_RASTERS", "366"))
+BATCH_RASTER_CONCURRENCY = int(os.environ.get("BATCH_RASTER_CONCURRENCY", "8"))
+# Browser/CDN cache lifetime for /get_subset responses. The map client requests
+# rasters without a cache-busting query, so this bounds how long a browser
+# shows a scene republished under the same URL; the ETag follows the raster's
+# version, so revalidating after it is a cheap 304
+SUBSET_MAX_AGE = int(os.environ.get("SUBSET_MAX_AGE", "3600"))
+COMPOSITE_MAX_DAYS = int(os.environ.get("COMPOSITE_MAX_DAYS", "366"))
+COMPOSITE_TIMEOUT = float(os.environ.get("COMPOSITE_TIMEOUT", "600"))
+POLYGON_TIMESERIES_MAX_DAYS = int(os.environ.get("POLYGON_TIMESERIES_MAX_DAYS", "366"))
+POLYGON_TIMESERIES_TIMEOUT = float(os.environ.get("POLYGON_TIMESERIES_TIMEOUT", "600"))
+# Most samples one spatial in situ query returns; the rest are reported as truncated
+INSITU_QUERY_MAX_ROWS = int(os.environ.get("INSITU_QUERY_MAX_ROWS", "100000"))
+MATCHUP_MAX_RANGE_DAYS = int(os.environ.get("MATCHUP_MAX_RANGE_DAYS", "3660"))
+MATCHUP_TIMEOUT = float(os.environ.get("MATCHUP_TIMEOUT", "600"))
+# Browser cache lifetime for cached raster point/transect responses
+RESPONSE_MAX_AGE = int(os.environ.get("RESPONSE_MAX_AGE", "3600"))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ProfiledJSONResponse)
 
 # CORS setup
 app.add_middleware(
@@ -47,54 +101,187 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag", "Server-Timing", "X-Raster-Bytes-Read",
+        "X-Raster-Width", "X-Raster-Height", "X-Raster-CRS", "X-Raster-Transform", "X-Raster-Bounds",
+        "X-Raster-Scale", "X-Raster-Offset", "X-Raster-Nodata", "X-Composite-Dates", "X-Cache",
+    ],
 )
 
+# Send this request header to get the call's timing breakdown back as Server-Timing
+PROFILE_HEADER = "x-profile"
+
+# Idempotent GET routes served from the response cache, by cache namespace:
+# raster responses are keyed by the version of their url's raster (as the
+# block cache revalidates it), in situ ones change with each reload.
+# /get_matchups is left out: it depends on both, and on rasters published
+# after the in situ data, so neither generation alone describes it.
+CACHED_ROUTES = {
+    "/get_value": "raster",
+    "/get_transect": "raster",
+    "/get_available_dates": "insitu",
+    "/get_insitu_data": "insitu",
+    "/get_insitu_in_bbox": "insitu",
+    "/get_insitu_nearby": "insitu",
+}
+
+_UNCACHED_HEADERS = {"content-length", "content-type", "content-encoding", "etag", "vary", "cache-control"}
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    tags = [t.strip() for t in request.headers.get("if-none-match", "").split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+async def _cache_generation(namespace: str, request: Request) -> Optional[str]:
+    """The namespace's current generation for this request; None means don't cache."""
+    if namespace == "insitu":
+        return INSITU_GENERATION  # None until loaded: nothing is cached
+    url = request.query_params.get("url")
+    version = await asyncio.to_thread(object_version, format_google_url(url)) if url else None
+    if version is None:
+        return None
+    return f"{namespace}-{hashlib.sha256(version.encode()).hexdigest()[:16]}"
+
+def _cache_headers(etag: str, status: str, namespace: str) -> dict:
+    return {
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        "X-Cache": status,
+        "Cache-Control": "no-cache" if namespace == "insitu" else f"public, max-age={RESPONSE_MAX_AGE}",
+    }
+
+def _from_cache(request: Request, entry, status: str, namespace: str) -> Response:
+    headers = {**entry.headers, **_cache_headers(entry.etag, status, namespace)}
+    if _etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    body, encoding = entry.encoded(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=entry.media_type, headers=headers)
+
+def _label_route(request: Request, path: str):
+    # Routing is skipped when the cache answers; label the request with its route for the metrics
+    request.scope["route"] = next((r for r in app.router.routes if getattr(r, "path", None) == path), None)
+
+# Registered before record_metrics so that one stays outermost and also sees cache hits
+@app.middleware("http")
+async def cache_responses(request: Request, call_next):
+    path = request.url.path
+    namespace = CACHED_ROUTES.get(path)
+    if (request.method != "GET" or namespace is None or not RESPONSE_CACHE.enabled
+            or "no-cache" in request.headers.get("cache-control", "")):
+        return await call_next(request)
+    generation = await _cache_generation(namespace, request)
+    if generation is None:
+        return await call_next(request)
+
+    params = normalize_params(request.query_params.multi_items(), {"url": format_google_url})
+    key = RESPONSE_CACHE.key(path, generation, params)
+    etag = RESPONSE_CACHE.etag(key)
+    if _etag_matches(request, etag):
+        _label_route(request, path)
+        return Response(status_code=304, headers=_cache_headers(etag, "REVALIDATED", namespace))
+    entry = await asyncio.to_thread(RESPONSE_CACHE.get, key)
+    if entry is not None:
+        _label_route(request, path)
+        return _from_cache(request, entry, "HIT", namespace)
+
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    # Replay the endpoint's own headers (e.g. Content-Disposition), not the ones set per response here
+    headers = {k: v for k, v in response.headers.items() if k not in _UNCACHED_HEADERS}
+    entry = await asyncio.to_thread(RESPONSE_CACHE.put, key, body, response.headers.get("content-type"), headers)
+    return _from_cache(request, entry, "MISS", namespace)
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    profile = start_profile()
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - t0
+
+    # Label by route template, not raw path, to keep series bounded
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    REQUESTS.inc(route, request.method, str(response.status_code))
+    REQUEST_LATENCY.observe(elapsed, route)
+    BYTES_READ.inc(route, amount=profile.bytes_read)
+    if "content-length" in response.headers:
+        RESPONSE_BYTES.inc(route, amount=int(response.headers["content-length"]))
+
+    if request.headers.get(PROFILE_HEADER):
+        response.headers["Server-Timing"] = profile.server_timing(elapsed)
+        response.headers["X-Raster-Bytes-Read"] = str(profile.bytes_read)
+    return response
+
+@app.exception_handler(ExecutorBusy)
+async def executor_busy_handler(request: Request, exc: ExecutorBusy):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(ExecutorTimeout)
+async def executor_timeout_handler(request: Request, exc: ExecutorTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
 # Global variable for in situ data
 INSITU_DF = None
-INSITU_DATES_CACHE = None
-
-@app.on_event("startup")
-async def load_insitu_data():
-    """Load in situ data at application startup"""
-    global INSITU_DF, INSITU_DATES_CACHE
+INSITU_INDEX = None
+
+INSITU_VALIDATOR = None  # ETag/Last-Modified of the loaded pickle
+INSITU_GENERATION = None  # response cache namespace of the loaded data
+_insitu_refresh_task = None
+
+def _load_insitu(current: Optional[str]):
+    """Blocking part of a (re)load: fetch/clean the frame and build its index."""
+    df, validator = load_insitu_frame(current=current)
+    if df is None:
+        return None, None, validator
+    logger.info(f"Data types:\n{df.dtypes}")
+    index = InsituIndex(df)
+    for var, var_index in index.variables.items():
+        logger.info(f"Indexed {len(var_index)} {var} rows over {len(var_index.dates)} dates")
+    return df, index, validator
+
+async def refresh_insitu_data():
+    """Load or reload in situ data off the event loop and swap it in."""
+    global INSITU_DF, INSITU_INDEX, INSITU_VALIDATOR, INSITU_GENERATION
     try:
-        pickle_url = "https://storage.googleapis.com/insitu_data/LIS_insitu_data.pkl"
-        logger.info(f"Loading in situ data from: {pickle_url}")
-        
-        # Download the pickle file
-        response = requests.get(pickle_url)
-        response.raise_for_status()
-        
-        # Load from bytes
-        INSITU_DF = pd.read_pickle(BytesIO(response.content))
-        
-        # Debug: Check initial date format
-        logger.info(f"Initial date column type: {INSITU_DF['date'].dtype}")
-        logger.info(f"Sample dates: {INSITU_DF['date'].head()}")
-        
-        # Convert 'date' column from string to datetime
-        if 'date' in INSITU_DF.columns:
-            # First convert to datetime
-            INSITU_DF['date'] = pd.to_datetime(INSITU_DF['date'])
-            
-            # Then clean the data columns
-            for var in ['chl', 'spm', 'cdom']:
-                if var in INSITU_DF.columns:
-                    # Convert any list/array values to single float
-                    INSITU_DF[var] = INSITU_DF[var].apply(
-                        lambda x: float(x[0]) if isinstance(x, (list, np.ndarray)) and len(x) > 0 else x
-                    )
-                    # Replace any non-finite values with NaN
-                    INSITU_DF[var] = pd.to_numeric(INSITU_DF[var], errors='coerce')
-        
-        # Debug: Verify cleaned data
-        logger.info(f"Cleaned data sample:\n{INSITU_DF.head()}")
-        logger.info(f"Data types:\n{INSITU_DF.dtypes}")
-        
+        df, index, validator = await asyncio.to_thread(_load_insitu, INSITU_VALIDATOR)
     except Exception as e:
         logger.error(f"Failed to load in situ data: {str(e)}", exc_info=True)
-        INSITU_DF = None
-        INSITU_DATES_CACHE = None
+        return
+    if df is not None:
+        # Single assignment on the event loop: requests see old or new, never a mix
+        previous = INSITU_GENERATION
+        # Derived from the validator so instances sharing a cache backend agree on it
+        tag = hashlib.sha256(validator.encode()).hexdigest()[:16] if validator else f"local{time.time_ns()}"
+        INSITU_DF, INSITU_INDEX, INSITU_VALIDATOR = df, index, validator
+        INSITU_GENERATION = f"insitu-{tag}"
+        if previous is not None and previous != INSITU_GENERATION:
+            await asyncio.to_thread(RESPONSE_CACHE.invalidate, previous)
+        logger.info(f"In situ data ready ({validator})")
+
+async def _insitu_refresh_loop():
+    while True:
+        await refresh_insitu_data()
+        if INSITU_INDEX is None:
+            delay = 30  # nothing loaded yet: retry soon
+        elif INSITU_REFRESH_SECONDS > 0:
+            delay = INSITU_REFRESH_SECONDS
+        else:
+            return
+        await asyncio.sleep(delay)
+
+@app.on_event("startup")
+async def load_insitu_data():
+    """Start loading in situ data in the background; in situ routes return 503 until it is ready"""
+    global _insitu_refresh_task
+    _insitu_refresh_task = asyncio.create_task(_insitu_refresh_loop())
+
+@app.on_event("shutdown")
+async def stop_insitu_refresh():
+    if _insitu_refresh_task is not None:
+        _insitu_refresh_task.cancel()
+    shutdown_executors()
 
 @app.get("/get_available_dates")
 async def get_available_dates(
@@ -105,146 +292,184 @@ async def get_available_dates(
     Retrieve all unique dates that have in situ data for the specified variable
     Returns: { "dates": ["YYYY-MM-DD", ...] } or detailed error info
     """
-    if INSITU_DF is None:
-        logger.error("In situ data not loaded - INSITU_DF is None")
+    index = INSITU_INDEX
+    if index is None:
+        logger.error("In situ data not loaded - INSITU_INDEX is None")
         raise HTTPException(
             status_code=503,
             detail="In situ data not loaded. Please try again later."
         )
 
-    try:
-        # Validate variable
-        valid_variables = ['chl', 'spm', 'cdom']
-        if variable not in valid_variables:
-            logger.error(f"Invalid variable requested: {variable}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid variable. Must be one of: {', '.join(valid_variables)}"
-            )
-
-        # Check if variable exists in dataframe
-        if variable not in INSITU_DF.columns:
-            logger.error(f"Variable {variable} not found in dataframe. Available columns: {INSITU_DF.columns.tolist()}")
-            return JSONResponse(
-                status_code=404,
-                content={"error": f"Variable {variable} not found in dataset"}
-            )
-
-        # Verify date column exists and is datetime
-        if 'date' not in INSITU_DF.columns:
-            logger.error("'date' column not found in dataframe")
-            return JSONResponse(
-                status_code=500,
-                content={"error": "Date column missing in dataset"}
-            )
-            
-        if not pd.api.types.is_datetime64_any_dtype(INSITU_DF['date']):
-            logger.error(f"Date column is not datetime type. Current type: {INSITU_DF['date'].dtype}")
-            return JSONResponse(
-                status_code=500,
-                content={"error": "Date column is not in datetime format"}
-            )
-
-        # Filter for dates with valid data
-        mask = (
-            INSITU_DF[variable].notna() & 
-            (INSITU_DF[variable] != -9999) &
-            INSITU_DF['date'].notna()
+    # Validate variable
+    if variable not in INSITU_VARIABLES:
+        logger.error(f"Invalid variable requested: {variable}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid variable. Must be one of: {', '.join(INSITU_VARIABLES)}"
         )
-        
-        if not mask.any():
-            logger.warning(f"No valid data found for variable {variable}")
-            return {"dates": []}
 
-        valid_dates = INSITU_DF.loc[mask, 'date'].dt.date.unique()
+    # Check if variable exists in dataframe
+    if index.get(variable) is None:
+        logger.error(f"Variable {variable} not found in in situ index")
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Variable {variable} not found in dataset"}
+        )
 
-        # Convert to ISO format strings and sort
-        sorted_dates = sorted([date.isoformat() for date in valid_dates if date is not None])
+    sorted_dates = index.available_dates(variable)
+    if not sorted_dates:
+        logger.warning(f"No valid data found for variable {variable}")
 
-        logger.info(f"Returning {len(sorted_dates)} dates for {variable}")
-        return {"dates": sorted_dates}
-
-    except Exception as e:
-        logger.error(f"Critical error in get_available_dates: {str(e)}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Internal server error: {str(e)}"
-        )
+    logger.info(f"Returning {len(sorted_dates)} dates for {variable}")
+    return {"dates": sorted_dates}
 
 @app.get("/get_insitu_data")
 async def get_insitu_data(
     variable: str = Query(..., description="Variable name (chl, spm, or cdom)"),
-    date: str = Query(..., description="Date in YYYY-MM-DD format")
-) -> Dict[str, List[Dict]]:
+    date: str = Query(..., description="Date in YYYY-MM-DD format"),
+    layout: str = Query("rows", pattern="^(rows|columns)$", description="rows: array of records; columns: parallel arrays")
+):
     """
     Retrieve in situ data for a specific variable and date
     Returns: { "data": [ { "lat": float, "lon": float, "value": float, "date": str }, ... ] }
+    or with layout=columns: { "data": { "lat": [float], "lon": [float], "value": [float], "date": [str] }, "variable": str }
     """
-    if INSITU_DF is None:
+    index = INSITU_INDEX
+    if index is None:
         raise HTTPException(
             status_code=503,
             detail="In situ data not loaded. Please try again later."
         )
 
+    # Validate variable
+    if variable not in INSITU_VARIABLES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid variable. Must be one of: {', '.join(INSITU_VARIABLES)}"
+        )
+
+    # Parse and validate date
     try:
-        # Validate variable
-        valid_variables = ['chl', 'spm', 'cdom']
-        if variable not in valid_variables:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid variable. Must be one of: {', '.join(valid_variables)}"
-            )
-
-        # Parse and validate date
-        try:
-            target_date = pd.to_datetime(date).date()
-        except ValueError:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid date format. Use YYYY-MM-DD"
-            )
-
-        # Filter data
-        filtered = INSITU_DF[
-            (INSITU_DF['date'].dt.date == target_date) &
-            INSITU_DF[variable].apply(is_valid)
-        ]
-
-        if filtered.empty:
-            raise HTTPException(
-                status_code=404,
-                detail=f"No {variable} data available for {date}"
-            )
-
-        # Prepare response
-        result = []
-        for _, row in filtered.iterrows():
-            try:
-                val = row[variable]
-                if isinstance(val, (list, np.ndarray)):
-                    val = val[0]
-                result.append({
-                    "lat": float(row['lat']),
-                    "lon": float(row['lon']),
-                    "value": float(val),
-                    "date": row['date'].isoformat(),
-                    "variable": variable
-                })
-            except (IndexError, ValueError, TypeError) as e:
-                logger.warning(f"Skipping invalid data point: {str(e)}")
-                continue
-
-        return {"data": result}
+        target_date = pd.to_datetime(date).date()
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid date format. Use YYYY-MM-DD"
+        )
 
-    except Exception as e:
-        logger.error(f"Error processing request: {str(e)}")
+    if layout == "columns":
+        result = index.columns(variable, target_date)
+    else:
+        result = index.records(variable, target_date)
+    if not result:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No {variable} data available for {date}"
+        )
+
+    if layout == "columns":
+        return ProfiledJSONResponse({"data": result, "variable": variable})
+    return ProfiledJSONResponse({"data": result})
+
+def _insitu_index_for(variable: str) -> InsituIndex:
+    """The loaded in situ index, or 503/400/404 if it is not loaded or variable is unknown."""
+    index = INSITU_INDEX
+    if index is None:
+        raise HTTPException(status_code=503, detail="In situ data not loaded. Please try again later.")
+    if variable not in INSITU_VARIABLES:
         raise HTTPException(
-            status_code=500,
-            detail=f"Server error: {str(e)}"
+            status_code=400,
+            detail=f"Invalid variable. Must be one of: {', '.join(INSITU_VARIABLES)}"
         )
+    if index.get(variable) is None:
+        raise HTTPException(status_code=404, detail=f"Variable {variable} not found in dataset")
+    return index
+
+def _parse_date_range(start_date: Optional[str], end_date: Optional[str]):
+    """Optional (start, end) dates; 400 if malformed or reversed."""
+    try:
+        start = pd.to_datetime(start_date).date() if start_date else None
+        end = pd.to_datetime(end_date).date() if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    return start, end
+
+def _insitu_samples(index: InsituIndex, variable: str, rows: np.ndarray, layout: str):
+    """Sample rows in the /get_insitu_data shape for layout, capped at INSITU_QUERY_MAX_ROWS."""
+    count = len(rows)
+    rows = rows[:INSITU_QUERY_MAX_ROWS]
+    if layout == "columns":
+        content = {"data": index.columns_at(variable, rows), "variable": variable}
+    else:
+        content = {"data": index.records_at(variable, rows)}
+    content.update({"count": count, "truncated": count > len(rows)})
+    return ProfiledJSONResponse(content)
+
+@app.get("/get_insitu_in_bbox")
+async def get_insitu_in_bbox(
+    variable: str = Query(..., description="Variable name (chl, spm, or cdom)"),
+    bbox: str = Query(..., description="west,south,east,north in WGS84"),
+    start_date: Optional[str] = Query(None, description="From this date (YYYY-MM-DD); all dates if omitted"),
+    end_date: Optional[str] = Query(None, description="Up to this date (YYYY-MM-DD)"),
+    layout: str = Query("rows", pattern="^(rows|columns)$", description="rows: array of records; columns: parallel arrays")
+):
+    """
+    In situ samples inside a bbox, in date order, from the spatial index
+    Returns the /get_insitu_data shape for layout, plus "count" and "truncated"
+    """
+    index = _insitu_index_for(variable)
+    west, south, east, north = _parse_bbox(bbox)
+    start, end = _parse_date_range(start_date, end_date)
+    rows = index.spatial[variable].query_rows(box(west, south, east, north), start, end)
+    return _insitu_samples(index, variable, rows, layout)
+
+@app.get("/get_insitu_nearby")
+async def get_insitu_nearby(
+    variable: str = Query(..., description="Variable name (chl, spm, or cdom)"),
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=1000, description="Most stations to return"),
+    radius_m: Optional[float] = Query(None, gt=0, description="Only stations within this distance"),
+    start_date: Optional[str] = Query(None, description="Only stations sampled from this date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Only stations sampled up to this date (YYYY-MM-DD)")
+):
+    """
+    Stations closest to a point by great-circle distance, closest first
+    Returns: { "stations": { "lat": [float], "lon": [float], "distance_m": [float], "samples": [int] } }
+    with samples counted within the date range
+    """
+    index = _insitu_index_for(variable)
+    start, end = _parse_date_range(start_date, end_date)
+    spatial = index.spatial[variable]
+    stations, distances, counts = spatial.nearest(lon, lat, k, radius_m, start, end)
+    return ProfiledJSONResponse({"stations": {
+        "lat": spatial.lat[stations],
+        "lon": spatial.lon[stations],
+        "distance_m": distances,
+        "samples": counts,
+    }})
+
+@app.post("/get_insitu_in_polygon")
+async def get_insitu_in_polygon(request: InsituPolygonRequest):
+    """
+    In situ samples inside a GeoJSON polygon across dates, in date order, from the spatial index
+    Returns the /get_insitu_data shape for layout, plus "count" and "truncated"
+    """
+    index = _insitu_index_for(request.variable)
+    if request.layout not in ("rows", "columns"):
+        raise HTTPException(status_code=400, detail="layout must be rows or columns")
+    try:
+        polygon = parse_polygon(request.polygon)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid polygon: {str(e)}")
+    start, end = _parse_date_range(request.start_date, request.end_date)
+    rows = index.spatial[request.variable].query_rows(polygon, start, end)
+    return _insitu_samples(index, request.variable, rows, request.layout)
 
 @app.get("/get_value")
-def get_value(
+async def get_value(
     url: str = Query(...),
     lat: float = Query(...),
     lon: float = Query(...)
@@ -254,7 +479,7 @@ def get_value(
     Returns: { "value": float, "lat": float, "lon": float }
     """
     try:
-        value = get_pixel_value(url, lat, lon)
+        value = await run_io(get_pixel_value, url, lat, lon)
         if value is None:
             return JSONResponse(status_code=404, content={"error": "No data at this location"})
         return {
@@ -262,70 +487,338 @@ def get_value(
             "lat": lat,
             "lon": lon
         }
+    except ExecutorError:
+        raise
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+@app.post("/get_values")
+async def get_values(request: BatchValueRequest):
+    """
+    Get pixel values for many points in one call
+    Each point is read from url, or from the variable's raster for the point's
+    date (falling back to the request date).
+    Returns: { "values": [float | null, ...] } in input order
+    """
+    if len(request.points) > MAX_BATCH_POINTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_POINTS} points per request")
+
+    # Group point indices by the raster they read from
+    groups = {}
+    for i, point in enumerate(request.points):
+        date = point.date or request.date
+        if date and request.variable:
+            try:
+                url = format_url(date, request.variable)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid date format for point {i}. Use YYYY-MM-DD")
+        elif request.url:
+            url = request.url
+        else:
+            raise HTTPException(status_code=400, detail=f"Point {i} needs a url, or a variable and date")
+        groups.setdefault(url, []).append(i)
+        if len(groups) > MAX_BATCH_RASTERS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_RASTERS} distinct rasters per request")
+
+    # One io job per raster, at most BATCH_RASTER_CONCURRENCY in flight
+    semaphore = asyncio.Semaphore(BATCH_RASTER_CONCURRENCY)
+
+    async def read_group(url, indices):
+        async with semaphore:
+            return await run_io(get_pixel_values, url,
+                                [request.points[i].lat for i in indices],
+                                [request.points[i].lon for i in indices])
+
+    tasks = [asyncio.ensure_future(read_group(url, indices)) for url, indices in groups.items()]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # Don't leave the rest of the batch queued with nobody waiting for it
+        for task in tasks:
+            task.cancel()
+        raise
+    values = [None] * len(request.points)
+    for indices, group_values in zip(groups.values(), results):
+        for i, value in zip(indices, group_values):
+            values[i] = value
+    return {"values": values}
+
 @app.get("/get_transect")
-def get_transect(
+async def get_transect(
     url: str = Query(...),
     start_lat: float = Query(...),
     start_lon: float = Query(...),
     end_lat: float = Query(...),
-    end_lon: float = Query(...)
+    end_lon: float = Query(...),
+    interpolation: str = Query("nearest", pattern="^(nearest|bilinear)$", description="nearest or bilinear"),
+    max_points: Optional[int] = Query(None, ge=2, description="Downsample the transect to at most this many samples")
 ):
+    """
+    Sample values along a line between two points
+    Returns: { "values": [float], "distances": [metres from start], "start_point": dict, "end_point": dict }
+    """
     try:
-        values, distances = get_transect_values(url, start_lat, start_lon, end_lat, end_lon)
+        values, distances = await run_io(
+            get_transect_values, url, start_lat, start_lon, end_lat, end_lon,
+            interpolation=interpolation, max_points=max_points
+        )
         
-        if not values:
+        if len(values) == 0:
             return JSONResponse(status_code=404, content={"error": "No valid data along transect"})
         
-        return {
+        return ProfiledJSONResponse({
             "values": values,
             "distances": distances,
             "start_point": {"lat": start_lat, "lon": start_lon},
             "end_point": {"lat": end_lat, "lon": end_lon}
-        }
+        })
+    except ExecutorError:
+        raise
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
+def _parse_bbox(bbox: Optional[str]):
+    """(west, south, east, north) from a query string value; 400 if malformed."""
+    if bbox is None:
+        return None
+    try:
+        box = tuple(float(v) for v in bbox.split(","))
+    except ValueError:
+        box = ()
+    if len(box) != 4 or box[0] >= box[2] or box[1] >= box[3]:
+        raise HTTPException(status_code=400, detail="bbox must be west,south,east,north")
+    return box
+
+@app.get("/get_subset")
+async def get_subset(
+    request: Request,
+    url: str = Query(...),
+    bbox: Optional[str] = Query(None, description="west,south,east,north in WGS84; whole raster if omitted"),
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="Web map zoom; reads no finer than its screen pixels"),
+    max_size: int = Query(SUBSET_MAX_SIZE, ge=1, le=SUBSET_MAX_SIZE, description="Longest side in pixels"),
+    format: str = Query("tif", pattern="^(tif|f16|u16|png)$", description="tif, f16, u16 or png"),
+    vmin: float = Query(0.0, description="u16 quantization / png color range"),
+    vmax: float = Query(20.0),
+    colormap: str = Query("turbo", pattern=f"^({'|'.join(COLORMAPS)})$")
+):
+    """
+    A bbox- and zoom-dependent subset of a raster, read from overviews or decimated
+    tif: float32 GeoTIFF (nodata -9999); f16: raw float16, NaN as no-data;
+    u16: raw uint16, value = raw * X-Raster-Scale + X-Raster-Offset, 65535 as no-data;
+    png: RGBA through colormap over [vmin, vmax], transparent as no-data.
+    Raw arrays are little-endian, row-major, sized by X-Raster-Width/Height.
+    """
+    box = _parse_bbox(bbox)
+    # Validator from the raster's version and the normalized query: a
+    # revalidation is answered before anything is read or rendered
+    etag = None
+    version = await asyncio.to_thread(object_version, format_google_url(url))
+    if version is not None:
+        params = normalize_params(request.query_params.multi_items(), {"url": format_google_url})
+        digest = hashlib.sha256(f"{version}:{params}".encode()).hexdigest()
+        etag = f'"{digest[:32]}"'
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers={
+                "ETag": etag, "Cache-Control": f"public, max-age={SUBSET_MAX_AGE}"
+            })
+    try:
+        rendered = await run_io(render_subset, url, box, zoom, max_size, format, vmin, vmax, colormap)
+    except ExecutorError:
+        raise
+    except Exception as e:
+        logger.error(f"Subset failed: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="bbox does not overlap the raster")
+
+    body, headers = rendered
+    if etag is None:
+        # Version unknown (not an http(s) url, or the origin could not be asked)
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers.update({"ETag": etag, "Cache-Control": f"public, max-age={SUBSET_MAX_AGE}"})
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=SUBSET_MEDIA_TYPES[format], headers=headers)
+
+@app.get("/get_composite")
+async def get_composite(
+    variable: str = Query(..., description="Variable name (chl, spm, or cdom)"),
+    start_date: str = Query(...),
+    end_date: str = Query(...),
+    stats: str = Query("mean,count", description=f"Comma-separated: {', '.join(COMPOSITE_STATS)}"),
+    bbox: Optional[str] = Query(None, description="west,south,east,north in WGS84; whole grid if omitted"),
+    format: str = Query("tif", pattern="^(tif|json)$", description="tif: composite GeoTIFF; json: window summary"),
+    median_min: float = Query(0.0, description="Histogram range for the approximate median"),
+    median_max: float = Query(50.0)
+):
+    """
+    Per-pixel composite of the daily rasters in a date range
+    tif: float32 GeoTIFF, one band per stat (band descriptions name them), NaN as no-data
+    json: { "variable", "start_date", "end_date", "dates_used", "stats": {stat: {"mean", "min", "max", "pixels"}} }
+    """
+    if variable not in INSITU_VARIABLES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid variable. Must be one of: {', '.join(INSITU_VARIABLES)}"
+        )
+    try:
+        dates = generate_dates_in_range(start_date, end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    if not dates or len(dates) > COMPOSITE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must cover 1 to {COMPOSITE_MAX_DAYS} days")
+    names = [name.strip() for name in stats.split(",") if name.strip()]
+    if not names or any(name not in COMPOSITE_STATS for name in names):
+        raise HTTPException(status_code=400, detail=f"stats must be a list of: {', '.join(COMPOSITE_STATS)}")
+    if "median" in names and median_max <= median_min:
+        raise HTTPException(status_code=400, detail="median_max must be greater than median_min")
+    box = _parse_bbox(bbox)
+
+    try:
+        result = await composite(variable, dates, names, box, (median_min, median_max), timeout=COMPOSITE_TIMEOUT)
+        if result is None:
+            raise HTTPException(status_code=404, detail="No data available for the selected date range and bbox")
+        if format == "json":
+            return {
+                "variable": variable,
+                "start_date": start_date,
+                "end_date": end_date,
+                "dates_used": len(result["dates"]),
+                "stats": composite_window_stats(result),
+            }
+        body = await run_io(encode_composite_geotiff, result)
+    except (HTTPException, ExecutorError):
+        raise
+    except Exception as e:
+        logger.error(f"Composite failed: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    filename = f"LIS_{start_date.replace('-', '')}_{end_date.replace('-', '')}_{variable}_composite.tif"
+    return Response(body, media_type="image/tiff", headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Composite-Dates": str(len(result["dates"])),
+    })
+
+@app.get("/get_matchups")
+async def get_matchups(
+    variable: str = Query(..., description="Variable name (chl, spm, or cdom)"),
+    start_date: str = Query(..., description="In situ samples from this date (YYYY-MM-DD)"),
+    end_date: str = Query(..., description="In situ samples up to this date (YYYY-MM-DD)"),
+    window: int = Query(MATCHUP_WINDOW, ge=1, le=15, description="Odd box size in pixels around each station"),
+    max_days: int = Query(0, ge=0, le=7, description="Largest in situ to raster date difference"),
+    min_valid: float = Query(MATCHUP_MIN_VALID, ge=0, le=1, description="Minimum fraction of valid box pixels"),
+    max_cv: float = Query(MATCHUP_MAX_CV, gt=0, description="Maximum CV of the outlier-filtered box"),
+    format: str = Query("json", pattern="^(json|csv)$", description="json: table and summary; csv: table")
+):
+    """
+    Match-ups of in situ samples against the daily rasters, with agreement statistics
+    json: { "variable", "start_date", "end_date", "window", "max_days",
+            "summary": {"n", "bias", "mae", "rmse", "r"}, "counts": {...},
+            "matchups": {"insitu_date": [...], "raster_date": [...], "day_offset", "lat", "lon",
+                         "insitu", "satellite" (box median), "filtered_mean", "std", "cv", "valid_pixels"} }
+    csv: the match-up table, one row per match-up
+    """
+    index = INSITU_INDEX
+    if index is None:
+        raise HTTPException(status_code=503, detail="In situ data not loaded. Please try again later.")
+    if variable not in INSITU_VARIABLES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid variable. Must be one of: {', '.join(INSITU_VARIABLES)}"
+        )
+    if window % 2 == 0:
+        raise HTTPException(status_code=400, detail="window must be odd")
+    try:
+        start, end = pd.to_datetime(start_date).date(), pd.to_datetime(end_date).date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    if end < start or (end - start).days + 1 > MATCHUP_MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must cover 1 to {MATCHUP_MAX_RANGE_DAYS} days")
+
+    try:
+        result = await asyncio.wait_for(
+            run_matchups(index, variable, start, end, window, max_days, min_valid, max_cv), MATCHUP_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Match-ups did not finish within {MATCHUP_TIMEOUT:g}s")
+    except ExecutorError:
+        raise
+    except Exception as e:
+        logger.error(f"Match-ups failed: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if format == "csv":
+        filename = f"matchups_{variable}_{start_date.replace('-', '')}_{end_date.replace('-', '')}.csv"
+        return Response(await run_io(matchups_csv, result), media_type="text/csv",
+                        headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+    return ProfiledJSONResponse({
+        "variable": variable,
+        "start_date": start_date,
+        "end_date": end_date,
+        "window": window,
+        "max_days": max_days,
+        **result,
+    })
+
 @app.get("/get_timeseries")
-def get_timeseries(
+async def get_timeseries(
     lat: float = Query(...),
     lon: float = Query(...),
     variable: str = Query(...),
     start_date: str = Query(...),
     end_date: str = Query(...)
-) -> Dict[str, List]:
+):
     """
     Get timeseries data for a location and date range
-    Returns: { "values": [float], "dates": [str], "location": dict, "variable": str }
+    Returns: { "values": [float], "dates": [str], "location": dict, "variable": str,
+               "partial": bool, "timed_out_dates": [str] }
+    partial is true when some days could not be read before TIMESERIES_TIMEOUT;
+    those days are listed in timed_out_dates rather than silently dropped.
     """
     try:
         dates = generate_dates_in_range(start_date, end_date)
-        values = []
-        valid_dates = []
-        
-        for date in dates:
-            url = format_url(date, variable)
-            value = get_pixel_value(url, lat, lon)
-            
-            if value is not None:
-                values.append(value)
-                valid_dates.append(date)
+        # fetch_timeseries enforces TIMESERIES_TIMEOUT itself and returns the days it got
+        values, valid_dates, timed_out = await fetch_timeseries(lat, lon, variable, dates)
         
         if not values:
+            if timed_out:
+                return JSONResponse(status_code=504, content={"error": "Timed out reading the selected date range",
+                                                              "timed_out_dates": timed_out})
             return JSONResponse(status_code=404, content={"error": "No data available for the selected date range"})
         
-        return {
+        return ProfiledJSONResponse({
             "values": values,
             "dates": valid_dates,
             "location": {"lat": lat, "lon": lon},
-            "variable": variable
-        }
+            "variable": variable,
+            "partial": bool(timed_out),
+            "timed_out_dates": timed_out
+        })
+    except ExecutorError:
+        raise
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
     
+@app.get("/cache_stats")
+def cache_stats():
+    """
+    Hit/miss counters for the raster handle, block, polygon mask and response
+    caches, and executor queue depths. Handle and mask counters are this API
+    process's; polygon masks are built here and sent to the cpu workers.
+    """
+    return {
+        "datasets": DATASET_CACHE.stats(),
+        "blocks": block_cache_stats(),
+        "masks": MASK_CACHE.stats(),
+        "executors": executor_stats(),
+        "responses": RESPONSE_CACHE.stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics: request counts and latency per route, hot-path span timings, bytes read"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/debug_dates_processing")
 async def debug_dates_processing(variable: str = "chl"):
     """Debug endpoint for date processing"""
@@ -355,106 +848,85 @@ async def debug_dates_processing(variable: str = "chl"):
     except Exception as e:
         return {"error": str(e)}
     
-# Add this with your other API endpoints
 @app.post("/get_polygon_stats")
 async def get_polygon_stats(request: PolygonRequest):
+    """
+    Statistics of the raster at request.url inside a GeoJSON polygon
+    Returns: { "mean", "min", "max", "std", "count", "raster_bounds", "raster_crs" }
+    """
     logger.info(f"Processing request for URL: {request.url}")
-    try:
-        # Validate polygon
-        if not isinstance(request.polygon.get('coordinates'), list):
-            raise HTTPException(status_code=400, detail="Invalid coordinates")
-
-        tmp_path = None
-        try:
-            # Download file
-            with tempfile.NamedTemporaryFile(suffix='.tif', delete=False) as tmp_file:
-                tmp_path = tmp_file.name
-            urllib.request.urlretrieve(request.url, tmp_path)
-
-            with rasterio.open(tmp_path) as src:
-                # 1. Verify raster has data
-                
-                #This section throws error when running on GCP? maybe taking too long?
-                # height, width = src.shape
-                # sample_size = int(min(height, width) * 0.1)  # 10% of smaller dimension
-
-                # windows = [
-                #     ((0, sample_size), (0, sample_size)),  # Top-left
-                #     ((0, sample_size), (width-sample_size, width)),  # Top-right
-                #     ((height-sample_size, height), (0, sample_size)),  # Bottom-left
-                #     ((height-sample_size, height), (width-sample_size, width)),  # Bottom-right
-                #     ((height//2-sample_size//2, height//2+sample_size//2), 
-                #     (width//2-sample_size//2, width//2+sample_size//2))  # Center
-                # ]
-
-                # has_data = False
-                # for window in windows:
-                #     sample = src.read(1, window=window)
-                #     if not np.all(sample == src.nodata):
-                #         has_data = True
-                #         break
-
-                # if not has_data:
-                #     raise HTTPException(status_code=400, detail="No valid data found in sampled regions")
-
-                # 2. Check polygon intersects raster
-                from shapely.geometry import shape, box
-                raster_bbox = box(*src.bounds)
-                polygon_shape = shape(request.polygon)
-                if not raster_bbox.intersects(polygon_shape):
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Polygon outside raster bounds: {src.bounds}"
-                    )
-
-                # 3. Transform coordinates if needed
-                if src.crs and src.crs != "EPSG:4326":
-                    from rasterio.warp import transform_geom
-                    request.polygon = transform_geom("EPSG:4326", src.crs, request.polygon)
-
-                # 4. Create mask and validate
-                mask = features.geometry_mask(
-                    [request.polygon],
-                    out_shape=src.shape,
-                    transform=src.transform,
-                    invert=True
-                )
-                if mask.sum() == 0:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Polygon covers no raster pixels (check CRS and coordinates)"
-                    )
-
-                # 5. Process data
-                data = src.read(1, masked=True)
-                valid_data = data[mask].compressed()
-                if src.nodata is not None:
-                    valid_data = valid_data[valid_data != src.nodata]
-
-                if len(valid_data) == 0:
-                    raise HTTPException(
-                        status_code=404,
-                        detail="No valid data (all values were no-data)"
-                    )
-
-                return {
-                    "mean": float(np.mean(valid_data)),
-                    "min": float(np.min(valid_data)),
-                    "max": float(np.max(valid_data)),
-                    "std": float(np.std(valid_data)),
-                    "count": len(valid_data),
-                    "raster_bounds": src.bounds,
-                    "raster_crs": str(src.crs)
-                }
-
-        except Exception as e:
-            logger.error(f"Processing failed: {str(e)}", exc_info=True)
-            raise HTTPException(status_code=500, detail=str(e))
-        finally:
-            if tmp_path and os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+    # Validate polygon
+    if not isinstance(request.polygon.get('coordinates'), list):
+        raise HTTPException(status_code=400, detail="Invalid coordinates")
 
+    try:
+        # Rasterize here, where the mask cache is shared by every request; the
+        # worker gets the packed mask (and rasterizes itself if the url won't open here)
+        prepared = await run_io(prepare_polygon_mask, request.polygon, [request.url])
+        stats = await run_cpu(polygon_stats, request.url, request.polygon, *prepared)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExecutorError:
+        raise
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+        logger.error(f"Processing failed: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
-    
+
+    if stats is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No valid data (all values were no-data)"
+        )
+    return stats
+
+@app.post("/get_polygon_timeseries")
+async def get_polygon_timeseries(request: PolygonTimeseriesRequest):
+    """
+    Polygon statistics for every date in a range, streamed as NDJSON
+    Each line: { "date": str, "mean", "min", "max", "std", "count" }, in completion order.
+    If POLYGON_TIMESERIES_TIMEOUT passes mid-stream, the last line is
+    { "timed_out_dates": [str] } with the dates not reduced; if it passes
+    before any date is done, the response is a 504 with those dates instead.
+    """
+    if not isinstance(request.polygon.get('coordinates'), list):
+        raise HTTPException(status_code=400, detail="Invalid coordinates")
+    if request.variable not in INSITU_VARIABLES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid variable. Must be one of: {', '.join(INSITU_VARIABLES)}"
+        )
+    try:
+        dates = generate_dates_in_range(request.start_date, request.end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    if not dates or len(dates) > POLYGON_TIMESERIES_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must cover 1 to {POLYGON_TIMESERIES_MAX_DAYS} days")
+
+    # Rasterize once up front so a polygon that misses the grid is a 400
+    # rather than an empty stream
+    try:
+        prepared = await run_io(
+            prepare_polygon_mask, request.polygon, [format_url(d, request.variable) for d in dates]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if prepared[0] is None:
+        raise HTTPException(status_code=404, detail="No data available for the selected date range")
+
+    results = iter_polygon_timeseries(request.polygon, request.variable, dates, prepared,
+                                      timeout=POLYGON_TIMESERIES_TIMEOUT)
+    # Wait for the first scene before answering, so a run that gets nothing done in time is a 504
+    first = await anext(results, None)
+    if first is not None and "timed_out_dates" in first:
+        return JSONResponse(status_code=504, content={"error": "Timed out reducing the selected date range",
+                                                      "timed_out_dates": first["timed_out_dates"]})
+
+    async def lines():
+        if first is None:
+            return
+        yield json.dumps(first) + "\n"
+        async for result in results:
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
@@ -0,0 +1,431 @@
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, quote, unquote
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import requests
+
+# Read-through disk cache for byte ranges of remote rasters. Blocks are keyed
+# by (URL, object version, offset), the version being the origin's
+# generation/ETag/Last-Modified. An object's size and version are trusted for
+# BLOCK_CACHE_REVALIDATE_SECONDS, so an object republished under the same URL
+# is picked up within that window and its old blocks are never mixed in.
+#
+# GDAL reads remote rasters itself (/vsicurl/), so the cache sits in front of
+# it as a small range-serving HTTP proxy on localhost. The proxy runs in its
+# own process: GDAL holds the GIL while it waits on HTTP, which would
+# deadlock a proxy thread in the same interpreter.
+BLOCK_CACHE_DIR = os.environ.get("BLOCK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "lis-block-cache"))
+BLOCK_CACHE_SIZE = int(os.environ.get("BLOCK_CACHE_SIZE_MB", "256")) * 1024 * 1024
+BLOCK_SIZE = int(os.environ.get("BLOCK_CACHE_BLOCK_KB", "64")) * 1024
+HTTP_TIMEOUT = float(os.environ.get("BLOCK_CACHE_HTTP_TIMEOUT", "30"))
+REVALIDATE_SECONDS = float(os.environ.get("BLOCK_CACHE_REVALIDATE_SECONDS", "300"))
+# Set by the process that starts the proxy so worker processes reuse it.
+PROXY_URL_ENV = "BLOCK_CACHE_PROXY_URL"
+
+_CONTENT_RANGE = re.compile(r"bytes \d+-\d+/(\d+)")
+
+class ObjectChanged(Exception):
+    """The origin object was republished while it was being read."""
+
+def _object_version(headers, size: int) -> str:
+    """Version of an origin response: GCS generation, else ETag, else Last-Modified, else its size."""
+    for name in ("x-goog-generation", "ETag", "Last-Modified"):
+        if headers.get(name):
+            return headers[name]
+    return f"size-{size}"
+
+class BlockCache:
+    """
+    Fixed-size blocks of remote objects stored as files under root, evicted
+    least-recently-used first once their total size exceeds max_bytes.
+    """
+
+    def __init__(self, root: str = BLOCK_CACHE_DIR, max_bytes: int = BLOCK_CACHE_SIZE,
+                 block_size: int = BLOCK_SIZE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_fetched = 0
+        if self.enabled:
+            os.makedirs(root, exist_ok=True)
+            self._scan()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _scan(self):
+        """Adopt blocks left by earlier processes, oldest first."""
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith(".tmp"):
+                    continue
+                found.append((st.st_mtime, name, st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
+
+    @staticmethod
+    def key(url: str, version: str, offset: int) -> str:
+        return hashlib.sha256(f"{url}:{version}:{offset}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            # Evicted by another worker process sharing the directory
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None
+
+    def put(self, key: str, data: bytes):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def record(self, hits: int = 0, misses: int = 0, saved: int = 0, fetched: int = 0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.bytes_saved += saved
+            self.bytes_fetched += fetched
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._size = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "blocks": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "block_size": self.block_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "bytes_fetched": self.bytes_fetched,
+            }
+
+_sessions = threading.local()
+
+def _session() -> requests.Session:
+    if not hasattr(_sessions, "session"):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+class RemoteBlocks:
+    """
+    Byte-range reads of remote objects served from a BlockCache; runs of
+    missing blocks are fetched from the origin with one Range request.
+    """
+
+    def __init__(self, cache: BlockCache, revalidate: float = REVALIDATE_SECONDS):
+        self.cache = cache
+        self.block_size = cache.block_size
+        self.revalidate = revalidate
+        self._lock = threading.Lock()
+        self._meta = {}  # url -> (size, version, checked at)
+
+    def meta(self, url: str):
+        """(size, version) of the object at url, asking the origin again once revalidate seconds old."""
+        with self._lock:
+            cached = self._meta.get(url)
+        if cached is not None and time.monotonic() - cached[2] < self.revalidate:
+            return cached[0], cached[1]
+        # The header block is needed anyway; its response carries the size and version
+        size, version, _ = self._fetch(url, None, 0, 1)
+        with self._lock:
+            self._meta[url] = (size, version, time.monotonic())
+        return size, version
+
+    def forget(self, url: str):
+        with self._lock:
+            self._meta.pop(url, None)
+
+    def _fetch(self, url: str, version, first: int, count: int):
+        """
+        Fetch blocks [first, first + count); returns (object size, version,
+        {index: block}). Raises ObjectChanged if the origin no longer has the
+        expected version (None accepts any).
+        """
+        start = first * self.block_size
+        end = (first + count) * self.block_size - 1
+        response = _session().get(url, headers={"Range": f"bytes={start}-{end}"}, timeout=HTTP_TIMEOUT)
+        if response.status_code in (404, 410):
+            raise FileNotFoundError(url)
+        if response.status_code == 416:
+            match = _CONTENT_RANGE.match(response.headers.get("Content-Range", "").replace("*", "0-0"))
+            size = int(match.group(1)) if match else start
+            return size, _object_version(response.headers, size), {}
+        response.raise_for_status()
+        body = response.content
+        if response.status_code == 206:
+            match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+            size = int(match.group(1)) if match else start + len(body)
+        else:
+            # Origin ignored the Range header and sent the whole object
+            size = len(body)
+            body = body[start:end + 1]
+        received = _object_version(response.headers, size)
+        if version is not None and received != version:
+            self.forget(url)
+            raise ObjectChanged(url)
+        self.cache.record(misses=count, fetched=len(body))
+        blocks = {}
+        for i in range(0, len(body), self.block_size):
+            index = first + i // self.block_size
+            blocks[index] = body[i:i + self.block_size]
+            self.cache.put(self.cache.key(url, received, index), blocks[index])
+        return size, received, blocks
+
+    def read(self, url: str, version: str, start: int, stop: int) -> bytes:
+        """Bytes [start, stop) of version of the object at url."""
+        if stop <= start:
+            return b""
+        first, last = start // self.block_size, (stop - 1) // self.block_size
+        blocks, missing = {}, []
+        for index in range(first, last + 1):
+            block = self.cache.get(self.cache.key(url, version, index))
+            if block is None:
+                missing.append(index)
+            else:
+                self.cache.record(hits=1, saved=len(block))
+                blocks[index] = block
+        run_start = 0
+        for i in range(1, len(missing) + 1):
+            if i == len(missing) or missing[i] != missing[i - 1] + 1:
+                blocks.update(self._fetch(url, version, missing[run_start], i - run_start)[2])
+                run_start = i
+        data = b"".join(blocks.get(i, b"") for i in range(first, last + 1))
+        offset = start - first * self.block_size
+        return data[offset:offset + stop - start]
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    """Serves GET/HEAD for /<quoted origin URL>, honouring single Range headers."""
+
+    protocol_version = "HTTP/1.1"
+    remote: RemoteBlocks = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        if self.path == "/__stats":
+            self._send_json(self.remote.cache.stats())
+            return
+        if self.path.startswith("/__version/"):
+            try:
+                size, version = self.remote.meta(unquote(self.path[len("/__version/"):]))
+            except FileNotFoundError:
+                self.send_error(404)
+                return
+            except requests.RequestException as e:
+                self.send_error(502, str(e))
+                return
+            self._send_json({"size": size, "version": version})
+            return
+        self._serve(head=False)
+
+    def _send_json(self, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _serve(self, head: bool):
+        path, _, query = self.path[1:].partition("?")
+        url = unquote(path)
+        try:
+            size, version = self.remote.meta(url)
+        except FileNotFoundError:
+            self.send_error(404)
+            return
+        except requests.RequestException as e:
+            self.send_error(502, str(e))
+            return
+        pinned = parse_qs(query).get("v")
+        if pinned and pinned[0] != version:
+            # The handle was opened on an older version: fail it so it is reopened
+            self.send_error(502, "object changed since it was opened")
+            return
+
+        match = _RANGE.match(self.headers.get("Range", ""))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                stop = min(int(match.group(2)) + 1 if match.group(2) else size, size)
+            else:
+                start, stop = max(0, size - int(match.group(2))), size
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+        else:
+            start, stop, status = 0, size, 200
+
+        try:
+            body = b"" if head else self.remote.read(url, version, start, stop)
+        except (FileNotFoundError, ObjectChanged, requests.RequestException) as e:
+            # A republished object fails this read; GDAL's handle is dropped and reopened
+            self.send_error(502, str(e))
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{stop - 1}/{size}")
+        self.send_header("Content-Length", str(stop - start))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+def _serve_proxy(root, max_bytes, block_size, ready):
+    handler = type("Handler", (_ProxyHandler,), {"remote": RemoteBlocks(BlockCache(root, max_bytes, block_size))})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    httpd.daemon_threads = True
+    ready.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+_proxy_lock = threading.Lock()
+_proxy_process = None
+
+def proxy_base_url() -> Optional[str]:
+    """Base URL of the caching proxy, starting it on first use; None if disabled."""
+    global _proxy_process
+    if BLOCK_CACHE_SIZE <= 0:
+        return None
+    with _proxy_lock:
+        if _proxy_process is not None and not _proxy_process.is_alive():
+            _proxy_process = None
+            os.environ.pop(PROXY_URL_ENV, None)
+        if os.environ.get(PROXY_URL_ENV):
+            return os.environ[PROXY_URL_ENV]
+        context = multiprocessing.get_context("spawn")
+        ready = context.Queue()
+        _proxy_process = context.Process(
+            target=_serve_proxy, args=(BLOCK_CACHE_DIR, BLOCK_CACHE_SIZE, BLOCK_SIZE, ready),
+            name="block-cache-proxy", daemon=True
+        )
+        _proxy_process.start()
+        os.environ[PROXY_URL_ENV] = f"http://127.0.0.1:{ready.get(timeout=30)}"
+        return os.environ[PROXY_URL_ENV]
+
+def cached_url(url: str, version: Optional[str] = None) -> str:
+    """
+    Route an http(s) URL through the block cache proxy when it is enabled,
+    pinned to version (default: the object's current version) so a handle
+    never reads a mix.
+    """
+    if not url.startswith(("http://", "https://")):
+        return url
+    base = proxy_base_url()
+    if not base:
+        return url
+    if version is None:
+        version = object_version(url)
+    pin = f"?v={quote(version, safe='')}" if version else ""
+    return f"{base}/{quote(url, safe='')}{pin}"
+
+_direct = None
+
+def object_version(url: str) -> Optional[str]:
+    """
+    Version of the remote object at url as the block cache sees it (trusted
+    for REVALIDATE_SECONDS), for caches of results derived from it; None if
+    it cannot be determined.
+    """
+    global _direct
+    if not url.startswith(("http://", "https://")):
+        return None
+    base = proxy_base_url()
+    try:
+        if base:
+            # Asked on every handle checkout: keep the connection to the proxy open
+            response = _session().get(f"{base}/__version/{quote(url, safe='')}", timeout=HTTP_TIMEOUT)
+            if response.status_code != 200:
+                return None
+            return response.json()["version"]
+        if _direct is None:
+            _direct = RemoteBlocks(BlockCache(max_bytes=0))
+        return _direct.meta(url)[1]
+    except (FileNotFoundError, requests.RequestException, ValueError, KeyError):
+        return None
+
+def block_cache_stats() -> dict:
+    base = os.environ.get(PROXY_URL_ENV)
+    if BLOCK_CACHE_SIZE <= 0 or not base:
+        return {"enabled": BLOCK_CACHE_SIZE > 0, "running": False}
+    try:
+        stats = requests.get(f"{base}/__stats", timeout=5).json()
+    except requests.RequestException as e:
+        return {"enabled": True, "running": False, "error": str(e)}
+    stats["running"] = True
+    return stats
@@ -0,0 +1,222 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import asyncio
+import math
+import os
+import time
+import numpy as np
+from rasterio.errors import RasterioIOError
+from rasterio.io import MemoryFile
+from rasterio.windows import Window
+from app.utils.dataset_cache import read_dataset
+from app.utils.executor_utils import run_io
+from app.utils.metrics_utils import record_bytes_read, span
+from app.utils.projection_utils import grid_for
+from app.utils.subset_utils import bbox_window
+from app.utils.url_utils import format_url
+
+# Row blocks are composited independently (each keeps its own accumulators
+# and reads only its rows of every day), so they run in parallel on the
+# shared io pool; this caps how many of them one request has in flight there.
+COMPOSITE_WORKERS = int(os.environ.get("COMPOSITE_WORKERS", "8"))
+# Target rows per block, rounded up to the rasters' internal block height.
+COMPOSITE_BLOCK_ROWS = int(os.environ.get("COMPOSITE_BLOCK_ROWS", "256"))
+# Histogram bins per pixel for the approximate median.
+COMPOSITE_MEDIAN_BINS = int(os.environ.get("COMPOSITE_MEDIAN_BINS", "64"))
+
+COMPOSITE_STATS = ("mean", "std", "min", "max", "count", "median")
+
+class BlockAccumulator:
+    """
+    Per-pixel running count/sum/sum of squares/min/max for one row block,
+    plus an optional fixed-bin histogram over [lo, hi] for an approximate
+    median. Memory depends on the block size only, never on the number of
+    days folded in.
+    """
+
+    def __init__(self, shape: Tuple[int, int], median_range: Optional[Tuple[float, float]] = None):
+        self.count = np.zeros(shape, dtype="int32")
+        self.sum = np.zeros(shape, dtype="float64")
+        self.sumsq = np.zeros(shape, dtype="float64")
+        self.min = np.full(shape, np.inf, dtype="float32")
+        self.max = np.full(shape, -np.inf, dtype="float32")
+        self.median_range = median_range
+        self.hist = (np.zeros(shape + (COMPOSITE_MEDIAN_BINS,), dtype="uint16")
+                     if median_range is not None else None)
+
+    def update(self, data: np.ndarray, valid: np.ndarray):
+        values = np.where(valid, data, 0.0).astype("float64")
+        self.count += valid
+        self.sum += values
+        self.sumsq += values * values
+        np.fmin(self.min, np.where(valid, data, np.inf), out=self.min)
+        np.fmax(self.max, np.where(valid, data, -np.inf), out=self.max)
+        if self.hist is not None:
+            lo, hi = self.median_range
+            bins = np.clip(((data - lo) / (hi - lo) * COMPOSITE_MEDIAN_BINS).astype("int64"),
+                           0, COMPOSITE_MEDIAN_BINS - 1)
+            rows, cols = np.nonzero(valid)
+            np.add.at(self.hist, (rows, cols, bins[rows, cols]), 1)
+
+    def result(self, stats: Sequence[str]) -> Dict[str, np.ndarray]:
+        has_data = self.count > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.sum / self.count
+            variance = np.maximum(self.sumsq / self.count - mean * mean, 0.0)
+        layers = {
+            "mean": lambda: mean,
+            "std": lambda: np.sqrt(variance),
+            "min": lambda: self.min,
+            "max": lambda: self.max,
+            "median": self._median,
+        }
+        out = {}
+        for name in stats:
+            if name == "count":
+                out[name] = self.count.astype("float32")
+            else:
+                out[name] = np.where(has_data, layers[name](), np.nan).astype("float32")
+        return out
+
+    def _median(self) -> np.ndarray:
+        # Linear interpolation inside the bin where the cumulative count crosses half
+        lo, hi = self.median_range
+        width = (hi - lo) / COMPOSITE_MEDIAN_BINS
+        cumulative = np.cumsum(self.hist, axis=-1, dtype="int32")
+        half = self.count / 2.0
+        index = np.minimum((cumulative < half[..., None]).sum(axis=-1), COMPOSITE_MEDIAN_BINS - 1)
+        below = np.where(index > 0, np.take_along_axis(cumulative, np.maximum(index - 1, 0)[..., None], -1)[..., 0], 0)
+        in_bin = np.take_along_axis(self.hist, index[..., None], -1)[..., 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraction = np.where(in_bin > 0, (half - below) / in_bin, 0.5)
+        return lo + (index + np.clip(fraction, 0.0, 1.0)) * width
+
+def _composite_block(urls: List[str], window: Window, stats: Sequence[str],
+                     median_range: Optional[Tuple[float, float]]) -> Dict[str, np.ndarray]:
+    """Fold every day's rows for window into one accumulator."""
+    acc = BlockAccumulator((int(window.height), int(window.width)), median_range)
+    for url in urls:
+        try:
+            data, nodata = read_dataset(url, lambda src: (_read_rows(src, window), src.nodata))
+        except RasterioIOError as e:
+            print(f"Skipping {url} in composite: {str(e)}")
+            continue
+        record_bytes_read(data.nbytes)
+        valid = np.isfinite(data) & (data != -9999)
+        if nodata is not None:
+            valid &= data != nodata
+        acc.update(data, valid)
+    return acc.result(stats)
+
+def _read_rows(src, window: Window) -> np.ndarray:
+    with span("read"):
+        return src.read(1, window=window)
+
+def _scene_grid(url: str):
+    try:
+        return read_dataset(url, lambda src: (grid_for(src).key, src.block_shapes[0][0], src.crs))
+    except RasterioIOError:
+        return None
+
+def _composite_window(src, bbox):
+    """(window, its transform) for bbox on src, or None if the bbox misses the grid."""
+    window = bbox_window(src, bbox) if bbox is not None else Window(0, 0, src.width, src.height)
+    if window is None:
+        return None
+    return window, src.window_transform(window)
+
+async def composite(variable: str, dates: List[str], stats: Sequence[str] = ("mean", "count"),
+                    bbox: Optional[Tuple[float, float, float, float]] = None,
+                    median_range: Optional[Tuple[float, float]] = None,
+                    timeout: Optional[float] = None) -> Optional[dict]:
+    """
+    Per-pixel composite of the variable's daily rasters over dates, optionally
+    limited to a WGS84 bbox. Rows are processed in blocks in parallel on the
+    io pool (at most COMPOSITE_WORKERS at a time), each streaming every day's
+    rows through its own accumulators. Days missing or on a different grid
+    than the first available day are skipped. Returns {"layers": {stat:
+    float32 array}, "transform", "crs", "dates"}, or None if no day is
+    available or the bbox misses the grid. Raises ExecutorBusy if the io
+    pool's queue is full and ExecutorTimeout if timeout seconds pass first.
+    """
+    if "median" in stats and median_range is None:
+        raise ValueError("median needs a value range for its histogram")
+    if "median" not in stats:
+        median_range = None
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    slots = asyncio.Semaphore(COMPOSITE_WORKERS)
+
+    async def io(fn, *args):
+        async with slots:
+            remaining = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            return await run_io(fn, *args, timeout=remaining)
+
+    urls = [format_url(date, variable) for date in dates]
+    grids = await _gather([io(_scene_grid, url) for url in urls])
+    available = [(date, url, grid) for date, url, grid in zip(dates, urls, grids) if grid is not None]
+    if not available:
+        return None
+    key, block_height, crs = available[0][2]
+    used = [(date, url) for date, url, grid in available if grid[0] == key]
+
+    framed = await io(read_dataset, used[0][1], lambda src: _composite_window(src, bbox))
+    if framed is None:
+        return None
+    window, transform = framed
+
+    # Row blocks aligned to the internal tiling, so each tile row is fetched by one block
+    rows_per_block = max(1, math.ceil(COMPOSITE_BLOCK_ROWS / block_height)) * block_height
+    row_off, col_off = int(window.row_off), int(window.col_off)
+    height, width = int(window.height), int(window.width)
+    starts = [row_off]
+    next_edge = (row_off // rows_per_block + 1) * rows_per_block
+    while next_edge < row_off + height:
+        starts.append(next_edge)
+        next_edge += rows_per_block
+    blocks = [Window(col_off, start, width, min(row_off + height, start + rows_per_block) - start)
+              for start in starts]
+
+    day_urls = [url for _, url in used]
+    results = await _gather([io(_composite_block, day_urls, block, stats, median_range) for block in blocks])
+    layers = {name: np.empty((height, width), dtype="float32") for name in stats}
+    for block, result in zip(blocks, results):
+        top = int(block.row_off) - row_off
+        for name in stats:
+            layers[name][top:top + int(block.height)] = result[name]
+    return {"layers": layers, "transform": transform, "crs": crs, "dates": [date for date, _ in used]}
+
+async def _gather(coros) -> list:
+    """asyncio.gather that cancels the remaining jobs as soon as one fails."""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+def encode_composite_geotiff(result: dict) -> bytes:
+    """Deflate float32 GeoTIFF with one band per stat (named in band descriptions), nodata NaN."""
+    names = list(result["layers"])
+    height, width = result["layers"][names[0]].shape
+    with MemoryFile() as memfile:
+        with memfile.open(driver="GTiff", width=width, height=height, count=len(names), dtype="float32",
+                          crs=result["crs"], transform=result["transform"], nodata=float("nan"),
+                          compress="deflate", predictor=3, tiled=True, blockxsize=256, blockysize=256) as dst:
+            for band, name in enumerate(names, start=1):
+                dst.write(result["layers"][name], band)
+                dst.set_band_description(band, name)
+            dst.update_tags(dates=",".join(result["dates"]))
+        return memfile.read()
+
+def composite_window_stats(result: dict) -> dict:
+    """Summary of each composite layer over the window: mean/min/max of its valid pixels."""
+    summary = {}
+    for name, layer in result["layers"].items():
+        valid = layer[np.isfinite(layer)]
+        summary[name] = {
+            "mean": float(valid.mean()) if valid.size else None,
+            "min": float(valid.min()) if valid.size else None,
+            "max": float(valid.max()) if valid.size else None,
+            "pixels": int(valid.size),
+        }
+    return summary
@@ -0,0 +1,195 @@
+from typing import Dict, List, Optional, Set, Tuple
+import datetime
+import json
+import os
+import threading
+import numpy as np
+from affine import Affine
+from rasterio.crs import CRS
+from app.utils.metrics_utils import record_bytes_read, span
+from app.utils.projection_utils import Grid
+
+# Root of the precomputed per-pixel history cubes built by app.ingest_cube;
+# unset disables cube reads.
+CUBE_DIR = os.environ.get("CUBE_DIR")
+
+# Side of the square pixel tiles the cube is chunked into; fixed per cube at creation.
+CUBE_TILE = int(os.environ.get("CUBE_TILE", "16"))
+
+# Layout, per variable under CUBE_DIR/{variable}/:
+#   grid.json   CRS, affine transform, (height, width) and tile size shared by all days
+#   index.json  {"dates": [...with data], "missing": [...checked, no file]}; only
+#               "dates" are served from the cube, missing days are read remotely
+#               in case they were published late
+#   {year}.npy  float32 (tile rows, tile cols, days_in_year, tile, tile), NaN where no data
+# Each tile x tile block of pixels is one chunk holding its whole year,
+# day-major inside: appending a day writes one contiguous slab per chunk, and
+# a pixel's history for a year is read from its chunk alone. Year files are
+# created sparse; days not listed in index.json are never read.
+
+def _days_in_year(year: int) -> int:
+    return (datetime.date(year + 1, 1, 1) - datetime.date(year, 1, 1)).days
+
+def _write_json(path: str, payload: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+class PixelCube:
+    """Per-variable time-major cube of daily rasters, memory-mapped for reads."""
+
+    def __init__(self, root: str, variable: str):
+        self.path = os.path.join(root, variable)
+        self.variable = variable
+        self.grid = None
+        self._projection: Optional[Grid] = None  # self.grid with its inverse transform precomputed
+        self.dates: Set[str] = set()
+        self.missing: Set[str] = set()
+        self._index_mtime = None
+        self._years: Dict[int, np.memmap] = {}
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, "grid.json"))
+
+    def refresh(self):
+        """Reload grid and index if the ingester has written since the last read."""
+        index_path = os.path.join(self.path, "index.json")
+        try:
+            mtime = os.path.getmtime(index_path)
+        except OSError:
+            return
+        with self._lock:
+            if mtime == self._index_mtime:
+                return
+            grid_path = os.path.join(self.path, "grid.json")
+            if os.path.exists(grid_path):
+                with open(grid_path) as f:
+                    self.grid = json.load(f)
+                self._projection = None
+            with open(index_path) as f:
+                index = json.load(f)
+            self.dates = set(index["dates"])
+            self.missing = set(index["missing"])
+            self._index_mtime = mtime
+
+    def covers(self, date: str) -> bool:
+        return date in self.dates
+
+    def pixel(self, lat: float, lon: float) -> Optional[Tuple[int, int]]:
+        if self._projection is None:
+            self._projection = Grid(CRS.from_string(self.grid["crs"]), Affine(*self.grid["transform"]),
+                                    self.grid["shape"])
+        with span("transform"):
+            rows, cols = self._projection.lonlat_to_pixel([lon], [lat])
+        row, col = int(np.floor(rows[0])), int(np.floor(cols[0]))
+        height, width = self.grid["shape"]
+        if 0 <= row < height and 0 <= col < width:
+            return row, col
+        return None
+
+    def _year(self, year: int) -> Optional[np.memmap]:
+        with self._lock:
+            if year not in self._years:
+                path = os.path.join(self.path, f"{year}.npy")
+                if not os.path.exists(path):
+                    return None
+                self._years[year] = np.load(path, mmap_mode="r")
+            return self._years[year]
+
+    def history(self, lat: float, lon: float, dates: List[str]) -> Dict[str, Optional[float]]:
+        """
+        Values at (lat, lon) for the dates the cube holds, keyed by date;
+        None where the pixel has no data. Each year touched is one read
+        from the pixel's chunk of its year file.
+        """
+        self.refresh()
+        covered = [d for d in dates if self.covers(d)]
+        if not covered:
+            return {}
+        pixel = self.pixel(lat, lon)
+        if pixel is None:
+            return {d: None for d in covered}
+        row, col = pixel
+        tile = self.grid["tile"]
+        tile_row, tile_col, row, col = row // tile, col // tile, row % tile, col % tile
+
+        by_year: Dict[int, List[Tuple[str, int]]] = {}
+        for d in covered:
+            day = datetime.date.fromisoformat(d)
+            by_year.setdefault(day.year, []).append((d, day.timetuple().tm_yday - 1))
+
+        result = {}
+        for year, days in by_year.items():
+            cube = self._year(year)
+            if cube is None:
+                result.update({d: None for d, _ in days})
+                continue
+            first, last = min(i for _, i in days), max(i for _, i in days)
+            with span("cube_read"):
+                series = np.asarray(cube[tile_row, tile_col, first:last + 1, row, col])
+            record_bytes_read(series.nbytes)
+            for d, i in days:
+                value = float(series[i - first])
+                result[d] = None if np.isnan(value) else value
+        return result
+
+    # Ingestion side
+
+    def init_grid(self, crs, affine, shape):
+        os.makedirs(self.path, exist_ok=True)
+        grid = {"crs": crs.to_string(), "transform": list(affine)[:6], "shape": list(shape)}
+        if self.exists():
+            self.refresh()
+            if {k: self.grid[k] for k in grid} != grid:
+                raise ValueError(f"Raster grid {grid} does not match cube grid {self.grid}")
+            return
+        grid["tile"] = CUBE_TILE
+        _write_json(os.path.join(self.path, "grid.json"), grid)
+        self.grid = grid
+        self._projection = None
+
+    def write_day(self, date: str, data: Optional[np.ndarray]):
+        """Store one day (None marks it checked but unavailable) and publish it in the index."""
+        if data is not None:
+            day = datetime.date.fromisoformat(date)
+            path = os.path.join(self.path, f"{day.year}.npy")
+            height, width = self.grid["shape"]
+            tile = self.grid["tile"]
+            tile_rows, tile_cols = -(-height // tile), -(-width // tile)
+            if os.path.exists(path):
+                cube = np.lib.format.open_memmap(path, mode="r+")
+            else:
+                cube = np.lib.format.open_memmap(
+                    path, mode="w+", dtype="float32",
+                    shape=(tile_rows, tile_cols, _days_in_year(day.year), tile, tile)
+                )
+            padded = np.full((tile_rows * tile, tile_cols * tile), np.nan, dtype="float32")
+            padded[:height, :width] = data
+            cube[:, :, day.timetuple().tm_yday - 1] = (
+                padded.reshape(tile_rows, tile, tile_cols, tile).transpose(0, 2, 1, 3)
+            )
+            cube.flush()
+            del cube
+            self.dates.add(date)
+            self.missing.discard(date)
+        else:
+            self.missing.add(date)
+        # Index last, so readers never see a date whose data isn't on disk yet
+        os.makedirs(self.path, exist_ok=True)
+        _write_json(os.path.join(self.path, "index.json"),
+                    {"dates": sorted(self.dates), "missing": sorted(self.missing)})
+        with self._lock:
+            self._years.pop(datetime.date.fromisoformat(date).year, None)
+
+_cubes: Dict[str, PixelCube] = {}
+
+def get_cube(variable: str) -> Optional[PixelCube]:
+    """The cube for variable if CUBE_DIR is configured and it has been built."""
+    if not CUBE_DIR:
+        return None
+    cube = _cubes.get(variable)
+    if cube is None:
+        cube = _cubes.setdefault(variable, PixelCube(CUBE_DIR, variable))
+    return cube if cube.exists() else None
@@ -0,0 +1,194 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, TypeVar
+from rasterio.errors import RasterioError
+import os
+import threading
+import time
+import rasterio
+from app.utils.block_cache import cached_url, object_version
+from app.utils.metrics_utils import span
+from app.utils.url_utils import format_google_url
+
+T = TypeVar("T")
+
+# Idle handles kept open across requests, and how long a handle may live
+# before it is reopened (drops stale sockets). Republished objects don't
+# wait for this: a handle is only reused while the object's version is
+# still the one it was opened on.
+DATASET_CACHE_SIZE = int(os.environ.get("DATASET_CACHE_SIZE", "64"))
+DATASET_CACHE_TTL = float(os.environ.get("DATASET_CACHE_TTL", "900"))
+
+# Skip GDAL's sidecar/directory probing (.aux.xml, .ovr, listings) on open;
+# published LIS rasters are self-contained GeoTIFFs.
+GDAL_OPEN_OPTIONS = {"GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR"}
+
+class DatasetCache:
+    """
+    Process-wide pool of open rasterio datasets keyed by normalized URL.
+
+    A rasterio dataset must not be read from two threads at once, so handles
+    are checked out exclusively: a caller gets an idle handle for its URL if
+    one exists, otherwise a freshly opened one, and returns it on exit. A
+    handle remembers the object version (block_cache.object_version) it was
+    opened on and is closed instead of reused once that is no longer current,
+    since it would keep serving the old object's blocks from GDAL's memory.
+    Idle handles are evicted least-recently-used first once there are more
+    than max_size of them, and closed once older than ttl seconds.
+    """
+
+    def __init__(self, max_size: int = DATASET_CACHE_SIZE, ttl: float = DATASET_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._idle = OrderedDict()  # key -> [(dataset, opened_at, version), ...]
+        self._idle_count = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.retries = 0
+
+    @contextmanager
+    def checkout(self, url: str):
+        key = format_google_url(url)
+        dataset, handle, _ = self._acquire(key)
+        try:
+            yield dataset
+        except RasterioError:
+            # The handle may be in a bad state (dropped connection etc.).
+            dataset.close()
+            raise
+        except BaseException:
+            self._release(key, dataset, handle)
+            raise
+        else:
+            self._release(key, dataset, handle)
+
+    def read(self, url: str, fn: Callable[[Any], T]) -> T:
+        """
+        fn(dataset) on a checked-out handle for url. If a reused handle fails
+        with a RasterioError (e.g. the object was republished after the
+        version check, so the block cache refuses the version the handle was
+        opened on), every idle handle for url is dropped and fn is retried
+        once on a freshly opened one.
+        """
+        key = format_google_url(url)
+        dataset, handle, reused = self._acquire(key)
+        try:
+            return self._run(key, dataset, handle, fn)
+        except RasterioError as e:
+            if not reused:
+                raise
+            print(f"Reopening {key} after a failed read on a cached handle: {str(e)}")
+        with self._lock:
+            self.retries += 1
+        self.discard(key)
+        dataset, handle, _ = self._acquire(key, reuse=False)
+        return self._run(key, dataset, handle, fn)
+
+    def _run(self, key, dataset, handle, fn):
+        try:
+            result = fn(dataset)
+        except RasterioError:
+            dataset.close()
+            raise
+        except BaseException:
+            self._release(key, dataset, handle)
+            raise
+        self._release(key, dataset, handle)
+        return result
+
+    def _acquire(self, key, reuse: bool = True):
+        """
+        (dataset, (opened_at, version), reused): an idle handle for key opened
+        on the object's current version if there is one, else a new one.
+        """
+        version = object_version(key)
+        now = time.monotonic()
+        stale = []
+        dataset = None
+        with self._lock:
+            handles = self._idle.get(key) if reuse else None
+            while handles:
+                dataset, opened_at, opened_version = handles.pop()
+                self._idle_count -= 1
+                if now - opened_at < self.ttl and opened_version == version:
+                    self.hits += 1
+                    if not handles:
+                        del self._idle[key]
+                    break
+                stale.append(dataset)
+                dataset = None
+            else:
+                if reuse:
+                    self._idle.pop(key, None)
+                self.misses += 1
+        for old in stale:
+            old.close()
+        if dataset is not None:
+            return dataset, (opened_at, version), True
+        with span("open"), rasterio.Env(**GDAL_OPEN_OPTIONS):
+            # Remote bytes go through the shared on-disk block cache, pinned to version
+            dataset = rasterio.open(cached_url(key, version))
+        return dataset, (time.monotonic(), version), False
+
+    def discard(self, url: str):
+        """Close the idle handles for url."""
+        with self._lock:
+            handles = self._idle.pop(format_google_url(url), [])
+            self._idle_count -= len(handles)
+        for dataset, _, _ in handles:
+            dataset.close()
+
+    def _release(self, key, dataset, handle):
+        opened_at, version = handle
+        if self.max_size <= 0 or time.monotonic() - opened_at >= self.ttl:
+            dataset.close()
+            return
+        evicted = []
+        with self._lock:
+            self._idle.setdefault(key, []).append((dataset, opened_at, version))
+            self._idle.move_to_end(key)
+            self._idle_count += 1
+            while self._idle_count > self.max_size:
+                lru_key, handles = next(iter(self._idle.items()))
+                evicted.append(handles.pop(0)[0])
+                self._idle_count -= 1
+                self.evictions += 1
+                if not handles:
+                    del self._idle[lru_key]
+        for old in evicted:
+            old.close()
+
+    def clear(self):
+        with self._lock:
+            handles = [ds for entries in self._idle.values() for ds, _, _ in entries]
+            self._idle.clear()
+            self._idle_count = 0
+        for dataset in handles:
+            dataset.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "open_handles": self._idle_count,
+                "urls": len(self._idle),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "retries": self.retries,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+DATASET_CACHE = DatasetCache()
+
+def open_dataset(url: str):
+    """Check out a cached read handle for url; use as a context manager."""
+    return DATASET_CACHE.checkout(url)
+
+def read_dataset(url: str, fn: Callable[[Any], T]) -> T:
+    """fn(dataset) on a cached read handle for url, retried once on a fresh handle if a reused one fails."""
+    return DATASET_CACHE.read(url, fn)
@@ -0,0 +1,124 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import threading
+from app.utils.block_cache import proxy_base_url
+from app.utils.metrics_utils import merge_spans, record_spans
+
+# Raster work runs in two dedicated pools instead of the event loop or
+# Starlette's small default threadpool:
+#   io  - threads for network-bound reads (point, transect, batch, timeseries)
+#   cpu - processes for masking/reduction-heavy work (polygon stats)
+# Each pool admits at most *_QUEUE_SIZE running + queued jobs; beyond that
+# submissions are rejected so the API can answer 429 instead of piling up.
+IO_WORKERS = int(os.environ.get("RASTER_IO_WORKERS", "32"))
+IO_QUEUE_SIZE = int(os.environ.get("RASTER_IO_QUEUE_SIZE", "256"))
+CPU_WORKERS = int(os.environ.get("RASTER_CPU_WORKERS", str(os.cpu_count() or 2)))
+CPU_QUEUE_SIZE = int(os.environ.get("RASTER_CPU_QUEUE_SIZE", "64"))
+REQUEST_TIMEOUT = float(os.environ.get("RASTER_REQUEST_TIMEOUT", "60"))
+
+class ExecutorError(Exception):
+    """Base for work the raster executors could not run."""
+
+class ExecutorBusy(ExecutorError):
+    """The pool's queue is full; the client should retry later (429)."""
+
+class ExecutorTimeout(ExecutorError):
+    """The job did not finish within its per-request timeout (504)."""
+
+class BoundedExecutor:
+    """An executor with a cap on running + queued jobs."""
+
+    def __init__(self, name: str, factory, max_pending: int, copy_context: bool):
+        self.name = name
+        self.max_pending = max_pending
+        self._factory = factory
+        self._executor = None
+        self._copy_context = copy_context
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+
+    def _get(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._factory()
+            return self._executor
+
+    def submit(self, fn, *args, block: bool = False, timeout: Optional[float] = None, **kwargs) -> Future:
+        """
+        Submit fn(*args, **kwargs). Raises ExecutorBusy if the queue is full;
+        with block=True, waits up to timeout for a slot instead (for fan-out
+        from inside an already-admitted job).
+        """
+        if not self._slots.acquire(blocking=block, timeout=timeout if block else None):
+            raise ExecutorBusy(f"{self.name} executor queue is full")
+        with self._lock:
+            self._pending += 1
+        try:
+            if self._copy_context:
+                # Threads run the job in the submitter's context (request-scoped contextvars)
+                future = self._get().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+            else:
+                future = self._get().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": self._pending, "max_pending": self.max_pending}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def _cpu_pool():
+    # Start the block cache proxy first so workers inherit its URL instead
+    # of each starting their own. spawn, not fork: the parent holds GDAL and
+    # thread-pool state that is not safe to inherit across fork().
+    proxy_base_url()
+    return ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+IO_EXECUTOR = BoundedExecutor(
+    "io", lambda: ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="raster-io"),
+    IO_QUEUE_SIZE, copy_context=True
+)
+CPU_EXECUTOR = BoundedExecutor("cpu", _cpu_pool, CPU_QUEUE_SIZE, copy_context=False)
+
+async def _run(executor: BoundedExecutor, fn, args, kwargs, timeout: Optional[float]):
+    future = executor.submit(fn, *args, **kwargs)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), REQUEST_TIMEOUT if timeout is None else timeout)
+    except asyncio.TimeoutError:
+        future.cancel()
+        raise ExecutorTimeout(f"{executor.name} job timed out")
+
+async def run_io(fn, *args, timeout: Optional[float] = None, **kwargs):
+    """Run a blocking network-bound call on the io pool and await it."""
+    return await _run(IO_EXECUTOR, fn, args, kwargs, timeout)
+
+async def run_cpu(fn, *args, timeout: Optional[float] = None, **kwargs):
+    """Run a picklable CPU-heavy call on the cpu process pool and await it."""
+    result, spans, bytes_read = await _run(CPU_EXECUTOR, record_spans, (fn, *args), kwargs, timeout)
+    merge_spans(spans, bytes_read)
+    return result
+
+def executor_stats() -> dict:
+    return {"io": IO_EXECUTOR.stats(), "cpu": CPU_EXECUTOR.stats()}
+
+def shutdown_executors():
+    IO_EXECUTOR.shutdown()
+    CPU_EXECUTOR.shutdown()
@@ -0,0 +1,104 @@
+from io import BytesIO
+from typing import Optional, Tuple
+import json
+import logging
+import os
+import tempfile
+import pandas as pd
+import requests
+from app.utils.insitu_utils import INSITU_VARIABLES
+
+try:
+    import pyarrow  # noqa: F401  (Parquet engine for the local cache)
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+INSITU_PICKLE_URL = os.environ.get(
+    "INSITU_PICKLE_URL", "https://storage.googleapis.com/insitu_data/LIS_insitu_data.pkl"
+)
+# Cleaned frame cached as Parquet so restarts skip the download when the
+# object's ETag/Last-Modified is unchanged.
+INSITU_CACHE_DIR = os.environ.get("INSITU_CACHE_DIR", os.path.join(tempfile.gettempdir(), "lis-insitu"))
+# How often to check the bucket for a republished pickle; 0 disables refresh.
+INSITU_REFRESH_SECONDS = float(os.environ.get("INSITU_REFRESH_SECONDS", "3600"))
+HTTP_TIMEOUT = float(os.environ.get("INSITU_HTTP_TIMEOUT", "120"))
+
+def clean_insitu_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Parse dates and flatten list-valued measurements to floats, column-wise."""
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'])
+    for var in INSITU_VARIABLES:
+        if var not in df.columns or pd.api.types.is_numeric_dtype(df[var]):
+            continue
+        # Some samples are stored as [value] lists: explode flattens them in
+        # one pass (empty lists become NaN), then keep each row's first item
+        exploded = df[var].reset_index(drop=True).explode()
+        first = exploded[~exploded.index.duplicated(keep='first')]
+        df[var] = pd.to_numeric(first, errors='coerce').to_numpy(dtype='float64')
+    return df
+
+def remote_validator(url: str) -> Optional[str]:
+    """ETag (or Last-Modified) of the published pickle, None if unavailable."""
+    try:
+        response = requests.head(url, timeout=30, allow_redirects=True)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.warning(f"Could not check {url}: {str(e)}")
+        return None
+    return response.headers.get("ETag") or response.headers.get("Last-Modified")
+
+def _cache_paths(cache_dir: str):
+    return os.path.join(cache_dir, "insitu.parquet"), os.path.join(cache_dir, "insitu.json")
+
+def _read_cache(cache_dir: str) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    data_path, meta_path = _cache_paths(cache_dir)
+    if pyarrow is None or not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None, None
+    try:
+        with open(meta_path) as f:
+            validator = json.load(f).get("validator")
+        return pd.read_parquet(data_path), validator
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable in situ cache: {str(e)}")
+        return None, None
+
+def _write_cache(cache_dir: str, df: pd.DataFrame, validator: Optional[str]):
+    if pyarrow is None or validator is None:
+        return
+    data_path, meta_path = _cache_paths(cache_dir)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_parquet(f"{data_path}.tmp", index=False)
+        os.replace(f"{data_path}.tmp", data_path)
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump({"validator": validator}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+    except Exception as e:
+        logger.warning(f"Could not write in situ cache: {str(e)}")
+
+def load_insitu_frame(url: str = INSITU_PICKLE_URL, cache_dir: str = INSITU_CACHE_DIR,
+                      current: Optional[str] = None) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Return (cleaned frame, validator). Uses the local Parquet cache when its
+    validator still matches the bucket (or the bucket can't be reached), and
+    returns (None, current) when the published object is unchanged from the
+    caller's current validator.
+    """
+    validator = remote_validator(url)
+    if current is not None and validator in (None, current):
+        return None, current
+
+    cached, cached_validator = _read_cache(cache_dir)
+    if cached is not None and (validator is None or validator == cached_validator):
+        logger.info(f"Loaded in situ data from local cache ({cached_validator})")
+        return cached, cached_validator
+
+    logger.info(f"Loading in situ data from: {url}")
+    response = requests.get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    validator = validator or response.headers.get("ETag") or response.headers.get("Last-Modified")
+    df = clean_insitu_frame(pd.read_pickle(BytesIO(response.content)))
+    _write_cache(cache_dir, df, validator)
+    return df, validator
@@ -0,0 +1,130 @@
+from typing import Dict, List, Optional
+import datetime
+import numpy as np
+import pandas as pd
+from app.utils.spatial_index import StationIndex
+
+INSITU_VARIABLES = ['chl', 'spm', 'cdom']
+
+class VariableIndex:
+    """
+    Rows of one variable sorted by date, stored as contiguous arrays.
+
+    Rows for dates[i] are lat/lon/value[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, dates, offsets, lat, lon, value, timestamps):
+        self.dates = dates              # datetime64[D], sorted, unique
+        self.offsets = offsets          # int64, len(dates) + 1
+        self.lat = lat                  # float32
+        self.lon = lon                  # float32
+        self.value = value              # float32
+        self.timestamps = timestamps    # ISO strings, one per row
+        self.date_strings = [str(d) for d in dates]
+
+    def __len__(self):
+        return len(self.value)
+
+    def row_range(self, date: datetime.date):
+        """Return (start, stop) row offsets for date; empty if absent."""
+        day = np.datetime64(date, 'D')
+        i = np.searchsorted(self.dates, day)
+        if i < len(self.dates) and self.dates[i] == day:
+            return int(self.offsets[i]), int(self.offsets[i + 1])
+        return 0, 0
+
+class InsituIndex:
+    """
+    Columnar, date-indexed view of the cleaned in situ DataFrame, built once
+    at load time so lookups are binary searches instead of frame scans.
+    Rows with a missing date, position or value (NaN or -9999) are dropped.
+    Each variable also gets a StationIndex for spatial queries.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        if 'date' not in df.columns:
+            raise ValueError("Date column missing in dataset")
+        if not pd.api.types.is_datetime64_any_dtype(df['date']):
+            raise ValueError(f"Date column is not in datetime format: {df['date'].dtype}")
+
+        self.variables: Dict[str, VariableIndex] = {}
+        self.spatial: Dict[str, StationIndex] = {}
+        dates = df['date'].to_numpy(dtype='datetime64[s]')
+        lat = pd.to_numeric(df['lat'], errors='coerce').to_numpy(dtype='float64')
+        lon = pd.to_numeric(df['lon'], errors='coerce').to_numpy(dtype='float64')
+        base_mask = ~np.isnat(dates) & np.isfinite(lat) & np.isfinite(lon)
+
+        for variable in INSITU_VARIABLES:
+            if variable not in df.columns:
+                continue
+            value = pd.to_numeric(df[variable], errors='coerce').to_numpy(dtype='float64')
+            mask = base_mask & np.isfinite(value) & (value != -9999)
+            rows = np.flatnonzero(mask)
+            rows = rows[np.argsort(dates[rows], kind='stable')]
+
+            row_dates = dates[rows]
+            days, starts = np.unique(row_dates.astype('datetime64[D]'), return_index=True)
+            self.variables[variable] = VariableIndex(
+                dates=days,
+                offsets=np.append(starts, len(rows)).astype('int64'),
+                lat=lat[rows].astype('float32'),
+                lon=lon[rows].astype('float32'),
+                value=value[rows].astype('float32'),
+                timestamps=np.datetime_as_string(row_dates, unit='s'),
+            )
+            self.spatial[variable] = StationIndex(self.variables[variable])
+
+    def get(self, variable: str) -> Optional[VariableIndex]:
+        return self.variables.get(variable)
+
+    def available_dates(self, variable: str) -> List[str]:
+        index = self.variables.get(variable)
+        return index.date_strings if index is not None else []
+
+    def records(self, variable: str, date: datetime.date) -> List[Dict]:
+        """Serialize the rows for (variable, date) as the /get_insitu_data records."""
+        index = self.variables.get(variable)
+        if index is None:
+            return []
+        start, stop = index.row_range(date)
+        if start == stop:
+            return []
+        return self.records_at(variable, slice(start, stop))
+
+    def records_at(self, variable: str, rows) -> List[Dict]:
+        """/get_insitu_data records for rows (a slice or index array) of the variable."""
+        index = self.variables[variable]
+        return [
+            {"lat": la, "lon": lo, "value": v, "date": ts, "variable": variable}
+            for la, lo, v, ts in zip(
+                _json_floats(index.lat[rows]),
+                _json_floats(index.lon[rows]),
+                _json_floats(index.value[rows]),
+                index.timestamps[rows].tolist(),
+            )
+        ]
+
+    def columns(self, variable: str, date: datetime.date) -> Optional[Dict[str, np.ndarray]]:
+        """The rows for (variable, date) as parallel arrays (views into the index), or None if there are none."""
+        index = self.variables.get(variable)
+        if index is None:
+            return None
+        start, stop = index.row_range(date)
+        if start == stop:
+            return None
+        return self.columns_at(variable, slice(start, stop))
+
+    def columns_at(self, variable: str, rows) -> Dict[str, np.ndarray]:
+        """Parallel lat/lon/value/date arrays for rows (a slice or index array) of the variable."""
+        index = self.variables[variable]
+        return {
+            "lat": index.lat[rows],
+            "lon": index.lon[rows],
+            "value": index.value[rows],
+            "date": index.timestamps[rows],
+        }
+
+def _json_floats(values: np.ndarray) -> List[float]:
+    # Widening float32 exposes binary noise (2.6 -> 2.5999999046...); round it
+    # back off at the precision float32 actually carries.
+    return np.round(values.astype('float64'), 6).tolist()
@@ -0,0 +1,29 @@
+from typing import Any
+import json
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "f":
+            return [None if np.isnan(v) else v for v in obj.tolist()]
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    """
+    Compact JSON bytes, serializing NumPy arrays and scalars natively (float32
+    at float32 precision, NaN as null). Uses orjson when installed.
+    """
+    if orjson is not None:
+        # Arrays orjson can't take natively (non-contiguous, string dtypes) fall through to _default
+        return orjson.dumps(content, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from rasterio.windows import Window
+
+# Upper bound on packed mask bytes kept per process; 0 disables the cache.
+MASK_CACHE_MB = float(os.environ.get("MASK_CACHE_MB", "64"))
+
+def geometry_hash(geometry: dict) -> str:
+    """Hash of a GeoJSON geometry that ignores key order and whitespace."""
+    canonical = json.dumps(geometry, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def pack_mask(window: Window, mask: np.ndarray) -> tuple:
+    """(window offsets, mask bit-packed one bit per pixel): compact to cache or send to a worker."""
+    window_key = (int(window.col_off), int(window.row_off), int(window.width), int(window.height))
+    return window_key, np.packbits(mask)
+
+def unpack_mask(packed: tuple) -> Tuple[Window, np.ndarray]:
+    """Inverse of pack_mask: (window, boolean mask of the window's shape)."""
+    (col_off, row_off, width, height), bits = packed
+    mask = np.unpackbits(bits, count=height * width).reshape(height, width).view(bool)
+    return Window(col_off, row_off, width, height), mask
+
+class MaskCache:
+    """
+    LRU cache of rasterized polygon masks keyed by (grid key, geometry hash),
+    so a saved region is rasterized once per grid and then reused for every
+    variable and date on that grid. Entries are stored as the window offsets
+    plus the mask bit-packed (one bit per pixel). Each process has its own;
+    the API process builds the masks and ships them packed to the cpu workers.
+    """
+
+    def __init__(self, max_bytes: int = int(MASK_CACHE_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> pack_mask result
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, grid_key: tuple, geometry: dict) -> Optional[Tuple[Window, np.ndarray]]:
+        key = (grid_key, geometry_hash(geometry))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return unpack_mask(entry)
+
+    def put(self, grid_key: tuple, geometry: dict, window: Window, mask: np.ndarray):
+        window_key, packed = pack_mask(window, mask)
+        if packed.nbytes > self.max_bytes:
+            return
+        key = (grid_key, geometry_hash(geometry))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1].nbytes
+            self._entries[key] = (window_key, packed)
+            self._bytes += packed.nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def get_or_build(self, grid_key: tuple, geometry: dict,
+                     build: Callable[[], Tuple[Window, np.ndarray]]) -> Tuple[Window, np.ndarray]:
+        cached = self.get(grid_key, geometry)
+        if cached is not None:
+            return cached
+        window, mask = build()
+        self.put(grid_key, geometry, window, mask)
+        return window, mask
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+MASK_CACHE = MaskCache()
@@ -0,0 +1,245 @@
+from typing import Dict, Optional
+import asyncio
+import datetime
+import math
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from rasterio.errors import RasterioIOError
+from rasterio.windows import Window
+from app.utils.dataset_cache import read_dataset
+from app.utils.executor_utils import CPU_EXECUTOR, CPU_WORKERS, ExecutorBusy, run_io
+from app.utils.insitu_utils import InsituIndex
+from app.utils.metrics_utils import merge_spans, record_bytes_read, record_spans, span
+from app.utils.projection_utils import grid_for
+from app.utils.url_utils import format_url
+
+# Defaults for the usual ocean colour match-up protocol (Bailey & Werdell 2006):
+# NxN box around the station, at least half its pixels valid, outliers beyond
+# 1.5 standard deviations of the box dropped, filtered CV at most 0.15.
+MATCHUP_WINDOW = int(os.environ.get("MATCHUP_WINDOW", "3"))
+MATCHUP_MIN_VALID = float(os.environ.get("MATCHUP_MIN_VALID", "0.5"))
+MATCHUP_MAX_CV = float(os.environ.get("MATCHUP_MAX_CV", "0.15"))
+MATCHUP_OUTLIER_STD = 1.5
+# Days of one match-up run in flight on the cpu process pool at once.
+MATCHUP_WORKERS = int(os.environ.get("MATCHUP_WORKERS", str(CPU_WORKERS)))
+
+MATCHUP_COLUMNS = ("insitu_date", "raster_date", "day_offset", "lat", "lon", "insitu", "satellite",
+                   "filtered_mean", "std", "cv", "valid_pixels")
+
+def extract_windows(src, lons, lats, size: int) -> np.ndarray:
+    """
+    (n, size, size) float64 pixel boxes centred on each station, NaN for
+    no-data or outside the raster, from one read of the window covering all
+    stations.
+    """
+    half = size // 2
+    n = len(lons)
+    boxes = np.full((n, size, size), np.nan)
+    with span("transform"):
+        rows_f, cols_f = grid_for(src).lonlat_to_pixel(lons, lats)
+    rows, cols = np.floor(rows_f).astype(int), np.floor(cols_f).astype(int)
+    inside = np.flatnonzero((rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width))
+    if inside.size == 0:
+        return boxes
+
+    # Extent of every box, then the part of it on the raster
+    top, bottom = int(rows[inside].min()) - half, int(rows[inside].max()) + half + 1
+    left, right = int(cols[inside].min()) - half, int(cols[inside].max()) + half + 1
+    read_top, read_bottom = max(top, 0), min(bottom, src.height)
+    read_left, read_right = max(left, 0), min(right, src.width)
+    with span("read"):
+        data = src.read(1, window=Window(read_left, read_top, read_right - read_left, read_bottom - read_top))
+    record_bytes_read(data.nbytes)
+    data = data.astype("float64")
+    invalid = ~np.isfinite(data) | (data == -9999)
+    if src.nodata is not None:
+        invalid |= data == src.nodata
+    data[invalid] = np.nan
+    # Pad back out to the full extent so every box indexes in bounds
+    data = np.pad(data, ((read_top - top, bottom - read_bottom), (read_left - left, right - read_right)),
+                  constant_values=np.nan)
+
+    offsets = np.arange(size)
+    box_rows = (rows[inside] - half - top)[:, None, None] + offsets[None, :, None]
+    box_cols = (cols[inside] - half - left)[:, None, None] + offsets[None, None, :]
+    boxes[inside] = data[box_rows, box_cols]
+    return boxes
+
+def window_stats(boxes: np.ndarray, min_valid: float = MATCHUP_MIN_VALID,
+                 max_cv: float = MATCHUP_MAX_CV) -> Dict[str, np.ndarray]:
+    """
+    Per-box median, outlier-filtered mean/std/CV and valid pixel count, plus
+    whether the box passes the valid-fraction and CV filters.
+    """
+    flat = boxes.reshape(len(boxes), -1)
+    valid_pixels = np.isfinite(flat).sum(axis=1)
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN boxes
+        median = np.nanmedian(flat, axis=1)
+        std = np.nanstd(flat, axis=1)
+        keep = np.abs(flat - median[:, None]) <= MATCHUP_OUTLIER_STD * std[:, None]
+        filtered = np.where(keep, flat, np.nan)
+        filtered_mean = np.nanmean(filtered, axis=1)
+        filtered_std = np.nanstd(filtered, axis=1)
+        cv = filtered_std / filtered_mean
+    passed = (valid_pixels >= min_valid * flat.shape[1]) & (valid_pixels > 0) & (cv <= max_cv)
+    return {
+        "satellite": median,
+        "filtered_mean": filtered_mean,
+        "std": filtered_std,
+        "cv": cv,
+        "valid_pixels": valid_pixels,
+        "passed": passed,
+    }
+
+def matchup_day(url: str, lats: np.ndarray, lons: np.ndarray, size: int,
+                min_valid: float, max_cv: float) -> Optional[Dict[str, np.ndarray]]:
+    """Window stats for every station against one day's raster; None if the raster is missing."""
+    try:
+        boxes = read_dataset(url, lambda src: extract_windows(src, lons, lats, size))
+    except RasterioIOError as e:
+        print(f"Skipping {url} in matchups: {str(e)}")
+        return None
+    return window_stats(boxes, min_valid, max_cv)
+
+def summary_stats(insitu: np.ndarray, satellite: np.ndarray) -> dict:
+    """Agreement of satellite against in situ: n, bias (satellite - in situ), MAE, RMSE, Pearson r."""
+    n = int(len(insitu))
+    if n == 0:
+        return {"n": 0, "bias": None, "mae": None, "rmse": None, "r": None}
+    diff = satellite - insitu
+    r = None
+    if n > 1 and np.std(insitu) > 0 and np.std(satellite) > 0:
+        r = float(np.corrcoef(insitu, satellite)[0, 1])
+    return {
+        "n": n,
+        "bias": float(diff.mean()),
+        "mae": float(np.abs(diff).mean()),
+        "rmse": float(math.sqrt((diff * diff).mean())),
+        "r": r,
+    }
+
+def _candidates(index: InsituIndex, variable: str, start: datetime.date, end: datetime.date, max_days: int):
+    """
+    In situ rows dated in [start, end], and for each raster day within
+    max_days of any of them, the rows it is compared against.
+    """
+    var_index = index.get(variable)
+    if var_index is None:
+        return None, {}
+    lo = np.searchsorted(var_index.dates, np.datetime64(start, "D"))
+    hi = np.searchsorted(var_index.dates, np.datetime64(end, "D"), side="right")
+    if lo == hi:
+        return None, {}
+    # Rows are sorted by date, so the range is one contiguous slice, and so
+    # are the rows within max_days of any one raster day
+    rows = np.arange(var_index.offsets[lo], var_index.offsets[hi])
+    row_days = np.repeat(var_index.dates[lo:hi], np.diff(var_index.offsets[lo:hi + 1]))
+
+    reach = np.arange(-max_days, max_days + 1).astype("timedelta64[D]")
+    raster_days = np.unique(var_index.dates[lo:hi, None] + reach[None, :])
+    first = np.searchsorted(row_days, raster_days - np.timedelta64(max_days, "D"))
+    last = np.searchsorted(row_days, raster_days + np.timedelta64(max_days, "D"), side="right")
+    jobs = {str(day): rows[i:j] for day, i, j in zip(raster_days, first, last)}
+    return (var_index, rows), jobs
+
+async def run_matchups(index: InsituIndex, variable: str, start: datetime.date, end: datetime.date,
+                       size: int = MATCHUP_WINDOW, max_days: int = 0, min_valid: float = MATCHUP_MIN_VALID,
+                       max_cv: float = MATCHUP_MAX_CV) -> dict:
+    """
+    Pair every in situ sample dated in [start, end] with the variable's
+    rasters up to max_days away. Each raster day is one job on the cpu
+    process pool: one read covering all its stations, then size x size box
+    stats. A sample keeps its closest day whose box passes the filters.
+    Returns {"matchups": {column: array}, "summary", "counts"}.
+    """
+    # Candidate selection and the final table are plain NumPy over possibly
+    # millions of rows: keep them off the event loop
+    selected, jobs = await run_io(_candidates, index, variable, start, end, max_days)
+    counts = {"insitu": 0, "days": len(jobs), "days_missing": 0, "days_failed": 0, "extracted": 0, "passed": 0}
+    if selected is None:
+        return {"matchups": {name: np.empty(0) for name in MATCHUP_COLUMNS},
+                "summary": summary_stats(np.empty(0), np.empty(0)), "counts": counts}
+    var_index, rows = selected
+    counts["insitu"] = int(len(rows))
+
+    results = []
+    todo = list(jobs.items())[::-1]
+    in_flight = {}
+    try:
+        while todo or in_flight:
+            while todo and len(in_flight) < MATCHUP_WORKERS:
+                day, day_rows = todo[-1]
+                try:
+                    future = CPU_EXECUTOR.submit(record_spans, matchup_day, format_url(day, variable),
+                                                 var_index.lat[day_rows], var_index.lon[day_rows],
+                                                 size, min_valid, max_cv)
+                except ExecutorBusy:
+                    break  # pool saturated by other requests: wait for room
+                todo.pop()
+                in_flight[asyncio.wrap_future(future)] = (day, day_rows)
+            if not in_flight:
+                await asyncio.sleep(0.1)
+                continue
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                day, day_rows = in_flight.pop(future)
+                try:
+                    stats, spans, bytes_read = future.result()
+                except Exception as e:
+                    print(f"Unexpected error in run_matchups for {day}: {str(e)}")
+                    counts["days_failed"] += 1
+                    continue
+                merge_spans(spans, bytes_read)
+                if stats is None:
+                    counts["days_missing"] += 1
+                    continue
+                counts["extracted"] += int((stats["valid_pixels"] > 0).sum())
+                results.append((day, day_rows, stats))
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+    return await run_io(_assemble, var_index, results, counts)
+
+def _assemble(var_index, results, counts) -> dict:
+    """Keep each sample's closest passing day and build the match-up table."""
+    if results:
+        row_ids = np.concatenate([day_rows for _, day_rows, _ in results])
+        raster_days = np.concatenate([np.full(len(day_rows), np.datetime64(day, "D"))
+                                      for day, day_rows, _ in results])
+        stats = {name: np.concatenate([s[name] for _, _, s in results]) for name in results[0][2]}
+    else:
+        row_ids, raster_days, stats = np.empty(0, dtype="int64"), np.empty(0, dtype="datetime64[D]"), None
+    sample_days = var_index.timestamps[row_ids].astype("datetime64[D]")
+    day_offset = (raster_days - sample_days).astype("int64")
+
+    passed = stats["passed"] if stats is not None else np.zeros(0, dtype=bool)
+    # Per sample: closest day first, the earlier one on a tie
+    order = np.lexsort((day_offset, np.abs(day_offset), row_ids))
+    order = order[passed[order]]
+    _, first = np.unique(row_ids[order], return_index=True)
+    best = order[first]
+    counts["passed"] = int(len(best))
+
+    best_rows = row_ids[best]
+    insitu = var_index.value[best_rows].astype("float64")
+    satellite = stats["satellite"][best] if stats is not None else np.empty(0)
+    table = {
+        "insitu_date": var_index.timestamps[best_rows],
+        "raster_date": np.datetime_as_string(raster_days[best], unit="D"),
+        "day_offset": day_offset[best],
+        "lat": var_index.lat[best_rows],
+        "lon": var_index.lon[best_rows],
+        "insitu": var_index.value[best_rows],
+        "satellite": satellite,
+    }
+    for name in ("filtered_mean", "std", "cv", "valid_pixels"):
+        table[name] = stats[name][best] if stats is not None else np.empty(0)
+    return {"matchups": table, "summary": summary_stats(insitu, satellite), "counts": counts}
+
+def matchups_csv(result: dict) -> str:
+    """The match-up table as CSV, one row per match-up."""
+    return pd.DataFrame({name: result["matchups"][name] for name in MATCHUP_COLUMNS}).to_csv(index=False)
@@ -0,0 +1,173 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+import bisect
+import threading
+import time
+from fastapi.responses import JSONResponse
+from app.utils.json_utils import dumps
+
+# Minimal Prometheus text-format metrics (no client library dependency).
+# Spans time the hot-path stages of a request (dataset open, CRS transform,
+# window reads, polygon masking, JSON serialization); each observation goes
+# to a process-wide histogram and, while a request is being handled, to that
+# request's profile so it can be returned in a Server-Timing header.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value:g}")
+        return "\n".join(lines)
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labels, label_values, f'le="{bound:g}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, label_values, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-2]:g}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return "\n".join(lines)
+
+REQUESTS = Counter("lis_http_requests_total", "HTTP requests handled", ("route", "method", "status"))
+REQUEST_LATENCY = Histogram("lis_http_request_duration_seconds", "Time to response headers", ("route",))
+SPAN_LATENCY = Histogram("lis_span_duration_seconds", "Time spent in hot-path stages", ("span",))
+BYTES_READ = Counter("lis_raster_bytes_read_total", "Decoded raster bytes read from windows", ("route",))
+RESPONSE_BYTES = Counter("lis_http_response_bytes_total", "Response body bytes (Content-Length)", ("route",))
+METRICS = (REQUESTS, REQUEST_LATENCY, SPAN_LATENCY, BYTES_READ, RESPONSE_BYTES)
+
+class RequestProfile:
+    """Per-request accumulation of span time and raster bytes read."""
+
+    def __init__(self):
+        self.spans: Dict[str, list] = {}  # name -> [seconds, calls]
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, calls: int = 1):
+        with self._lock:
+            entry = self.spans.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+
+    def add_bytes(self, nbytes: int):
+        with self._lock:
+            self.bytes_read += nbytes
+
+    def server_timing(self, total: float) -> str:
+        with self._lock:
+            parts = [f'{name};desc="{calls} calls";dur={seconds * 1e3:.2f}'
+                     for name, (seconds, calls) in sorted(self.spans.items())]
+        parts.append(f"total;dur={total * 1e3:.2f}")
+        return ", ".join(parts)
+
+# Set by the HTTP middleware; copied into io-pool jobs with the request context
+_profile: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+def start_profile() -> RequestProfile:
+    profile = RequestProfile()
+    _profile.set(profile)
+    return profile
+
+@contextmanager
+def span(name: str):
+    """Time a block into the span histogram and the current request's profile."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        SPAN_LATENCY.observe(elapsed, name)
+        profile = _profile.get()
+        if profile is not None:
+            profile.add(name, elapsed)
+
+def record_bytes_read(nbytes: int):
+    profile = _profile.get()
+    if profile is not None:
+        profile.add_bytes(nbytes)
+
+def record_spans(fn, *args, **kwargs):
+    """
+    Run fn in a worker process with a fresh profile and return (result,
+    spans, bytes_read) so the parent can merge them with merge_spans.
+    """
+    profile = start_profile()
+    result = fn(*args, **kwargs)
+    return result, profile.spans, profile.bytes_read
+
+def merge_spans(spans: Dict[str, list], bytes_read: int):
+    """Fold span timings recorded in a worker process into this process."""
+    profile = _profile.get()
+    for name, (seconds, calls) in spans.items():
+        # Per-call durations are not shipped back; observe the mean per call
+        for _ in range(calls):
+            SPAN_LATENCY.observe(seconds / calls, name)
+        if profile is not None:
+            profile.add(name, seconds, calls)
+    if profile is not None:
+        profile.add_bytes(bytes_read)
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in METRICS) + "\n"
+
+class ProfiledJSONResponse(JSONResponse):
+    """
+    JSONResponse serialized by json_utils.dumps (NumPy arrays taken as is),
+    timed as the "serialize" span. Endpoints returning one directly skip
+    FastAPI's response validation and jsonable_encoder pass.
+    """
+
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return dumps(content)
@@ -0,0 +1,240 @@
+from typing import AsyncIterator, List, Optional
+import asyncio
+import math
+import os
+import time
+import numpy as np
+from rasterio import features
+from rasterio.errors import RasterioIOError
+from rasterio.windows import Window
+from shapely.geometry import box
+from app.utils.dataset_cache import read_dataset
+from app.utils.executor_utils import CPU_EXECUTOR, CPU_WORKERS, ExecutorBusy
+from app.utils.mask_cache import MASK_CACHE, pack_mask, unpack_mask
+from app.utils.metrics_utils import merge_spans, record_bytes_read, record_spans, span
+from app.utils.projection_utils import grid_for
+from app.utils.url_utils import format_url
+
+# Per-scene reductions are mostly decompression and masking, so they run on
+# the cpu process pool; this caps how many scenes one time series keeps in
+# flight there, so concurrent requests share the pool.
+POLYGON_TIMESERIES_WORKERS = int(os.environ.get("POLYGON_TIMESERIES_WORKERS", str(CPU_WORKERS)))
+
+class RunningStats:
+    """
+    Single-pass mean/variance/min/max accumulator (Welford), fed one block of
+    values at a time; blocks are merged with Chan et al.'s pairwise update so
+    the per-block work stays vectorized.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values: np.ndarray):
+        n = values.size
+        if n == 0:
+            return
+        values = values.astype("float64", copy=False)
+        block_mean = float(values.mean())
+        block_m2 = float(((values - block_mean) ** 2).sum())
+        total = self.count + n
+        delta = block_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += block_m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other: "RunningStats"):
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self) -> float:
+        # Population std, matching np.std
+        return math.sqrt(self.m2 / self.count) if self.count else math.nan
+
+    def as_dict(self) -> dict:
+        return {
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+            "std": self.std,
+            "count": self.count,
+        }
+
+def polygon_window(src, polygon: dict):
+    """
+    Reproject a WGS84 GeoJSON polygon to the raster CRS and rasterize it over
+    the smallest window covering it. Returns (window, mask) where mask is a
+    boolean array of the window's shape, True inside the polygon.
+    Raises ValueError if the polygon misses the raster. Masks are cached per
+    raster grid, so repeat regions skip reprojection and rasterization.
+    """
+    grid = grid_for(src)
+    return MASK_CACHE.get_or_build(grid.key, polygon, lambda: _rasterize_polygon(src, grid, polygon))
+
+def _rasterize_polygon(src, grid, polygon: dict):
+    with span("transform"):
+        polygon = grid.project_geometry(polygon)
+    if not box(*src.bounds).intersects(polygon):
+        raise ValueError(f"Polygon outside raster bounds: {src.bounds}")
+
+    with span("mask"):
+        window = features.geometry_window(src, [polygon])
+        mask = features.geometry_mask(
+            [polygon],
+            out_shape=(int(window.height), int(window.width)),
+            transform=src.window_transform(window),
+            invert=True
+        )
+    if not mask.any():
+        raise ValueError("Polygon covers no raster pixels (check CRS and coordinates)")
+    return window, mask
+
+def masked_window_stats(src, window: Window, mask: np.ndarray) -> RunningStats:
+    """
+    Accumulate stats over the masked pixels of window, reading one band of
+    internal blocks at a time so only the polygon's footprint is fetched.
+    """
+    stats = RunningStats()
+    block_height = src.block_shapes[0][0]
+    row_off, col_off = int(window.row_off), int(window.col_off)
+    height, width = mask.shape
+    row = row_off
+    while row < row_off + height:
+        # Align band edges to the internal block grid so each tile is read once
+        stop = min(row_off + height, (row // block_height + 1) * block_height)
+        band_mask = mask[row - row_off:stop - row_off]
+        if band_mask.any():
+            with span("read"):
+                data = src.read(1, window=Window(col_off, row, width, stop - row))
+            record_bytes_read(data.nbytes)
+            values = data[band_mask]
+            valid = np.isfinite(values) & (values != -9999)
+            if src.nodata is not None:
+                valid &= values != src.nodata
+            stats.update(values[valid])
+        row = stop
+    return stats
+
+def get_polygon_stats(url: str, polygon: dict, key: Optional[tuple] = None,
+                      packed: Optional[tuple] = None) -> Optional[dict]:
+    """
+    Mean/min/max/std/count of the raster at url inside a WGS84 GeoJSON
+    polygon. Returns None if every covered pixel is no-data; raises
+    ValueError if the polygon does not overlap the raster. (key, packed)
+    from prepare_polygon_mask is used instead of rasterizing here when the
+    raster's grid matches key.
+    """
+    return read_dataset(url, lambda src: _polygon_stats(src, polygon, key, packed))
+
+def _polygon_stats(src, polygon: dict, key: Optional[tuple], packed: Optional[tuple]) -> Optional[dict]:
+    stats = masked_window_stats(src, *_scene_mask(src, polygon, key, packed))
+    if stats.count == 0:
+        return None
+    result = stats.as_dict()
+    result["raster_bounds"] = src.bounds
+    result["raster_crs"] = str(src.crs)
+    return result
+
+def _scene_mask(src, polygon: dict, key: Optional[tuple], packed: Optional[tuple]):
+    if packed is None or grid_key(src) != key:
+        return polygon_window(src, polygon)
+    return unpack_mask(packed)
+
+def grid_key(src) -> tuple:
+    """Identity of a raster grid: scenes with equal keys can share a mask."""
+    return grid_for(src).key
+
+def polygon_scene_stats(url: str, polygon: dict, key: Optional[tuple] = None,
+                        packed: Optional[tuple] = None) -> Optional[dict]:
+    """
+    Polygon stats for one scene, reusing the packed mask when the scene's
+    grid matches key. Runs in a worker process. Returns None for missing
+    scenes and scenes with no valid pixels under the polygon.
+    """
+    try:
+        stats = read_dataset(url, lambda src: masked_window_stats(src, *_scene_mask(src, polygon, key, packed)))
+    except (RasterioIOError, ValueError) as e:
+        print(f"Skipping {url} in polygon_scene_stats: {str(e)}")
+        return None
+    return stats.as_dict() if stats.count else None
+
+def prepare_polygon_mask(polygon: dict, urls: List[str]):
+    """
+    Rasterize the polygon against the grid of the first scene that opens.
+    Returns (key, packed mask) (see mask_cache.pack_mask), or (None, None)
+    if no scene exists. Raises ValueError if the polygon misses that scene.
+    Call it in the API process, so its mask cache serves every request and
+    the cpu workers only receive the packed mask.
+    """
+    for url in urls:
+        try:
+            key, window, mask = read_dataset(url, lambda src: (grid_key(src), *polygon_window(src, polygon)))
+        except RasterioIOError:
+            continue
+        return key, pack_mask(window, mask)
+    return None, None
+
+async def iter_polygon_timeseries(polygon: dict, variable: str, dates: List[str],
+                                  prepared: Optional[tuple] = None,
+                                  timeout: Optional[float] = None) -> AsyncIterator[dict]:
+    """
+    Yield {"date", "mean", "min", "max", "std", "count"} per date that has
+    data, in completion order, with per-scene reductions spread over the cpu
+    process pool. prepared is the result of prepare_polygon_mask. If timeout
+    seconds pass first, the scenes not reduced by then are dropped and the
+    last item is {"timed_out_dates": [...]} instead.
+    """
+    urls = [format_url(date, variable) for date in dates]
+    key, packed = prepared if prepared is not None else prepare_polygon_mask(polygon, urls)
+    if key is None:
+        return
+    deadline = None if timeout is None else time.monotonic() + timeout
+    todo = list(zip(urls, dates))[::-1]
+    in_flight = {}
+    try:
+        while todo or in_flight:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            while todo and len(in_flight) < POLYGON_TIMESERIES_WORKERS:
+                url, date = todo[-1]
+                try:
+                    future = CPU_EXECUTOR.submit(record_spans, polygon_scene_stats, url, polygon, key, packed)
+                except ExecutorBusy:
+                    break  # pool saturated by other requests: wait for room
+                todo.pop()
+                in_flight[asyncio.wrap_future(future)] = date
+            if not in_flight:
+                await asyncio.sleep(0.1 if remaining is None else min(0.1, remaining))
+                continue
+            done, _ = await asyncio.wait(in_flight, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                date = in_flight.pop(future)
+                try:
+                    stats, spans, bytes_read = future.result()
+                except Exception as e:
+                    print(f"Unexpected error in iter_polygon_timeseries: {str(e)}")
+                    continue
+                merge_spans(spans, bytes_read)
+                if stats is not None:
+                    yield {"date": date, **stats}
+    finally:
+        # Client went away, the generator was closed or time ran out: drop queued scenes
+        for future in in_flight:
+            future.cancel()
+    if todo or in_flight:
+        yield {"timed_out_dates": sorted(set(in_flight.values()) | {date for _, date in todo})}
@@ -0,0 +1,92 @@
+from typing import Dict, Tuple
+import threading
+import weakref
+import numpy as np
+import shapely
+from affine import Affine
+from pyproj import Transformer
+from rasterio.crs import CRS
+from shapely.geometry import shape
+
+WGS84 = "EPSG:4326"
+
+# Building a Transformer costs far more than using one, but a Transformer
+# must not be shared between threads, so each thread keeps its own per
+# (src, dst) CRS pair.
+_local = threading.local()
+
+def get_transformer(src_crs: str, dst_crs: str) -> Transformer:
+    """Cached always_xy Transformer for this thread; CRSs as EPSG codes or WKT."""
+    cache = getattr(_local, "transformers", None)
+    if cache is None:
+        cache = _local.transformers = {}
+    transformer = cache.get((src_crs, dst_crs))
+    if transformer is None:
+        transformer = cache[(src_crs, dst_crs)] = Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+    return transformer
+
+def _transform(transformer: Transformer, xs, ys) -> Tuple[np.ndarray, np.ndarray]:
+    """transformer.transform over arrays of any shape, returned as arrays of that shape."""
+    xs, ys = np.asarray(xs, dtype="float64"), np.asarray(ys, dtype="float64")
+    if xs.size == 1 and ys.size == 1:
+        # pyproj takes its scalar path for size-1 arrays, which NumPy >= 1.25
+        # warns about on every call; hand it plain floats instead
+        x, y = transformer.transform(float(xs.item()), float(ys.item()))
+        return np.full(xs.shape, x), np.full(ys.shape, y)
+    xs, ys = transformer.transform(xs, ys)
+    return np.asarray(xs), np.asarray(ys)
+
+class Grid:
+    """
+    A raster grid (CRS, geotransform, shape) with its inverse geotransform
+    precomputed, for mapping WGS84 coordinates to pixels in bulk.
+    """
+
+    def __init__(self, crs: CRS, transform: Affine, shape: Tuple[int, int]):
+        self.crs = crs
+        self.crs_key = crs.to_wkt() if crs else WGS84
+        self.transform = transform
+        self.inverse = ~transform
+        self.shape = tuple(shape)
+        # Identity of the grid: datasets, masks etc. with equal keys line up pixel for pixel
+        self.key = (self.crs_key, tuple(transform)[:6], self.shape)
+
+    def lonlat_to_xy(self, lons, lats) -> Tuple[np.ndarray, np.ndarray]:
+        """Project WGS84 lon/lat arrays to the grid CRS in one call."""
+        return _transform(get_transformer(WGS84, self.crs_key), lons, lats)
+
+    def xy_to_pixel(self, xs, ys) -> Tuple[np.ndarray, np.ndarray]:
+        """Fractional (rows, cols) for grid-CRS coordinates."""
+        cols, rows = self.inverse * (np.asarray(xs), np.asarray(ys))
+        return rows, cols
+
+    def lonlat_to_pixel(self, lons, lats) -> Tuple[np.ndarray, np.ndarray]:
+        return self.xy_to_pixel(*self.lonlat_to_xy(lons, lats))
+
+    def pixel_to_lonlat(self, rows, cols) -> Tuple[np.ndarray, np.ndarray]:
+        """WGS84 (lons, lats) of fractional pixel positions."""
+        xs, ys = self.transform * (np.asarray(cols, dtype="float64"), np.asarray(rows, dtype="float64"))
+        return _transform(get_transformer(self.crs_key, WGS84), xs, ys)
+
+    def project_geometry(self, geometry: dict):
+        """Reproject a WGS84 GeoJSON geometry to the grid CRS as a shapely geometry."""
+        transformer = get_transformer(WGS84, self.crs_key)
+        return shapely.transform(shape(geometry), transformer.transform, interleaved=False)
+
+# Grids are shared by every dataset on the same grid; the per-handle map
+# makes the lookup for an already-open dataset a dict hit.
+_grids: Dict[tuple, Grid] = {}
+_dataset_grids = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+def grid_for(src) -> Grid:
+    """The Grid of an open rasterio dataset."""
+    grid = _dataset_grids.get(src)
+    if grid is None:
+        key = (src.crs.to_wkt() if src.crs else WGS84, tuple(src.transform)[:6], src.shape)
+        with _lock:
+            grid = _grids.get(key)
+            if grid is None:
+                grid = _grids[key] = Grid(src.crs, src.transform, src.shape)
+            _dataset_grids[src] = grid
+    return grid
@@ -1,20 +1,15 @@
 from rasterio.errors import RasterioError, RasterioIOError
-import rasterio
-from rasterio.warp import transform
+from rasterio.windows import Window
+from pyproj import Geod
 import numpy as np
 import math
-from app.utils.url_utils import format_google_url
+from app.utils.dataset_cache import read_dataset
+from app.utils.metrics_utils import record_bytes_read, span
+from app.utils.projection_utils import grid_for
 
 def get_pixel_value(url: str, lat: float, lon: float) -> float:
     try:
-        url = format_google_url(url)
-        with rasterio.Env():
-            with rasterio.open(url) as src:
-                lon_proj, lat_proj = transform("EPSG:4326", src.crs, [lon], [lat])
-                row, col = src.index(lon_proj[0], lat_proj[0])
-                value = src.read(1, window=((row, row+1), (col, col+1)))
-                val = float(value[0, 0])
-                return val if val != -9999 else None
+        return read_dataset(url, lambda src: _pixel_value(src, lat, lon))
     except (RasterioError, RasterioIOError) as e:
         print(f"Rasterio error in get_pixel_value: {str(e)}")
         return None
@@ -22,31 +17,152 @@ def get_pixel_value(url: str, lat: float, lon: float) -> float:
         print(f"Unexpected error in get_pixel_value: {str(e)}")
         return None
 
-def get_transect_values(url, start_lat, start_lon, end_lat, end_lon):
+def _pixel_value(src, lat: float, lon: float):
+    with span("transform"):
+        rows_f, cols_f = grid_for(src).lonlat_to_pixel([lon], [lat])
+    row, col = math.floor(rows_f[0]), math.floor(cols_f[0])
+    if not (0 <= row < src.height and 0 <= col < src.width):
+        return None
+    with span("read"):
+        value = src.read(1, window=((row, row+1), (col, col+1)))
+    record_bytes_read(value.nbytes)
+    val = float(value[0, 0])
+    return val if val != -9999 else None
+
+def get_pixel_values(url: str, lats, lons) -> list:
+    """
+    Pixel values for many lat/lon points on one raster, in input order, with
+    None for no-data or out-of-bounds points. Points are reprojected in one
+    call and grouped by internal tile so each tile is read once.
+    """
+    values = np.full(len(lats), np.nan)
+    try:
+        values = read_dataset(url, lambda src: _pixel_values(src, lats, lons))
+    except (RasterioError, RasterioIOError) as e:
+        print(f"Rasterio error in get_pixel_values: {str(e)}")
+    except Exception as e:
+        print(f"Unexpected error in get_pixel_values: {str(e)}")
+    values[values == -9999] = np.nan
+    return [None if np.isnan(v) else float(v) for v in values]
+
+def _pixel_values(src, lats, lons) -> np.ndarray:
+    values = np.full(len(lats), np.nan)
+    with span("transform"):
+        rows_f, cols_f = grid_for(src).lonlat_to_pixel(lons, lats)
+    rows = np.floor(rows_f).astype(int)
+    cols = np.floor(cols_f).astype(int)
+    inside = np.flatnonzero((rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width))
+
+    block_height, block_width = src.block_shapes[0]
+    tile_rows = rows[inside] // block_height
+    tile_cols = cols[inside] // block_width
+    tiles, tile_of_point = np.unique(np.stack([tile_rows, tile_cols], axis=1), axis=0, return_inverse=True)
+    for t, (tile_row, tile_col) in enumerate(tiles):
+        points = inside[tile_of_point.ravel() == t]
+        row_off, col_off = int(tile_row) * block_height, int(tile_col) * block_width
+        window = Window(col_off, row_off,
+                        min(block_width, src.width - col_off),
+                        min(block_height, src.height - row_off))
+        with span("read"):
+            data = src.read(1, window=window)
+        record_bytes_read(data.nbytes)
+        values[points] = data[rows[points] - row_off, cols[points] - col_off]
+    if src.nodata is not None:
+        values[values == src.nodata] = np.nan
+    return values
+
+def get_transect_values(url, start_lat, start_lon, end_lat, end_lon,
+                        interpolation="nearest", max_points=None):
+    """
+    Sample the raster along a straight line between two lat/lon points.
+
+    The pixels covering the line are fetched with one windowed read and
+    sampled with NumPy indexing. interpolation is "nearest" or "bilinear";
+    max_points caps the number of samples (default: one per pixel step).
+    Returns (values, distances) as float64 arrays, distances in metres from
+    the start, skipping no-data samples.
+    """
+    if interpolation not in ("nearest", "bilinear"):
+        raise ValueError("interpolation must be 'nearest' or 'bilinear'")
     try:
-        url = format_google_url(url)
-        with rasterio.Env():
-            with rasterio.open(url) as src:
-                start_lon_proj, start_lat_proj = transform("EPSG:4326", src.crs, [start_lon], [start_lat])
-                end_lon_proj, end_lat_proj = transform("EPSG:4326", src.crs, [end_lon], [end_lat])
-                start_row, start_col = src.index(start_lon_proj[0], start_lat_proj[0])
-                end_row, end_col = src.index(end_lon_proj[0], end_lat_proj[0])
-                num_points = int(math.hypot(end_row - start_row, end_col - start_col)) + 1
-                rows = np.linspace(start_row, end_row, num_points)
-                cols = np.linspace(start_col, end_col, num_points)
-                distances = np.linspace(0, num_points * 0.3, num_points)
-                values, valid_distances = [], []
-                
-                for i, (row, col) in enumerate(zip(rows, cols)):
-                    value = src.read(1, window=((int(row), int(row)+1), (int(col), int(col)+1)))
-                    val = float(value[0, 0])
-                    if val != -9999:
-                        values.append(val)
-                        valid_distances.append(distances[i])
-                return values, valid_distances
+        return read_dataset(url, lambda src: _transect_values(
+            src, start_lat, start_lon, end_lat, end_lon, interpolation, max_points
+        ))
     except (RasterioError, RasterioIOError) as e:
         print(f"Rasterio error in get_transect_values: {str(e)}")
-        return [], []
+        return np.empty(0), np.empty(0)
     except Exception as e:
         print(f"Unexpected error in get_transect_values: {str(e)}")
-        return [], []
\ No newline at end of file
+        return np.empty(0), np.empty(0)
+
+def _transect_values(src, start_lat, start_lon, end_lat, end_lon, interpolation, max_points):
+    grid = grid_for(src)
+    with span("transform"):
+        xs, ys = grid.lonlat_to_xy([start_lon, end_lon], [start_lat, end_lat])
+    rows_f, cols_f = grid.xy_to_pixel(xs, ys)
+
+    num_points = int(math.hypot(math.floor(rows_f[1]) - math.floor(rows_f[0]),
+                                math.floor(cols_f[1]) - math.floor(cols_f[0]))) + 1
+    if max_points is not None:
+        num_points = max(2, min(num_points, int(max_points)))
+    t = np.linspace(0.0, 1.0, num_points)
+    rows_f = rows_f[0] + t * (rows_f[1] - rows_f[0])
+    cols_f = cols_f[0] + t * (cols_f[1] - cols_f[0])
+    distances = t * _line_length_m(src.crs, xs, ys, (start_lon, start_lat), (end_lon, end_lat))
+
+    if interpolation == "bilinear":
+        values = _sample_bilinear(src, rows_f - 0.5, cols_f - 0.5)
+    else:
+        values = _sample_nearest(src, np.floor(rows_f).astype(int), np.floor(cols_f).astype(int))
+
+    valid = ~np.isnan(values)
+    return values[valid], distances[valid]
+
+def _line_length_m(crs, xs, ys, start_lonlat, end_lonlat):
+    if crs.is_geographic:
+        _, _, length = Geod(ellps="WGS84").inv(*start_lonlat, *end_lonlat)
+        return float(length)
+    return float(math.hypot(xs[1] - xs[0], ys[1] - ys[0])) * crs.linear_units_factor[1]
+
+def _read_covering(src, rows, cols):
+    """Read the window covering the in-bounds pixels; returns (data, row_off, col_off, inside) with nodata as NaN."""
+    inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+    if not inside.any():
+        return None, 0, 0, inside
+    row_off, col_off = int(rows[inside].min()), int(cols[inside].min())
+    window = Window(col_off, row_off,
+                    int(cols[inside].max()) - col_off + 1,
+                    int(rows[inside].max()) - row_off + 1)
+    with span("read"):
+        data = src.read(1, window=window)
+    record_bytes_read(data.nbytes)
+    data = data.astype("float64")
+    data[data == -9999] = np.nan
+    if src.nodata is not None:
+        data[data == src.nodata] = np.nan
+    return data, row_off, col_off, inside
+
+def _sample_nearest(src, rows, cols):
+    values = np.full(rows.shape, np.nan)
+    data, row_off, col_off, inside = _read_covering(src, rows, cols)
+    if data is not None:
+        values[inside] = data[rows[inside] - row_off, cols[inside] - col_off]
+    return values
+
+def _sample_bilinear(src, rows_c, cols_c):
+    """Bilinear interpolation between pixel centres, ignoring no-data neighbours."""
+    r0 = np.floor(rows_c).astype(int)
+    c0 = np.floor(cols_c).astype(int)
+    dr, dc = rows_c - r0, cols_c - c0
+    corners = [(r0, c0, (1 - dr) * (1 - dc)), (r0, c0 + 1, (1 - dr) * dc),
+               (r0 + 1, c0, dr * (1 - dc)), (r0 + 1, c0 + 1, dr * dc)]
+    rows = np.concatenate([r for r, _, _ in corners])
+    cols = np.concatenate([c for _, c, _ in corners])
+    samples = _sample_nearest(src, rows, cols).reshape(4, -1)
+    weights = np.stack([w for _, _, w in corners])
+    weights = np.where(np.isnan(samples), 0.0, weights)
+    total = weights.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = np.nansum(samples * weights, axis=0) / total
+    values[total == 0] = np.nan
+    return values
@@ -0,0 +1,301 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import gzip
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on cached response bytes (all encodings) per process; 0 disables the cache.
+RESPONSE_CACHE_MB = float(os.environ.get("RESPONSE_CACHE_MB", "128"))
+# Seconds an entry lives; rasters are immutable once published, so this is long.
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", "86400"))
+# redis://host:port/db to share entries between workers/instances; in-process LRU if unset.
+RESPONSE_CACHE_URL = os.environ.get("RESPONSE_CACHE_URL", "")
+# Bodies smaller than this are not worth a Content-Encoding.
+COMPRESS_MIN_BYTES = 512
+
+class CachedResponse:
+    """A response body with its precompressed variants, strong ETag and other headers to replay."""
+
+    __slots__ = ("body", "media_type", "headers", "gzip", "br", "etag", "expires")
+
+    def __init__(self, body: bytes, media_type: str, headers: Optional[Dict[str, str]] = None,
+                 gzip_body: Optional[bytes] = None, br_body: Optional[bytes] = None,
+                 etag: Optional[str] = None, expires: Optional[float] = None):
+        self.body = body
+        self.media_type = media_type
+        self.headers = headers or {}
+        self.gzip = gzip_body
+        self.br = br_body
+        self.etag = etag or f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.expires = expires if expires is not None else time.time() + RESPONSE_CACHE_TTL
+
+    @classmethod
+    def build(cls, body: bytes, media_type: str, headers: Optional[Dict[str, str]] = None,
+              etag: Optional[str] = None) -> "CachedResponse":
+        """Compress once at store time so hits only pick an encoding."""
+        gzip_body = br_body = None
+        if len(body) >= COMPRESS_MIN_BYTES:
+            gzip_body = gzip.compress(body, compresslevel=6, mtime=0)
+            if brotli is not None:
+                br_body = brotli.compress(body, quality=5)
+        return cls(body, media_type, headers, gzip_body, br_body, etag)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.body) + len(self.gzip or b"") + len(self.br or b"")
+
+    def encoded(self, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+        """(body, Content-Encoding) for a request's Accept-Encoding; br over gzip over identity."""
+        accepted = _accepted_encodings(accept_encoding)
+        if self.br is not None and "br" in accepted:
+            return self.br, "br"
+        if self.gzip is not None and "gzip" in accepted:
+            return self.gzip, "gzip"
+        return self.body, None
+
+    def to_bytes(self) -> bytes:
+        header = json.dumps({
+            "media_type": self.media_type, "headers": self.headers, "etag": self.etag, "expires": self.expires,
+            "lengths": [len(self.body), len(self.gzip or b""), len(self.br or b"")],
+        }).encode()
+        return struct.pack(">I", len(header)) + header + self.body + (self.gzip or b"") + (self.br or b"")
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "CachedResponse":
+        (size,) = struct.unpack(">I", blob[:4])
+        header = json.loads(blob[4:4 + size])
+        parts, offset = [], 4 + size
+        for length in header["lengths"]:
+            parts.append(blob[offset:offset + length] or None)
+            offset += length
+        return cls(parts[0] or b"", header["media_type"], header["headers"], parts[1], parts[2],
+                   header["etag"], header["expires"])
+
+def _accepted_encodings(header: str) -> set:
+    """Content codings a client accepts (those with q=0 excluded)."""
+    accepted = set()
+    for item in header.split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name.lower())
+    if "*" in accepted:
+        accepted |= {"br", "gzip"}
+    return accepted
+
+class MemoryBackend:
+    """In-process LRU bounded by total cached bytes."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> CachedResponse
+        self._bytes = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CachedResponse):
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+
+    def _remove(self, key: str):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+class RedisBackend:
+    """
+    Entries shared through Redis, expiring with the TTL. Anything speaking the
+    Redis protocol works. Errors are treated as misses so a flaky cache never
+    fails a request.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.errors = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            blob = self._client.get(key)
+        except redis.RedisError as e:
+            self.errors += 1
+            logger.warning(f"Response cache get failed: {str(e)}")
+            return None
+        return CachedResponse.from_bytes(blob) if blob is not None else None
+
+    def set(self, key: str, entry: CachedResponse):
+        try:
+            self._client.set(key, entry.to_bytes(), ex=max(1, int(entry.expires - time.time())))
+        except redis.RedisError as e:
+            self.errors += 1
+            logger.warning(f"Response cache set failed: {str(e)}")
+
+    def delete_prefix(self, prefix: str):
+        try:
+            keys = list(self._client.scan_iter(match=prefix + "*", count=500))
+            if keys:
+                self._client.delete(*keys)
+        except redis.RedisError as e:
+            self.errors += 1
+            logger.warning(f"Response cache invalidation failed: {str(e)}")
+
+    def clear(self):
+        self.delete_prefix(CACHE_KEY_PREFIX)
+
+    def stats(self) -> dict:
+        return {"errors": self.errors}
+
+CACHE_KEY_PREFIX = "lis:resp:"
+
+def normalize_params(items: Iterable[Tuple[str, str]], normalizers: Optional[Dict[str, Callable]] = None) -> str:
+    """
+    Canonical query string: sorted by name then value, numbers in one
+    spelling (41, 41.0 and 41.000 are the same point), optional per-name
+    normalizers for other equivalent spellings.
+    """
+    normalizers = normalizers or {}
+    canonical = []
+    for name, value in items:
+        value = value.strip()
+        if name in normalizers:
+            value = normalizers[name](value)
+        else:
+            try:
+                value = repr(float(value))
+            except ValueError:
+                pass
+        canonical.append((name, value))
+    return json.dumps(sorted(canonical), separators=(",", ":"))
+
+class ResponseCache:
+    """
+    Cache of full GET responses keyed by route, generation and normalized
+    query parameters. A namespace's generation is part of its keys (e.g. the
+    in situ pickle's validator), so entries from an older load are never
+    served, even from a backend shared with instances still on the old data.
+    The ETag is derived from the key too, so a conditional request can be
+    answered before the response is looked up or produced.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.enabled = backend is not None
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def key(self, route: str, generation: str, params: str) -> str:
+        digest = hashlib.sha256(f"{route}\n{generation}\n{params}".encode()).hexdigest()
+        return f"{CACHE_KEY_PREFIX}{generation}:{digest}"
+
+    @staticmethod
+    def etag(key: str) -> str:
+        return f'"{key.rsplit(":", 1)[1][:32]}"'
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, body: bytes, media_type: str, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        entry = CachedResponse.build(body, media_type, headers, self.etag(key))
+        self.backend.set(key, entry)
+        self.stores += 1
+        return entry
+
+    def invalidate(self, generation: str):
+        """Drop every entry stored under a generation."""
+        self.backend.delete_prefix(f"{CACHE_KEY_PREFIX}{generation}:")
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "brotli": brotli is not None,
+            **self.backend.stats(),
+        }
+
+def _make_backend():
+    if RESPONSE_CACHE_URL:
+        if redis is None:
+            logger.warning("RESPONSE_CACHE_URL is set but redis is not installed; using the in-process cache")
+        else:
+            return RedisBackend(RESPONSE_CACHE_URL)
+    if RESPONSE_CACHE_MB <= 0:
+        return None
+    return MemoryBackend(int(RESPONSE_CACHE_MB * 1024 * 1024))
+
+RESPONSE_CACHE = ResponseCache(_make_backend())
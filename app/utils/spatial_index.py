@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+import math
+import threading
+import numpy as np
+import shapely
+from shapely import STRtree
+from shapely.geometry import box, shape
+
+EARTH_RADIUS_M = 6371008.8
+# Shortest metres per degree of latitude (at the equator), so degree boxes
+# built from a radius always cover the circle.
+_MIN_M_PER_DEG_LAT = 110574.0
+# Per-date trees kept per variable; each is cheap to rebuild.
+DATE_TREE_CACHE_SIZE = 64
+
+def haversine_m(lon, lat, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """Great-circle distances in metres from (lon, lat) to each of (lons, lats)."""
+    lon1, lat1 = math.radians(lon), math.radians(lat)
+    lon2, lat2 = np.radians(lons.astype("float64")), np.radians(lats.astype("float64"))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def radius_box(lon: float, lat: float, radius_m: float):
+    """WGS84 box guaranteed to contain the circle of radius_m around (lon, lat)."""
+    dlat = radius_m / _MIN_M_PER_DEG_LAT
+    far_lat = min(89.999, abs(lat) + dlat)
+    dlon = min(180.0, dlat / max(math.cos(math.radians(far_lat)), 1e-6))
+    return box(lon - dlon, max(-90.0, lat - dlat), lon + dlon, min(90.0, lat + dlat))
+
+class StationIndex:
+    """
+    STRtree over the distinct sample positions ("stations") of one in situ
+    variable, with each station's rows (indices into the VariableIndex
+    arrays, ascending) stored CSR-style. Rows are sorted by date, so a date
+    range is a row range and per-station counts within it are binary searches.
+    Single-day queries use a per-date tree over that day's rows instead,
+    built on first use.
+    """
+
+    def __init__(self, var_index):
+        self.var_index = var_index
+        # One 64-bit key per float32 (lon, lat) pair: a 1-D unique is far faster than axis=0
+        positions = (var_index.lon.view("uint32").astype("uint64") << np.uint64(32)) | var_index.lat.view("uint32")
+        stations, first, station_of_row = np.unique(positions, return_index=True, return_inverse=True)
+        station_of_row = station_of_row.ravel()
+        self.lon = var_index.lon[first]
+        self.lat = var_index.lat[first]
+        self.tree = STRtree(shapely.points(self.lon, self.lat))
+
+        order = np.argsort(station_of_row, kind="stable")
+        self.rows = order.astype("int64")  # rows grouped by station, ascending within each
+        self.offsets = np.searchsorted(station_of_row[order], np.arange(len(stations) + 1)).astype("int64")
+        # (station, row) as one sortable key, for counting rows in a range per station
+        self._keys = station_of_row[order].astype("int64") * len(station_of_row) + self.rows
+
+        self._date_trees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.lon)
+
+    def row_range(self, start=None, end=None) -> Tuple[int, int]:
+        """Rows dated in [start, end] (dates; None for open-ended)."""
+        vi = self.var_index
+        lo = 0 if start is None else np.searchsorted(vi.dates, np.datetime64(start, "D"))
+        hi = len(vi.dates) if end is None else np.searchsorted(vi.dates, np.datetime64(end, "D"), side="right")
+        return int(vi.offsets[lo]), int(vi.offsets[hi])
+
+    def counts(self, stations: np.ndarray, row_start: int, row_stop: int) -> np.ndarray:
+        """Number of rows in [row_start, row_stop) at each station."""
+        n = len(self.var_index)
+        base = stations.astype("int64") * n
+        return np.searchsorted(self._keys, base + row_stop) - np.searchsorted(self._keys, base + row_start)
+
+    def station_rows(self, stations: np.ndarray, row_start: int, row_stop: int) -> np.ndarray:
+        """Rows of the stations within [row_start, row_stop), in date order."""
+        if len(stations) == 0:
+            return np.empty(0, dtype="int64")
+        starts, stops = self.offsets[stations], self.offsets[stations + 1]
+        lengths = stops - starts
+        gather = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        rows = self.rows[gather]
+        return np.sort(rows[(rows >= row_start) & (rows < row_stop)])
+
+    def query_rows(self, geometry, start=None, end=None) -> np.ndarray:
+        """Rows inside a WGS84 shapely geometry (boundary included), optionally within a date range, in date order."""
+        row_start, row_stop = self.row_range(start, end)
+        if row_start == row_stop:
+            return np.empty(0, dtype="int64")
+        if start is not None and start == end:
+            tree = self._date_tree(row_start, row_stop)
+            return np.sort(tree.query(geometry, predicate="intersects")) + row_start
+        stations = np.sort(self.tree.query(geometry, predicate="intersects"))
+        return self.station_rows(stations, row_start, row_stop)
+
+    def nearest(self, lon: float, lat: float, k: int = 10, radius_m: Optional[float] = None,
+                start=None, end=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Up to k stations closest to (lon, lat) by great-circle distance, within
+        radius_m if given, that have rows in the date range. Returns
+        (stations, distances in metres, row counts), closest first.
+        """
+        row_start, row_stop = self.row_range(start, end)
+        empty = np.empty(0, dtype="int64"), np.empty(0), np.empty(0, dtype="int64")
+        if row_start == row_stop or len(self) == 0:
+            return empty
+        # Grow a search circle from the planar nearest neighbour until it holds
+        # k eligible stations: nothing outside it can be closer than they are.
+        nearest = self.tree.query_nearest(shapely.Point(lon, lat))
+        search = max(float(haversine_m(lon, lat, self.lon[nearest], self.lat[nearest]).max()), 100.0)
+        if radius_m is not None:
+            search = min(search, radius_m)
+        while True:
+            stations = self.tree.query(radius_box(lon, lat, search))
+            distances = haversine_m(lon, lat, self.lon[stations], self.lat[stations])
+            within = distances <= search
+            stations, distances = stations[within], distances[within]
+            counts = self.counts(stations, row_start, row_stop)
+            eligible = counts > 0
+            done = (eligible.sum() >= k or (radius_m is not None and search >= radius_m)
+                    or search >= math.pi * EARTH_RADIUS_M)
+            if done:
+                break
+            search = search * 4 if radius_m is None else min(search * 4, radius_m)
+        stations, distances, counts = stations[eligible], distances[eligible], counts[eligible]
+        order = np.lexsort((stations, distances))[:k]
+        return stations[order], distances[order], counts[order]
+
+    def _date_tree(self, row_start: int, row_stop: int) -> STRtree:
+        with self._lock:
+            tree = self._date_trees.get(row_start)
+            if tree is not None:
+                self._date_trees.move_to_end(row_start)
+                return tree
+        vi = self.var_index
+        tree = STRtree(shapely.points(vi.lon[row_start:row_stop], vi.lat[row_start:row_stop]))
+        with self._lock:
+            self._date_trees[row_start] = tree
+            while len(self._date_trees) > DATE_TREE_CACHE_SIZE:
+                self._date_trees.popitem(last=False)
+        return tree
+
+def parse_polygon(geometry: dict):
+    """Shapely geometry of a WGS84 GeoJSON (Multi)Polygon, prepared for repeated predicates."""
+    geom = shape(geometry)
+    if geom.geom_type not in ("Polygon", "MultiPolygon") or geom.is_empty:
+        raise ValueError("geometry must be a GeoJSON Polygon or MultiPolygon")
+    shapely.prepare(geom)
+    return geom
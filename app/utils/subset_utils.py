@@ -0,0 +1,211 @@
+from typing import NamedTuple, Optional, Tuple
+import math
+import os
+import struct
+import zlib
+import numpy as np
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.io import MemoryFile
+from rasterio.windows import Window
+from app.utils.dataset_cache import read_dataset
+from app.utils.metrics_utils import record_bytes_read, span
+from app.utils.projection_utils import WGS84, get_transformer, grid_for
+
+# Longest side of a subset in pixels, whatever the bbox and zoom ask for.
+SUBSET_MAX_SIZE = int(os.environ.get("SUBSET_MAX_SIZE", "2048"))
+
+# Web Mercator size of a screen pixel at zoom 0 on the equator, in metres
+_WEB_MERCATOR_RES_Z0 = 156543.03392804097
+
+# Same anchors as the map client's colormaps (docs/static/app.js)
+COLORMAPS = {
+    "turbo": ["#30123b", "#4145ab", "#4675ed", "#39a2fc", "#1bcfd4", "#24eca6", "#61fc6c", "#a4fc3b",
+              "#d1e834", "#f3c63a", "#fe9b2d", "#f36315", "#d93806", "#a11907", "#7a0403"],
+    "viridis": ["#440154", "#482777", "#3e4989", "#31688e", "#26828e", "#1f9e89", "#35b779", "#6ece58",
+                "#b5de2b", "#fde725"],
+    "magma": ["#000004", "#1b0c41", "#4a0c6b", "#781c6d", "#a52c60", "#cf4446", "#ed6925", "#fb9a06",
+              "#f7d13d", "#fcfdbf"],
+}
+
+U16_NODATA = 65535
+
+class RasterSubset(NamedTuple):
+    data: np.ndarray  # float32 (height, width), NaN where no data
+    transform: Affine
+    crs: CRS
+
+def bbox_window(src, bbox) -> Optional[Window]:
+    """Window of src covering a WGS84 (west, south, east, north) bbox, clipped to the raster."""
+    west, south, east, north = bbox
+    # Densify the edges: a lon/lat box is curved in the raster CRS
+    t = np.linspace(0.0, 1.0, 21)
+    lons = np.concatenate([west + t * (east - west), np.full_like(t, east),
+                           east - t * (east - west), np.full_like(t, west)])
+    lats = np.concatenate([np.full_like(t, south), south + t * (north - south),
+                           np.full_like(t, north), north - t * (north - south)])
+    rows, cols = grid_for(src).lonlat_to_pixel(lons, lats)
+    row_start, row_stop = max(0, math.floor(rows.min())), min(src.height, math.ceil(rows.max()))
+    col_start, col_stop = max(0, math.floor(cols.min())), min(src.width, math.ceil(cols.max()))
+    if row_start >= row_stop or col_start >= col_stop:
+        return None
+    return Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+def _read_step(src, window: Window, zoom: Optional[float], max_size: int) -> int:
+    """
+    Power-of-two decimation for the read, so zoomed-out requests line up with
+    internal overview levels: as coarse as the map's screen pixels at zoom
+    allow (never coarser), then coarser still if needed to fit max_size.
+    """
+    step = 1
+    if zoom is not None:
+        _, lats = grid_for(src).pixel_to_lonlat([window.row_off + window.height / 2],
+                                                [window.col_off + window.width / 2])
+        lat = math.radians(float(lats[0]))
+        screen_m = _WEB_MERCATOR_RES_Z0 * math.cos(lat) / 2 ** zoom
+        pixel_m = abs(src.transform.a)
+        if src.crs and src.crs.is_geographic:
+            pixel_m *= 111320.0 * math.cos(lat)
+        elif src.crs:
+            pixel_m *= src.crs.linear_units_factor[1]
+        if screen_m > pixel_m:
+            step = 2 ** math.floor(math.log2(screen_m / pixel_m))
+    longest = max(window.width, window.height)
+    if longest / step > max_size:
+        step = 2 ** math.ceil(math.log2(longest / max_size))
+    return step
+
+def read_subset(url: str, bbox: Optional[Tuple[float, float, float, float]] = None,
+                zoom: Optional[float] = None, max_size: int = SUBSET_MAX_SIZE) -> Optional[RasterSubset]:
+    """
+    Read the part of the raster at url inside a WGS84 bbox (whole raster if
+    None), decimated for a web map at zoom and to at most max_size pixels on
+    the longest side. Decimated reads let GDAL serve them from internal
+    overviews. Returns None if the bbox misses the raster.
+    """
+    return read_dataset(url, lambda src: _read_subset(src, bbox, zoom, max_size))
+
+def _read_subset(src, bbox, zoom: Optional[float], max_size: int) -> Optional[RasterSubset]:
+    window = bbox_window(src, bbox) if bbox is not None else Window(0, 0, src.width, src.height)
+    if window is None:
+        return None
+    step = _read_step(src, window, zoom, max_size)
+    out_shape = (max(1, math.ceil(window.height / step)), max(1, math.ceil(window.width / step)))
+    with span("read"):
+        data = src.read(1, window=window, out_shape=out_shape, resampling=Resampling.nearest)
+    record_bytes_read(data.nbytes)
+    data = data.astype("float32", copy=False)
+    invalid = ~np.isfinite(data) | (data == -9999)
+    if src.nodata is not None:
+        invalid |= data == src.nodata
+    data[invalid] = np.nan
+    transform = src.window_transform(window) * Affine.scale(window.width / out_shape[1],
+                                                            window.height / out_shape[0])
+    return RasterSubset(data, transform, src.crs)
+
+def encode_geotiff(subset: RasterSubset) -> bytes:
+    """Deflate-compressed float32 GeoTIFF with -9999 as nodata."""
+    height, width = subset.data.shape
+    data = np.where(np.isnan(subset.data), np.float32(-9999), subset.data)
+    with MemoryFile() as memfile:
+        with memfile.open(driver="GTiff", width=width, height=height, count=1, dtype="float32",
+                          crs=subset.crs, transform=subset.transform, nodata=-9999,
+                          compress="deflate", predictor=3) as dst:
+            dst.write(data, 1)
+        return memfile.read()
+
+def encode_float16(subset: RasterSubset) -> bytes:
+    """Row-major little-endian float16, NaN where no data."""
+    return subset.data.astype("<f2").tobytes()
+
+def encode_uint16(subset: RasterSubset, vmin: float, vmax: float) -> Tuple[bytes, float, float]:
+    """
+    Row-major little-endian uint16 quantized over [vmin, vmax], 65535 where
+    no data. Returns (bytes, scale, offset); value = raw * scale + offset.
+    """
+    scale = (vmax - vmin) / (U16_NODATA - 1) if vmax > vmin else 1.0
+    quantized = np.clip(np.rint((subset.data - vmin) / scale), 0, U16_NODATA - 1)
+    quantized = np.where(np.isnan(subset.data), U16_NODATA, quantized).astype("<u2")
+    return quantized.tobytes(), scale, vmin
+
+def _colormap_lut(name: str) -> np.ndarray:
+    """256-entry RGB lookup table interpolated between the colormap's anchors."""
+    anchors = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in COLORMAPS[name]], dtype="float64")
+    t = np.linspace(0.0, len(anchors) - 1, 256)
+    return np.stack([np.interp(t, np.arange(len(anchors)), anchors[:, i]) for i in range(3)], axis=1).round()
+
+def encode_png(subset: RasterSubset, vmin: float, vmax: float, colormap: str = "turbo") -> bytes:
+    """RGBA PNG of the subset through colormap, clamped to [vmin, vmax], transparent where no data."""
+    if colormap not in COLORMAPS:
+        raise ValueError(f"Unknown colormap: {colormap}")
+    data = subset.data
+    valid = ~np.isnan(data)
+    t = np.clip((np.where(valid, data, vmin) - vmin) / ((vmax - vmin) or 1.0), 0.0, 1.0)
+    rgba = np.zeros(data.shape + (4,), dtype="uint8")
+    rgba[..., :3] = _colormap_lut(colormap)[np.rint(t * 255).astype(int)]
+    rgba[..., 3] = np.where(valid, 255, 0)
+    return _png_bytes(rgba)
+
+def _png_bytes(rgba: np.ndarray) -> bytes:
+    height, width, _ = rgba.shape
+
+    def chunk(kind: bytes, payload: bytes) -> bytes:
+        return struct.pack(">I", len(payload)) + kind + payload + struct.pack(">I", zlib.crc32(kind + payload))
+
+    # Filter type 0 (none) on every scanline
+    raw = np.concatenate([np.zeros((height, 1), dtype="uint8"), rgba.reshape(height, width * 4)], axis=1)
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+            + chunk(b"IEND", b""))
+
+SUBSET_MEDIA_TYPES = {
+    "tif": "image/tiff",
+    "f16": "application/octet-stream",
+    "u16": "application/octet-stream",
+    "png": "image/png",
+}
+
+def render_subset(url: str, bbox=None, zoom: Optional[float] = None, max_size: int = SUBSET_MAX_SIZE,
+                  fmt: str = "tif", vmin: float = 0.0, vmax: float = 20.0,
+                  colormap: str = "turbo") -> Optional[Tuple[bytes, dict]]:
+    """
+    Read and encode a subset; returns (body, headers) with the grid and
+    encoding described in X-Raster-* headers, or None if bbox misses the raster.
+    """
+    subset = read_subset(url, bbox, zoom, max_size)
+    if subset is None:
+        return None
+    height, width = subset.data.shape
+    headers = {
+        "X-Raster-Width": str(width),
+        "X-Raster-Height": str(height),
+        "X-Raster-CRS": subset.crs.to_string() if subset.crs else "",
+        "X-Raster-Transform": ",".join(f"{v:.10g}" for v in tuple(subset.transform)[:6]),
+        "X-Raster-Bounds": ",".join(f"{v:.8f}" for v in _wgs84_bounds(subset)),
+    }
+    with span("encode"):
+        if fmt == "tif":
+            body = encode_geotiff(subset)
+        elif fmt == "f16":
+            body = encode_float16(subset)
+        elif fmt == "u16":
+            body, scale, offset = encode_uint16(subset, vmin, vmax)
+            headers.update({"X-Raster-Scale": repr(scale), "X-Raster-Offset": repr(offset),
+                            "X-Raster-Nodata": str(U16_NODATA)})
+        elif fmt == "png":
+            body = encode_png(subset, vmin, vmax, colormap)
+        else:
+            raise ValueError(f"Unknown format: {fmt}")
+    return body, headers
+
+def _wgs84_bounds(subset: RasterSubset) -> Tuple[float, float, float, float]:
+    height, width = subset.data.shape
+    rows = np.array([0, 0, height, height], dtype="float64")
+    cols = np.array([0, width, 0, width], dtype="float64")
+    xs, ys = subset.transform * (cols, rows)
+    if subset.crs is None or subset.crs.is_geographic:
+        return float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())
+    lons, lats = get_transformer(subset.crs.to_wkt(), WGS84).transform(xs, ys)
+    return float(min(lons)), float(min(lats)), float(max(lons)), float(max(lats))
@@ -0,0 +1,83 @@
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import time
+
+from app.utils.cube_utils import get_cube
+from app.utils.executor_utils import IO_EXECUTOR, run_io
+from app.utils.raster_utils import get_pixel_value
+from app.utils.url_utils import format_url
+
+# Per-date reads (one remote GeoTIFF open + one range read each) run on the
+# shared io pool, so they count against its queue bound like every other
+# raster read. This caps how many of them one request has in flight there,
+# so a multi-year query cannot queue ahead of everyone else's days.
+TIMESERIES_REQUEST_WORKERS = int(os.environ.get("TIMESERIES_REQUEST_WORKERS", "4"))
+# Upper bound on the whole batch; days not read by then are reported as timed out.
+TIMESERIES_TIMEOUT = float(os.environ.get("TIMESERIES_TIMEOUT", "120"))
+
+async def fetch_timeseries(
+    lat: float,
+    lon: float,
+    variable: str,
+    dates: List[str],
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Tuple[List[float], List[str], List[str]]:
+    """
+    Read the pixel at (lat, lon) for every date and return (values, dates,
+    timed_out_dates) in date order. Days with no file, nodata or a failed
+    read are skipped; days not read before the deadline are listed in
+    timed_out_dates instead. Days already ingested into the variable's
+    pixel cube are served from it; only the rest are read remotely on the io
+    pool, at most max_workers (default TIMESERIES_REQUEST_WORKERS) at a time.
+    Raises ExecutorBusy if the io pool's queue is full.
+    """
+    cube = get_cube(variable)
+    from_cube = await run_io(cube.history, lat, lon, dates) if cube is not None else {}
+    remote_dates = [date for date in dates if date not in from_cube]
+    from_remote, timed_out = await _fetch_remote(lat, lon, variable, remote_dates, max_workers, timeout)
+
+    values, valid_dates = [], []
+    for date in dates:
+        value = from_cube[date] if date in from_cube else from_remote.get(date)
+        if value is not None:
+            values.append(value)
+            valid_dates.append(date)
+    return values, valid_dates, timed_out
+
+async def _fetch_remote(lat, lon, variable, dates, max_workers, timeout) -> Tuple[Dict[str, Optional[float]], List[str]]:
+    """({date: value or None} for the dates read, dates not read before the deadline)."""
+    if not dates:
+        return {}, []
+    workers = max(1, TIMESERIES_REQUEST_WORKERS if max_workers is None else max_workers)
+    deadline = time.monotonic() + (TIMESERIES_TIMEOUT if timeout is None else timeout)
+    results = {}
+
+    # Sliding window over the shared pool: submit the next date as each read finishes
+    todo = list(reversed(dates))
+    in_flight = {}
+    try:
+        while todo or in_flight:
+            while todo and len(in_flight) < workers:
+                future = IO_EXECUTOR.submit(_read, format_url(todo[-1], variable), lat, lon)
+                in_flight[asyncio.wrap_future(future)] = todo.pop()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait(in_flight, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                results[in_flight.pop(future)] = future.result()
+    finally:
+        # Deadline passed, the pool refused a read or the client went away: drop queued reads
+        for future in in_flight:
+            future.cancel()
+    timed_out = sorted(set(in_flight.values()) | set(todo))
+    return results, timed_out
+
+def _read(url: str, lat: float, lon: float) -> Optional[float]:
+    try:
+        return get_pixel_value(url, lat, lon)
+    except Exception as e:
+        print(f"Unexpected error in fetch_timeseries: {str(e)}")
+        return None
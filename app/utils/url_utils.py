@@ -1,16 +1,27 @@
 from urllib.parse import quote
 import datetime
+import os
+
+# Root of the daily LIS_{date}_{variable}.tif layout. Overridable so the
+# benchmarks can point the API at a local copy of the bucket.
+LIS_DATA_BASE_URL = os.environ.get(
+    "LIS_DATA_BASE_URL", "https://storage.googleapis.com/lis-olci-netcdfs"
+).rstrip("/")
+
+# Cloud Storage endpoint that format_google_url rewrites bucket URLs against;
+# the benchmarks point it at a local stand-in serving the same paths.
+GCS_BASE_URL = os.environ.get("GCS_BASE_URL", "https://storage.googleapis.com").rstrip("/")
 
 def format_url(date: str, variable: str) -> str:
     dt = datetime.datetime.strptime(date, "%Y-%m-%d")
     path = dt.strftime("%Y/%m/%d")
     compact = dt.strftime("%Y%m%d")
-    return f"https://storage.googleapis.com/lis-olci-netcdfs/{path}/LIS_{compact}_{variable}.tif"
+    return f"{LIS_DATA_BASE_URL}/{path}/LIS_{compact}_{variable}.tif"
 
 def format_google_url(url: str) -> str:
-    if "storage.googleapis.com" in url and "/o/" not in url:
-        bucket_object = url.split("https://storage.googleapis.com/")[1]
+    if url.startswith(GCS_BASE_URL + "/") and "/o/" not in url:
+        bucket_object = url[len(GCS_BASE_URL) + 1:]
         bucket, *object_parts = bucket_object.split("/")
         object_path = quote("/".join(object_parts), safe='')
-        return f"https://storage.googleapis.com/download/storage/v1/b/{bucket}/o/{object_path}?alt=media"
+        return f"{GCS_BASE_URL}/download/storage/v1/b/{bucket}/o/{object_path}?alt=media"
     return url
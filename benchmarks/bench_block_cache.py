@@ -0,0 +1,59 @@
+"""
+Cold vs warm on-disk block cache for the point, transect, timeseries and
+polygon paths, against fixture rasters served by a local HTTP server.
+
+    python -m benchmarks.bench_block_cache --days 30
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+
+from benchmarks.common import FixtureServer, make_fixture_tree
+
+POLYGON = {"type": "Polygon", "coordinates": [[
+    [-73.2, 40.95], [-72.8, 40.95], [-72.8, 41.15], [-73.2, 41.15], [-73.2, 40.95]
+]]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+    dates = [(datetime.date(2022, 1, 1) + datetime.timedelta(days=i)).isoformat() for i in range(args.days)]
+
+    with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as cache_dir:
+        make_fixture_tree(root, dates)
+        with FixtureServer(root) as server:
+            os.environ["LIS_DATA_BASE_URL"] = server.url
+            os.environ["BLOCK_CACHE_DIR"] = cache_dir
+            from app.utils.block_cache import block_cache_stats
+            from app.utils.dataset_cache import DATASET_CACHE
+            from app.utils.polygon_utils import get_polygon_stats
+            from app.utils.raster_utils import get_pixel_value, get_transect_values
+            from app.utils.timeseries_utils import fetch_timeseries
+            from app.utils.url_utils import format_url
+
+            url = format_url(dates[0], "chl")
+            workloads = {
+                "point": lambda: get_pixel_value(url, 41.0, -73.0),
+                "transect": lambda: get_transect_values(url, 41.0, -73.5, 41.2, -72.0),
+                "timeseries": lambda: asyncio.run(fetch_timeseries(41.0, -73.0, "chl", dates)),
+                "polygon": lambda: get_polygon_stats(url, POLYGON),
+            }
+            for run in ("cold", "warm"):
+                for name, fn in workloads.items():
+                    # Drop open handles so every run re-reads headers through the cache
+                    DATASET_CACHE.clear()
+                    server.reset_stats()
+                    t0 = time.perf_counter()
+                    fn()
+                    elapsed = time.perf_counter() - t0
+                    stats = server.stats
+                    print(f"{run:>4} {name:>10}: {elapsed * 1e3:8.1f} ms  "
+                          f"{stats['requests']:4d} requests  {stats['bytes'] / 1e3:9.1f} kB from origin")
+            print(block_cache_stats())
+
+if __name__ == "__main__":
+    main()
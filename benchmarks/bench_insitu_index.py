@@ -0,0 +1,112 @@
+"""
+Per-request DataFrame scans vs the prebuilt InsituIndex on a synthetic
+multi-million-row in situ frame, for the date lookups and the spatial
+(bbox, nearest station, polygon) queries.
+
+    python -m benchmarks.bench_insitu_index --rows 3000000 --stations 20000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import Polygon, box
+
+from app.utils.insitu_utils import InsituIndex
+from app.utils.spatial_index import haversine_m
+
+def synthetic_insitu_frame(rows: int, seed: int = 0, stations: int = 0) -> pd.DataFrame:
+    """
+    Station samples spread over ~10 years with the gaps and sentinels seen in
+    the real pickle; stations > 0 repeats that many fixed positions.
+    """
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2016-01-01T00:00:00", "s")
+    seconds = rng.integers(0, 10 * 365 * 86400, rows)
+    if stations:
+        station = rng.integers(0, stations, rows)
+        lat, lon = rng.uniform(40.6, 41.3, stations)[station], rng.uniform(-73.8, -71.9, stations)[station]
+    else:
+        lat, lon = rng.uniform(40.6, 41.3, rows), rng.uniform(-73.8, -71.9, rows)
+    df = pd.DataFrame({
+        "date": pd.to_datetime(start + seconds.astype("timedelta64[s]")),
+        "lat": lat,
+        "lon": lon,
+    })
+    for var, scale in (("chl", 8.0), ("spm", 12.0), ("cdom", 1.5)):
+        values = rng.gamma(2.0, scale / 2.0, rows)
+        values[rng.random(rows) < 0.3] = np.nan
+        values[rng.random(rows) < 0.01] = -9999
+        df[var] = values
+    return df
+
+def scan_available_dates(df, variable):
+    mask = df[variable].notna() & (df[variable] != -9999) & df["date"].notna()
+    return sorted(d.isoformat() for d in df.loc[mask, "date"].dt.date.unique())
+
+def scan_insitu_data(df, variable, target_date):
+    filtered = df[(df["date"].dt.date == target_date) & df[variable].notna()]
+    return [
+        {"lat": float(row["lat"]), "lon": float(row["lon"]), "value": float(row[variable]),
+         "date": row["date"].isoformat(), "variable": variable}
+        for _, row in filtered.iterrows()
+    ]
+
+def timed(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - t0) / repeat, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--stations", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    df = synthetic_insitu_frame(args.rows, stations=args.stations)
+    build, index = timed(lambda: InsituIndex(df), 1)
+    print(f"rows={args.rows:,}  index build {build * 1e3:.0f} ms")
+
+    target = pd.Timestamp("2020-06-15").date()
+    scan_dates, dates = timed(lambda: scan_available_dates(df, "chl"), 1)
+    idx_dates, idx_dates_result = timed(lambda: index.available_dates("chl"), args.repeat)
+    assert dates == idx_dates_result
+    scan_rows, rows = timed(lambda: scan_insitu_data(df, "chl", target), 1)
+    idx_rows, idx_rows_result = timed(lambda: index.records("chl", target), args.repeat)
+    assert len(rows) >= len(idx_rows_result)
+
+    print(f"/get_available_dates  scan {scan_dates * 1e3:9.2f} ms   index {idx_dates * 1e3:9.4f} ms")
+    print(f"/get_insitu_data      scan {scan_rows * 1e3:9.2f} ms   index {idx_rows * 1e3:9.4f} ms"
+          f"   ({len(idx_rows_result)} rows)")
+
+    # Spatial queries against vectorized scans of every valid sample
+    spatial = index.spatial["chl"]
+    valid = df[df["chl"].notna() & (df["chl"] != -9999)]
+    lat, lon = valid["lat"].to_numpy(), valid["lon"].to_numpy()
+    day = valid["date"].to_numpy().astype("datetime64[D]")
+    west, south, east, north = -73.0, 40.9, -72.8, 41.0
+    in_bbox = lambda: (lon >= west) & (lon <= east) & (lat >= south) & (lat <= north)
+    polygon = Polygon([(-73.2, 40.8), (-72.5, 40.9), (-72.9, 41.2)])
+    shapely.prepare(polygon)
+    year_start, year_end = pd.Timestamp("2018-01-01").date(), pd.Timestamp("2018-12-31").date()
+    in_year = lambda: (day >= np.datetime64(year_start)) & (day <= np.datetime64(year_end))
+    queries = {
+        "bbox, all dates": (lambda: np.flatnonzero(in_bbox()),
+                            lambda: spatial.query_rows(box(west, south, east, north))),
+        "bbox, one day": (lambda: np.flatnonzero(in_bbox() & (day == np.datetime64(target))),
+                          lambda: spatial.query_rows(box(west, south, east, north), target, target)),
+        "nearest 10 stations": (lambda: np.argsort(haversine_m(-72.5, 41.0, lon, lat)),
+                                lambda: spatial.nearest(-72.5, 41.0, 10)),
+        "polygon, one year": (lambda: np.flatnonzero(shapely.contains_xy(polygon, lon, lat) & in_year()),
+                              lambda: spatial.query_rows(polygon, year_start, year_end)),
+    }
+    for label, (scan, lookup) in queries.items():
+        scan_time, _ = timed(scan, 1)
+        lookup_time, _ = timed(lookup, args.repeat * 10)
+        print(f"{label:<20} scan {scan_time * 1e3:9.2f} ms   index {lookup_time * 1e3:9.4f} ms")
+
+if __name__ == "__main__":
+    main()
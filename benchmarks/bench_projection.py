@@ -0,0 +1,57 @@
+"""
+Per-call cost of mapping WGS84 coordinates onto the LIS grid: rasterio.warp
+(a new GDAL transformer every call) vs the cached pyproj Transformer and
+precomputed inverse geotransform in app.utils.projection_utils.
+
+    python -m benchmarks.bench_projection --repeat 200
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+from rasterio.warp import transform, transform_geom
+
+from app.utils.projection_utils import grid_for
+from benchmarks.common import write_fixture_raster
+
+POLYGON = {"type": "Polygon", "coordinates": [[
+    [-73.2, 40.95], [-72.8, 40.95], [-72.8, 41.15], [-73.2, 41.15], [-73.2, 40.95]
+]]}
+
+def timed(fn, repeat):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".tif") as f:
+        write_fixture_raster(f.name)
+        with rasterio.open(f.name) as src:
+            rng = np.random.default_rng(0)
+
+            def warp_pixels(lons, lats):
+                xs, ys = transform("EPSG:4326", src.crs, list(lons), list(lats))
+                return ~src.transform * (np.asarray(xs), np.asarray(ys))
+
+            for label, n in (("point", 1), ("transect", 2), ("batch 1k", 1_000), ("batch 100k", 100_000)):
+                lons, lats = -74 + rng.random(n) * 2, 40.5 + rng.random(n)
+                before = timed(lambda: warp_pixels(lons, lats), args.repeat)
+                after = timed(lambda: grid_for(src).lonlat_to_pixel(lons, lats), args.repeat)
+                print(f"{label:>12}: warp {before * 1e6:10.1f} us  cached {after * 1e6:10.1f} us  "
+                      f"x{before / after:5.1f}")
+
+            before = timed(lambda: transform_geom("EPSG:4326", src.crs, POLYGON), args.repeat)
+            after = timed(lambda: grid_for(src).project_geometry(POLYGON), args.repeat)
+            print(f"{'polygon':>12}: warp {before * 1e6:10.1f} us  cached {after * 1e6:10.1f} us  "
+                  f"x{before / after:5.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Response serialization for the large array endpoints: FastAPI's default path
+(return-type validation, jsonable_encoder, json.dumps) vs ProfiledJSONResponse
+returned directly (orjson, NumPy arrays as is), for /get_insitu_data in both
+layouts, a multi-year /get_timeseries and a dense /get_transect.
+
+    python -m benchmarks.bench_serialization --rows 20000 --days 3650 --samples 5000
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.utils.insitu_utils import InsituIndex
+from app.utils.metrics_utils import ProfiledJSONResponse
+from benchmarks.bench_insitu_index import synthetic_insitu_frame
+
+def default_path(content, adapter=None) -> bytes:
+    """What FastAPI does with a plain dict returned from an endpoint (adapter: its return annotation)."""
+    if adapter is not None:
+        content = adapter.dump_python(adapter.validate_python(content), mode="json")
+    return JSONResponse(jsonable_encoder(content)).body
+
+def direct_path(content) -> bytes:
+    return ProfiledJSONResponse(content).body
+
+def timed(fn, repeat):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - t0) / repeat, result
+
+def report(label, before, after, before_body, after_body):
+    print(f"{label:>24}: default {before * 1e3:8.2f} ms ({len(before_body) / 1e3:7.0f} kB)   "
+          f"direct {after * 1e3:8.2f} ms ({len(after_body) / 1e3:7.0f} kB)   x{before / after:5.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20_000, help="in situ rows on the requested day")
+    parser.add_argument("--days", type=int, default=3650, help="timeseries length")
+    parser.add_argument("--samples", type=int, default=5000, help="transect samples")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    df = synthetic_insitu_frame(args.rows)
+    df["date"] = pd.Timestamp("2020-06-15") + pd.to_timedelta(np.arange(args.rows) % 86400, unit="s")
+    index = InsituIndex(df)
+    target = pd.Timestamp("2020-06-15").date()
+    records_adapter, any_adapter = TypeAdapter(Dict[str, List[Dict]]), TypeAdapter(Dict[str, Any])
+
+    before, before_body = timed(lambda: default_path({"data": index.records("chl", target)},
+                                                     records_adapter), args.repeat)
+    after, after_body = timed(lambda: direct_path({"data": index.records("chl", target)}), args.repeat)
+    assert json.loads(before_body) == json.loads(after_body)
+    report("insitu rows", before, after, before_body, after_body)
+
+    columns, columns_body = timed(lambda: direct_path({"data": index.columns("chl", target), "variable": "chl"}),
+                                  args.repeat)
+    decoded = json.loads(columns_body)["data"]
+    assert np.allclose(decoded["value"], [r["value"] for r in json.loads(before_body)["data"]], atol=1e-5)
+    report("insitu columns", before, columns, before_body, columns_body)
+
+    rng = np.random.default_rng(0)
+    dates = [str(d) for d in np.datetime64("2016-01-01") + np.arange(args.days)]
+    values = rng.gamma(2.0, 4.0, args.days).astype("float32").astype("float64").tolist()
+    content = {"values": values, "dates": dates, "location": {"lat": 41.0, "lon": -73.0}, "variable": "chl"}
+    before, before_body = timed(lambda: default_path(content, any_adapter), args.repeat)
+    after, after_body = timed(lambda: direct_path(content), args.repeat)
+    assert json.loads(before_body) == json.loads(after_body)
+    report(f"timeseries {args.days} days", before, after, before_body, after_body)
+
+    samples = rng.gamma(2.0, 4.0, args.samples).astype("float32").astype("float64")
+    distances = np.linspace(0.0, 150_000.0, args.samples)
+    points = {"start_point": {"lat": 40.6, "lon": -73.9}, "end_point": {"lat": 41.4, "lon": -72.1}}
+    before, before_body = timed(lambda: default_path({"values": samples.tolist(), "distances": distances.tolist(),
+                                                      **points}), args.repeat)
+    after, after_body = timed(lambda: direct_path({"values": samples, "distances": distances, **points}),
+                              args.repeat)
+    assert json.loads(before_body) == json.loads(after_body)
+    report(f"transect {args.samples} pts", before, after, before_body, after_body)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Serial vs parallel /get_timeseries reads against fixture rasters served over
+a local range-capable HTTP server.
+
+    python -m benchmarks.bench_timeseries --days 120 --latency 0.02
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+
+from benchmarks.common import FixtureServer, make_fixture_tree
+
+def date_range(start: datetime.date, days: int):
+    return [(start + datetime.timedelta(days=i)).isoformat() for i in range(days)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.02, help="per-request server delay (s)")
+    args = parser.parse_args()
+
+    # Each mode gets its own dates so GDAL's in-process /vsicurl/ cache can't
+    # hand the second run a warm start.
+    serial_dates = date_range(datetime.date(2022, 1, 1), args.days)
+    parallel_dates = date_range(datetime.date(2023, 1, 1), args.days)
+
+    with tempfile.TemporaryDirectory() as root:
+        make_fixture_tree(root, serial_dates + parallel_dates, missing_every=7)
+        with FixtureServer(root, latency=args.latency) as server:
+            os.environ["LIS_DATA_BASE_URL"] = server.url
+            from app.utils.timeseries_utils import fetch_timeseries
+
+            for label, dates, workers in (
+                ("serial", serial_dates, 1),
+                ("parallel", parallel_dates, args.workers),
+            ):
+                server.reset_stats()
+                t0 = time.perf_counter()
+                values, valid, timed_out = asyncio.run(
+                    fetch_timeseries(41.0, -73.0, "chl", dates, max_workers=workers)
+                )
+                elapsed = time.perf_counter() - t0
+                assert valid == sorted(valid) and not timed_out
+                stats = server.stats
+                print(f"{label:>8}: {elapsed:7.2f}s  {len(valid)}/{len(dates)} days  "
+                      f"{stats['requests']} requests  {stats['bytes'] / 1e6:.2f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Shared fixtures for the benchmarks: synthetic LIS-grid GeoTIFFs laid out like
+the lis-olci-netcdfs bucket, a synthetic in situ pickle, a local HTTP server
+that honours Range requests (and the Cloud Storage download paths
+format_google_url produces) so GDAL's /vsicurl/ reader behaves as it does
+against GCS, and helpers to run the API against it in a subprocess.
+"""
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote
+import datetime
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import rasterio
+import requests
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+
+# Approximate LIS grid: UTM 18N, 300 m OLCI pixels covering the Sound.
+LIS_CRS = "EPSG:32618"
+LIS_TRANSFORM = from_origin(580000.0, 4580000.0, 300.0, 300.0)
+LIS_SHAPE = (320, 640)
+NODATA = -9999.0
+BUCKET = "lis-olci-netcdfs"
+
+# Raster layouts the suite compares: GDAL reads strips and tiles differently,
+# and overviews change what zoomed-out subsets fetch.
+FIXTURE_VARIANTS = {
+    "tiled": {"tiled": True},
+    "untiled": {"tiled": False},
+    "overviews": {"tiled": True, "overviews": True},
+}
+
+def fixture_path(root, date: str, variable: str) -> Path:
+    dt = datetime.datetime.strptime(date, "%Y-%m-%d")
+    return Path(root) / dt.strftime("%Y/%m/%d") / f"LIS_{dt:%Y%m%d}_{variable}.tif"
+
+def write_fixture_raster(path, seed: int = 0, tiled: bool = True, overviews: bool = False):
+    """Write one synthetic daily raster with a nodata 'land' margin."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    height, width = LIS_SHAPE
+    yy, xx = np.mgrid[0:height, 0:width]
+    data = (5 + 3 * np.sin(xx / 40.0 + seed) + np.cos(yy / 25.0)
+            + rng.normal(0, 0.25, LIS_SHAPE)).astype("float32")
+    data[:20, :] = NODATA
+    data[:, :15] = NODATA
+    profile = dict(
+        driver="GTiff", height=height, width=width, count=1, dtype="float32",
+        crs=LIS_CRS, transform=LIS_TRANSFORM, nodata=NODATA, compress="deflate",
+    )
+    if tiled:
+        profile.update(tiled=True, blockxsize=256, blockysize=256)
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+        if overviews:
+            dst.build_overviews([2, 4, 8], rasterio.enums.Resampling.average)
+            dst.update_tags(ns="rio_overview", resampling="average")
+    return path
+
+def make_fixture_tree(root, dates, variables=("chl",), missing_every: int = 0, **kwargs):
+    """Populate root with LIS_{date}_{variable}.tif files; optionally skip every Nth day."""
+    for i, date in enumerate(dates):
+        if missing_every and i % missing_every == missing_every - 1:
+            continue
+        for variable in variables:
+            write_fixture_raster(fixture_path(root, date, variable), seed=i, **kwargs)
+    return Path(root)
+
+def fixture_lonlats(count: int, seed: int = 0):
+    """Random WGS84 (lons, lats) over the fixture grid's data area (inside its nodata margin)."""
+    rng = np.random.default_rng(seed)
+    height, width = LIS_SHAPE
+    rows = rng.uniform(25, height - 5, count)
+    cols = rng.uniform(20, width - 5, count)
+    from app.utils.projection_utils import Grid
+    return Grid(CRS.from_user_input(LIS_CRS), LIS_TRANSFORM, LIS_SHAPE).pixel_to_lonlat(rows, cols)
+
+def write_insitu_pickle(path, dates, stations: int = 200, samples_per_day: int = 40, seed: int = 0):
+    """
+    Synthetic in situ pickle shaped like the real one: repeated station
+    positions, string dates with times, some values wrapped in one-item
+    lists, NaNs and -9999 sentinels.
+    """
+    rng = np.random.default_rng(seed)
+    lons, lats = fixture_lonlats(stations, seed)
+    rows = len(dates) * samples_per_day
+    station = rng.integers(0, stations, rows)
+    seconds = rng.integers(8 * 3600, 18 * 3600, rows)
+    day = np.repeat(np.array(dates, dtype="datetime64[s]"), samples_per_day)
+    df = pd.DataFrame({
+        "date": np.datetime_as_string(day + seconds.astype("timedelta64[s]"), unit="s"),
+        "lat": lats[station],
+        "lon": lons[station],
+    })
+    for var, scale in (("chl", 6.0), ("spm", 10.0), ("cdom", 1.5)):
+        values = rng.gamma(2.0, scale / 2.0, rows).astype(object)
+        values[rng.random(rows) < 0.1] = np.nan
+        values[rng.random(rows) < 0.01] = NODATA
+        df[var] = [[v] if wrap else v for v, wrap in zip(values, rng.random(rows) < 0.2)]
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_pickle(path)
+    return path
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Static file handler with single-range support and transfer accounting."""
+
+    # Shared multiprocessing counters, set by FixtureServer.
+    counters = None
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, nbytes):
+        requests, nbytes_total = self.counters
+        with requests.get_lock():
+            requests.value += 1
+        with nbytes_total.get_lock():
+            nbytes_total.value += nbytes
+
+    def send_head(self):
+        path = self.path.split("?", 1)[0]
+        # Cloud Storage JSON API download: /download/storage/v1/b/<bucket>/o/<quoted object>
+        match = re.match(r"/download/storage/v1/b/([^/]+)/o/(.+)$", path)
+        if match:
+            path = f"/{match.group(1)}/{unquote(match.group(2))}"
+        path = self.translate_path(path)
+        if not os.path.isfile(path):
+            self._count(0)
+            self.send_error(404)
+            return None
+        if self.latency:
+            time.sleep(self.latency)
+        st = os.stat(path)
+        size = st.st_size
+        f = open(path, "rb")
+        match = re.match(r"bytes=(\d*)-(\d*)$", self.headers.get("Range", ""))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            else:
+                start, end = max(0, size - int(match.group(2))), size - 1
+            if start >= size:
+                f.close()
+                self._count(0)
+                self.send_error(416)
+                return None
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            length = end - start + 1
+            f.seek(start)
+        else:
+            self.send_response(200)
+            length = size
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.send_header("ETag", f'"{st.st_mtime_ns:x}-{size:x}"')
+        self.send_header("Last-Modified", self.date_time_string(st.st_mtime))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self._remaining = length
+        self._count(length if self.command != "HEAD" else 0)
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = self._remaining
+        while remaining > 0:
+            chunk = source.read(min(65536, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+def _serve(root, port, counters, latency, ready):
+    handler = type("Handler", (RangeRequestHandler,), {"counters": counters, "latency": latency})
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), lambda *a: handler(*a, directory=str(root)))
+    ready.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+class FixtureServer:
+    """
+    Serve a directory over HTTP on a free localhost port.
+
+    The server runs in a child process: GDAL holds the GIL while it waits on
+    /vsicurl/ responses, so an in-process server thread would deadlock.
+    """
+
+    def __init__(self, root, latency: float = 0.0):
+        self.root = root
+        self.latency = latency
+        self.counters = (multiprocessing.Value("q", 0), multiprocessing.Value("q", 0))
+        self._process = None
+        self.url = None
+
+    @property
+    def stats(self):
+        requests, nbytes = self.counters
+        return {"requests": requests.value, "bytes": nbytes.value}
+
+    def reset_stats(self):
+        for counter in self.counters:
+            with counter.get_lock():
+                counter.value = 0
+
+    def __enter__(self):
+        ready = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(self.root, 0, self.counters, self.latency, ready), daemon=True
+        )
+        self._process.start()
+        self.url = f"http://127.0.0.1:{ready.get(timeout=30)}"
+        return self
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        self._process.join()
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def api_env(server: FixtureServer, cache_dir, **overrides) -> dict:
+    """
+    Environment pointing the API at server: format_url at the fixture bucket,
+    format_google_url at the server as the Cloud Storage endpoint, the in situ
+    pickle at insitu.pkl in its root, caches under cache_dir.
+    """
+    env = {
+        "LIS_DATA_BASE_URL": f"{server.url}/{BUCKET}",
+        "GCS_BASE_URL": server.url,
+        "INSITU_PICKLE_URL": f"{server.url}/insitu.pkl",
+        "INSITU_CACHE_DIR": os.path.join(cache_dir, "insitu"),
+        "INSITU_REFRESH_SECONDS": "0",
+        "BLOCK_CACHE_DIR": os.path.join(cache_dir, "blocks"),
+    }
+    env.update(overrides)
+    return env
+
+def start_api(port, env, quiet: bool = False) -> subprocess.Popen:
+    # Own process group, so teardown also reaches the cpu pool and cache proxy
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **env}, start_new_session=True,
+        stderr=subprocess.DEVNULL if quiet else None,
+    )
+
+def stop_api(api: subprocess.Popen):
+    os.killpg(api.pid, signal.SIGTERM)
+    try:
+        api.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(api.pid, signal.SIGKILL)
+        api.wait()
+
+def wait_ready(base, timeout=60, path="/cache_stats"):
+    """Wait until GET base + path answers 200."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base}{path}", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"API did not answer {path}")
@@ -0,0 +1,105 @@
+"""
+/get_value latency under load, alone and while polygon stats jobs run, against
+the API served by uvicorn in a subprocess and fixture rasters served locally.
+
+    python -m benchmarks.load_get_value --seconds 10 --point-clients 8 --polygon-clients 4
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+from benchmarks.common import (
+    FixtureServer, free_port, make_fixture_tree, start_api, stop_api, wait_ready
+)
+
+# Covers most of the fixture grid, so each job reads and masks every tile
+POLYGON = {"type": "Polygon", "coordinates": [[
+    [-74.0, 40.4], [-71.8, 40.4], [-71.8, 41.3], [-74.0, 41.3], [-74.0, 40.4]
+]]}
+
+def _loop(stop, fn, latencies, statuses):
+    session = requests.Session()
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        status = fn(session)
+        latencies.append(time.perf_counter() - t0)
+        statuses[status] = statuses.get(status, 0) + 1
+
+def run_phase(base, urls, seconds, point_clients, polygon_clients):
+    rng = np.random.default_rng(0)
+    stop = threading.Event()
+    point_latencies, point_statuses = [], {}
+    polygon_latencies, polygon_statuses = [], {}
+
+    def point(session):
+        url = urls[rng.integers(len(urls))]
+        lat, lon = 40.6 + rng.random() * 0.5, -73.8 + rng.random() * 1.8
+        return session.get(f"{base}/get_value", params={"url": url, "lat": lat, "lon": lon}).status_code
+
+    def polygon(session):
+        url = urls[rng.integers(len(urls))]
+        return session.post(f"{base}/get_polygon_stats", json={"url": url, "polygon": POLYGON}).status_code
+
+    threads = [threading.Thread(target=_loop, args=(stop, point, point_latencies, point_statuses))
+               for _ in range(point_clients)]
+    threads += [threading.Thread(target=_loop, args=(stop, polygon, polygon_latencies, polygon_statuses))
+                for _ in range(polygon_clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return (point_latencies, point_statuses), (polygon_latencies, polygon_statuses)
+
+def report(label, latencies, statuses, seconds):
+    if not latencies:
+        print(f"{label:>22}: no requests")
+        return
+    ms = np.asarray(latencies) * 1e3
+    print(f"{label:>22}: {len(ms) / seconds:7.1f} req/s  p50 {np.percentile(ms, 50):7.1f} ms  "
+          f"p99 {np.percentile(ms, 99):7.1f} ms  max {ms.max():7.1f} ms  status {statuses}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--days", type=int, default=8)
+    parser.add_argument("--point-clients", type=int, default=8)
+    parser.add_argument("--polygon-clients", type=int, default=4)
+    args = parser.parse_args()
+    dates = [(datetime.date(2022, 1, 1) + datetime.timedelta(days=i)).isoformat() for i in range(args.days)]
+
+    with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as cache_dir:
+        make_fixture_tree(root, dates)
+        with FixtureServer(root) as server:
+            env = {"LIS_DATA_BASE_URL": server.url, "BLOCK_CACHE_DIR": cache_dir,
+                   "INSITU_PICKLE_URL": f"{server.url}/missing.pkl", "INSITU_REFRESH_SECONDS": "0"}
+            port = free_port()
+            api = start_api(port, env)
+            try:
+                base = f"http://127.0.0.1:{port}"
+                wait_ready(base)
+                os.environ["LIS_DATA_BASE_URL"] = server.url
+                from app.utils.url_utils import format_url
+                urls = [format_url(d, "chl") for d in dates]
+                # Warm handles and the block cache so both phases measure the serving path
+                run_phase(base, urls, 2, args.point_clients, 1)
+
+                (points, statuses), _ = run_phase(base, urls, args.seconds, args.point_clients, 0)
+                report("get_value alone", points, statuses, args.seconds)
+                (points, statuses), (polygons, poly_statuses) = run_phase(
+                    base, urls, args.seconds, args.point_clients, args.polygon_clients
+                )
+                report("get_value + polygons", points, statuses, args.seconds)
+                report("get_polygon_stats", polygons, poly_statuses, args.seconds)
+            finally:
+                stop_api(api)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Reproducible end-to-end benchmark suite. For each fixture layout (tiled,
+untiled, tiled with overviews) and each endpoint, starts the API in a fresh
+subprocess against synthetic rasters and a synthetic in situ pickle served by
+the local range server. It then times a cold pass of distinct requests and a
+warm replay of the same ones.
+
+Each pass records:
+- latency percentiles and throughput
+- upstream requests and bytes (counted by the range server)
+- raster bytes read (X-Raster-Bytes-Read)
+- response bytes
+- resident memory of the API process group
+
+Results are written as JSON; --compare flags regressions against an earlier run.
+
+    python -m benchmarks.suite --out bench.json
+    python -m benchmarks.suite --variants tiled --endpoints get_value,get_timeseries --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from benchmarks.common import (
+    BUCKET, FIXTURE_VARIANTS, FixtureServer, api_env, fixture_lonlats, free_port, make_fixture_tree,
+    start_api, stop_api, wait_ready, write_insitu_pickle
+)
+
+def _polygon(lon, lat, size=0.08):
+    return {"type": "Polygon", "coordinates": [[
+        [lon - size, lat - size], [lon + size, lat - size], [lon + size, lat + size],
+        [lon - size, lat + size], [lon - size, lat - size]
+    ]]}
+
+def _endpoints(ctx):
+    """
+    name -> fn(i, rng) returning (method, path, params, json body) for the
+    i-th distinct request; ctx holds the fixture dates, raster urls and points.
+    """
+    dates, urls = ctx["dates"], ctx["urls"]
+
+    def point(rng):
+        k = rng.integers(len(ctx["lons"]))
+        return float(ctx["lons"][k]), float(ctx["lats"][k])
+
+    def get_value(i, rng):
+        lon, lat = point(rng)
+        return "GET", "/get_value", {"url": urls[i % len(urls)], "lat": lat, "lon": lon}, None
+
+    def get_values(i, rng):
+        points = [dict(zip(("lon", "lat"), point(rng))) for _ in range(500)]
+        return "POST", "/get_values", None, {"url": urls[i % len(urls)], "points": points}
+
+    def get_transect(i, rng):
+        (lon0, lat0), (lon1, lat1) = point(rng), point(rng)
+        return "GET", "/get_transect", {"url": urls[i % len(urls)], "start_lat": lat0, "start_lon": lon0,
+                                        "end_lat": lat1, "end_lon": lon1}, None
+
+    def get_timeseries(i, rng):
+        lon, lat = point(rng)
+        return "GET", "/get_timeseries", {"lat": lat, "lon": lon, "variable": "chl",
+                                          "start_date": dates[0], "end_date": dates[-1]}, None
+
+    def get_polygon_stats(i, rng):
+        return "POST", "/get_polygon_stats", None, {"url": urls[i % len(urls)], "polygon": _polygon(*point(rng))}
+
+    def get_polygon_timeseries(i, rng):
+        return "POST", "/get_polygon_timeseries", None, {"polygon": _polygon(*point(rng)), "variable": "chl",
+                                                         "start_date": dates[0], "end_date": dates[-1]}
+
+    def get_subset(i, rng):
+        lon, lat = point(rng)
+        bbox = f"{lon - 0.4},{lat - 0.2},{lon + 0.4},{lat + 0.2}"
+        return "GET", "/get_subset", {"url": urls[i % len(urls)], "bbox": bbox, "zoom": 8 + i % 3,
+                                      "format": "png"}, None
+
+    def get_composite(i, rng):
+        lon, lat = point(rng)
+        bbox = f"{lon - 0.3},{lat - 0.15},{lon + 0.3},{lat + 0.15}"
+        return "GET", "/get_composite", {"variable": "chl", "start_date": dates[0], "end_date": dates[-1],
+                                         "bbox": bbox, "stats": "mean,std,count", "format": "json"}, None
+
+    def get_insitu_data(i, rng):
+        return "GET", "/get_insitu_data", {"variable": "chl", "date": dates[i % len(dates)]}, None
+
+    def get_insitu_in_bbox(i, rng):
+        lon, lat = point(rng)
+        return "GET", "/get_insitu_in_bbox", {"variable": "chl", "bbox": f"{lon - 0.2},{lat - 0.1},{lon + 0.2},{lat + 0.1}",
+                                              "layout": "columns"}, None
+
+    def get_matchups(i, rng):
+        return "GET", "/get_matchups", {"variable": "chl", "start_date": dates[0], "end_date": dates[-1],
+                                        "window": 3 + 2 * (i % 2), "max_cv": 0.3}, None
+
+    return {fn.__name__: fn for fn in (
+        get_value, get_values, get_transect, get_timeseries, get_polygon_stats, get_polygon_timeseries,
+        get_subset, get_composite, get_insitu_data, get_insitu_in_bbox, get_matchups,
+    )}
+
+def process_group_rss(pgid: int) -> int:
+    """Resident bytes of every process in a process group (API, cpu workers, cache proxy)."""
+    total = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[2]) != pgid:
+                continue
+            with open(f"/proc/{entry}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+class MemorySampler:
+    """Peak process group RSS while a pass runs, sampled every interval seconds."""
+
+    def __init__(self, pgid: int, interval: float = 0.05):
+        self.pgid = pgid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, process_group_rss(self.pgid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def _send(session, base, call):
+    method, path, params, body = call
+    t0 = time.perf_counter()
+    response = session.request(method, f"{base}{path}", params=params, json=body,
+                               headers={"x-profile": "1"}, timeout=600)
+    content = response.content
+    return (time.perf_counter() - t0, response.status_code, len(content),
+            int(response.headers.get("X-Raster-Bytes-Read", 0)))
+
+def run_pass(base, calls, concurrency, server, pgid) -> dict:
+    """Send calls with concurrency clients; latency, throughput, transfer and memory for the pass."""
+    sessions = threading.local()
+
+    def send(call):
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        return _send(sessions.session, base, call)
+
+    server.reset_stats()
+    with MemorySampler(pgid) as memory, ThreadPoolExecutor(concurrency) as pool:
+        t0 = time.perf_counter()
+        results = list(pool.map(send, calls))
+        wall = time.perf_counter() - t0
+    latencies = np.array([r[0] for r in results]) * 1e3
+    statuses = {}
+    for r in results:
+        statuses[str(r[1])] = statuses.get(str(r[1]), 0) + 1
+    upstream = server.stats
+    return {
+        "requests": len(results),
+        "statuses": statuses,
+        "latency_ms": {
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p90": float(np.percentile(latencies, 90)),
+            "p99": float(np.percentile(latencies, 99)),
+            "max": float(latencies.max()),
+        },
+        "throughput_rps": len(results) / wall,
+        "upstream_requests": upstream["requests"],
+        "upstream_bytes": upstream["bytes"],
+        "raster_bytes_read": sum(r[3] for r in results),
+        "response_bytes": sum(r[2] for r in results),
+        "rss_mb": process_group_rss(pgid) / 2 ** 20,
+        "peak_rss_mb": memory.peak / 2 ** 20,
+    }
+
+def bench_endpoint(name, make_call, server, cache_root, args) -> dict:
+    """One endpoint on a fresh API process: startup memory, cold pass, warm replay."""
+    with tempfile.TemporaryDirectory(dir=cache_root) as cache_dir:
+        env = api_env(server, cache_dir)
+        if not args.response_cache:
+            env["RESPONSE_CACHE_MB"] = "0"
+        port = free_port()
+        api = start_api(port, env, quiet=not args.verbose)
+        try:
+            base = f"http://127.0.0.1:{port}"
+            wait_ready(base)
+            wait_ready(base, path="/get_available_dates?variable=chl")  # in situ loaded
+            rng = np.random.default_rng(args.seed)
+            calls = [make_call(i, rng) for i in range(args.requests)]
+            result = {"startup_rss_mb": process_group_rss(api.pid) / 2 ** 20}
+            result["cold"] = run_pass(base, calls, args.concurrency, server, api.pid)
+            result["warm"] = run_pass(base, calls, args.concurrency, server, api.pid)
+            return result
+        finally:
+            stop_api(api)
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def compare(results: dict, baseline: dict, threshold: float) -> int:
+    """Print changes against baseline; the number of metrics that regressed by more than threshold."""
+    regressions = 0
+    for variant, endpoints in results["results"].items():
+        for name, result in endpoints.items():
+            base = baseline.get("results", {}).get(variant, {}).get(name)
+            if base is None:
+                continue
+            for phase in ("cold", "warm"):
+                for label, get in (("p50", lambda r: r["latency_ms"]["p50"]),
+                                   ("p99", lambda r: r["latency_ms"]["p99"]),
+                                   ("upstream_bytes", lambda r: r["upstream_bytes"]),
+                                   ("peak_rss_mb", lambda r: r["peak_rss_mb"])):
+                    before, after = get(base[phase]), get(result[phase])
+                    if not before:
+                        continue
+                    change = (after - before) / before
+                    flag = ""
+                    if change > threshold:
+                        flag = "  REGRESSION"
+                        regressions += 1
+                    print(f"{variant:>9} {name:<24} {phase:<4} {label:<14} {before:12.1f} -> {after:12.1f} "
+                          f"({change:+6.1%}){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="bench.json", help="JSON results file")
+    parser.add_argument("--variants", default=",".join(FIXTURE_VARIANTS))
+    parser.add_argument("--endpoints", default=None, help="comma-separated; all if omitted")
+    parser.add_argument("--days", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=30, help="distinct requests per pass")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.005, help="per-request range server delay (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--response-cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--verbose", action="store_true", help="show the API's log output")
+    parser.add_argument("--compare", default=None, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    dates = [(datetime.date(2022, 1, 1) + datetime.timedelta(days=i)).isoformat() for i in range(args.days)]
+    lons, lats = fixture_lonlats(200, seed=args.seed + 1)
+    output = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as work:
+        for variant in args.variants.split(","):
+            root = Path(work) / variant
+            make_fixture_tree(root / BUCKET, dates, **FIXTURE_VARIANTS[variant])
+            write_insitu_pickle(root / "insitu.pkl", dates, seed=args.seed)
+            with FixtureServer(root, latency=args.latency) as server:
+                # Raster urls as the map client sends them: bucket URLs under the Cloud Storage endpoint
+                urls = [f"{server.url}/{BUCKET}/{d[:4]}/{d[5:7]}/{d[8:]}/LIS_{d.replace('-', '')}_chl.tif"
+                        for d in dates]
+                endpoints = _endpoints({"dates": dates, "urls": urls, "lons": lons, "lats": lats})
+                selected = args.endpoints.split(",") if args.endpoints else list(endpoints)
+                results = output["results"][variant] = {}
+                for name in selected:
+                    result = results[name] = bench_endpoint(name, endpoints[name], server, work, args)
+                    cold, warm = result["cold"], result["warm"]
+                    print(f"{variant:>9} {name:<24} cold p50 {cold['latency_ms']['p50']:8.1f} ms "
+                          f"p99 {cold['latency_ms']['p99']:8.1f} ms {cold['throughput_rps']:6.1f} req/s "
+                          f"{cold['upstream_bytes'] / 1e6:7.2f} MB up | warm p50 {warm['latency_ms']['p50']:8.1f} ms "
+                          f"{warm['throughput_rps']:6.1f} req/s | peak {cold['peak_rss_mb']:6.0f} MB "
+                          f"statuses {cold['statuses']}", flush=True)
+
+    with open(args.out, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(output, baseline, args.threshold)
+        print(f"{regressions} regression(s) over {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
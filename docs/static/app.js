@@ -115,6 +115,7 @@ const timeseriesBackendURL = "https://olci-api-372215495851.us-central1.run.app/
 const insituDataBackendURL = "https://olci-api-372215495851.us-central1.run.app/get_insitu_data";
 const availableDatesBackendURL = "https://olci-api-372215495851.us-central1.run.app/get_available_dates";
 const polygonBackendURL = "https://olci-api-372215495851.us-central1.run.app/get_polygon_stats";
+const subsetBackendURL = "https://olci-api-372215495851.us-central1.run.app/get_subset";
 
 // for development
 // const backendURL = "http://localhost:8080/get_value";
@@ -123,6 +124,7 @@ const polygonBackendURL = "https://olci-api-372215495851.us-central1.run.app/get
 // const insituDataBackendURL = "http://localhost:8080/get_insitu_data";
 // const availableDatesBackendURL = "http://localhost:8080/get_available_dates";
 // const polygonBackendURL = "http://localhost:8080/get_polygon_stats";
+// const subsetBackendURL = "http://localhost:8080/get_subset";
 
 const variableSettings = {
   cdom: { max: 12, units: "m⁻¹", label: "CDOM", field: "cdom" },
@@ -267,6 +269,8 @@ yesterday.setDate(now.getDate() - 1);
 let currentMonth = now.getMonth(); // 0-indexed (0=January, 11=December)
 let currentYear = now.getFullYear(); 
 let currentLayer = null;
+let loadedRasterView = null; // { bounds, zoom } of the subset behind currentLayer
+let rasterRequest = null; // AbortController of the latest loadRasterLayer call
 let currentVariable = "cdom";
 let currentColormap = "turbo";
 let currentDate = yesterday.toISOString().split('T')[0]; // Yesterday's date
@@ -536,7 +540,7 @@ async function getTransectData() {
     const data = await response.json();
     
     if (response.ok && data.values) {
-      const formattedDistances = data.distances.map(d => parseFloat(d).toFixed(1));
+      const formattedDistances = data.distances.map(d => (parseFloat(d) / 1000).toFixed(1));
       plotGraph(data.values, formattedDistances, 'Transect Profile', 'transect');
     } else {
       alert('Error getting transect data');
@@ -1049,63 +1053,7 @@ async function loadVariable(variable) {
     updateColorbarTicks(max);
     console.log("Colorbar updated successfully");
 
-    const cacheBuster = Date.now();
-    const fullURL = `${baseURL}/${path}/LIS_${compact}_${variable}.tif?cacheBust=${cacheBuster}`;
-    console.log(`Fetching from URL: ${fullURL}`);
-
-        // Remove all previous GeoRasterLayer instances
-    for (const id in map._layers) {
-      const layer = map._layers[id];
-      // Check if this layer is a GeoRasterLayer (or any custom layer you want to remove)
-      if (layer && layer.georasters) { 
-        console.log("Removing old GeoRasterLayer:", layer);
-        await map.removeLayer(layer);
-      }
-    }
-
-
-
-    console.log("Starting fetch request");
-    const response = await fetch(fullURL);
-    console.log(`Fetch response status: ${response.status}`);
-    
-    if (!response.ok) {
-      throw new Error(`HTTP ${response.status}`);
-    }
-    console.log("Fetch completed successfully");
-
-    console.log("Converting response to arrayBuffer");
-    const arrayBuffer = await response.arrayBuffer();
-    console.log(`ArrayBuffer received (size: ${arrayBuffer.byteLength} bytes)`);
-
-    console.log("Parsing GeoRaster");
-    const georaster = await parseGeoraster(arrayBuffer);
-    console.log("GeoRaster parsed successfully");
-    console.log("INSPECTING GEORASTER:", georaster);
-
-    console.log("Creating new GeoRasterLayer");
-    currentLayer = new GeoRasterLayer({
-      georaster: georaster,
-      opacity: 1,
-      resolution: 256,
-      pixelValuesToColorFn: values => {
-        const val = values[0];
-        return val === null || val === -9999 ? null : colormaps[currentColormap](val, max);
-      }
-    });
-
-    console.log("GeoRasterLayer created");
-    console.log("Adding layer for date:", currentDate);
-    console.log("Current layer:", currentLayer)
-
-    currentLayer.addTo(map);
-    
-
-    console.log(currentLayer._map); // Should reference your map instance
-    console.log("Tiles:", currentLayer._tiles); // Should show loaded tiles
-    console.log("Layer added to map");
-    console.log("Map layers:", map._layers);
-
+    await loadRasterLayer(variable, max);
 
     document.getElementById("colorbar-label").innerText = `${label} (${units})`;
     document.getElementById("colorbar").style.background = generateColorbarGradient(colormaps[currentColormap], max);
@@ -1150,6 +1098,71 @@ async function loadVariable(variable) {
 }
 
 
+// Fetch the current view of the scene from the subset endpoint (padded so
+// small pans don't refetch), decimated for the zoom level, and render it.
+// Responses carry an ETag, so revisiting a date/view is served from cache.
+// Each call aborts the one before it, and a call that has been superseded
+// returns without touching the map, so a slow response for an old view or
+// date can never replace a newer one.
+async function loadRasterLayer(variable, max) {
+  if (rasterRequest) rasterRequest.abort();
+  const request = rasterRequest = new AbortController();
+
+  const { path, compact } = parseDate(currentDate);
+  const sceneURL = `${baseURL}/${path}/LIS_${compact}_${variable}.tif`;
+  const bounds = map.getBounds().pad(0.5);
+  const zoom = map.getZoom();
+  const bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].map(v => v.toFixed(4)).join(",");
+  const fullURL = `${subsetBackendURL}?url=${encodeURIComponent(sceneURL)}&bbox=${bbox}&zoom=${zoom}&format=tif`;
+  console.log(`Fetching from URL: ${fullURL}`);
+
+  let georaster;
+  try {
+    const response = await fetch(fullURL, { signal: request.signal });
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}`);
+    }
+    const arrayBuffer = await response.arrayBuffer();
+    console.log(`ArrayBuffer received (size: ${arrayBuffer.byteLength} bytes)`);
+    georaster = await parseGeoraster(arrayBuffer);
+  } catch (err) {
+    // Aborted or failed after a newer call took over: that call reports its own errors
+    if (request !== rasterRequest) return;
+    throw err;
+  }
+  if (request !== rasterRequest) return;
+
+  // Remove all previous GeoRasterLayer instances
+  for (const id in map._layers) {
+    const layer = map._layers[id];
+    if (layer && layer.georasters) {
+      await map.removeLayer(layer);
+    }
+  }
+
+  currentLayer = new GeoRasterLayer({
+    georaster: georaster,
+    opacity: 1,
+    resolution: 256,
+    pixelValuesToColorFn: values => {
+      const val = values[0];
+      return val === null || val === -9999 ? null : colormaps[currentColormap](val, max);
+    }
+  });
+  currentLayer.addTo(map);
+  loadedRasterView = { bounds, zoom };
+  console.log("Layer added to map for date:", currentDate);
+}
+
+// Refetch when the view leaves the loaded subset or zooms in past its resolution
+map.on('moveend', () => {
+  if (!currentLayer || !loadedRasterView) return;
+  if (map.getZoom() > loadedRasterView.zoom || !loadedRasterView.bounds.contains(map.getBounds())) {
+    loadRasterLayer(currentVariable, variableSettings[currentVariable].max)
+      .catch(err => console.error("Error refreshing raster view:", err));
+  }
+});
+
 // Event listeners
 document.getElementById("variable-select").addEventListener("change", e => {
   loadVariable(e.target.value);
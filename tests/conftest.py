@@ -0,0 +1,88 @@
+"""
+Regression tests for the numeric and caching building blocks and the HTTP
+routes, against the synthetic fixtures in benchmarks/common.py. Run from the
+repo root:
+
+    python -m pytest tests
+"""
+import datetime
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read at import time by app.utils (and by the block cache proxy process it
+# spawns): keep the tests' caches out of the shared temp dirs, and trust an
+# object's version briefly so republishing tests don't have to wait long.
+_scratch = tempfile.mkdtemp(prefix="lis-tests-")
+os.environ.setdefault("BLOCK_CACHE_DIR", os.path.join(_scratch, "blocks"))
+os.environ.setdefault("BLOCK_CACHE_REVALIDATE_SECONDS", "1")
+os.environ.setdefault("INSITU_CACHE_DIR", os.path.join(_scratch, "insitu"))
+
+from benchmarks.common import (  # noqa: E402
+    LIS_CRS, LIS_SHAPE, LIS_TRANSFORM, FixtureServer, make_fixture_tree, write_fixture_raster, write_insitu_pickle
+)
+
+DATES = [(datetime.date(2022, 1, 1) + datetime.timedelta(days=i)).isoformat() for i in range(6)]
+
+def pixel_lonlat(row, col):
+    """WGS84 (lon, lat) of a fixture grid pixel's centre."""
+    from rasterio.crs import CRS
+    from app.utils.projection_utils import Grid
+    lons, lats = Grid(CRS.from_user_input(LIS_CRS), LIS_TRANSFORM, LIS_SHAPE).pixel_to_lonlat(row + 0.5, col + 0.5)
+    return float(lons), float(lats)
+
+def pixel(path, row, col):
+    import rasterio
+    with rasterio.open(path) as src:
+        return float(src.read(1)[row, col])
+
+def republish(path, seed):
+    """Rewrite a fixture raster with new values under a new version (mtime)."""
+    write_fixture_raster(path, seed=seed)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+@pytest.fixture(scope="session")
+def raster_root(tmp_path_factory):
+    """Fixture rasters for DATES under the format_url layout (every third day missing)."""
+    return make_fixture_tree(tmp_path_factory.mktemp("rasters"), DATES, missing_every=3)
+
+@pytest.fixture(scope="session")
+def raster_server(raster_root):
+    with FixtureServer(raster_root) as server:
+        yield server
+
+@pytest.fixture(scope="session")
+def insitu_index(tmp_path_factory):
+    import pandas as pd
+    from app.utils.insitu_loader import clean_insitu_frame
+    from app.utils.insitu_utils import InsituIndex
+    path = write_insitu_pickle(tmp_path_factory.mktemp("insitu") / "insitu.pkl", DATES, stations=150)
+    return InsituIndex(clean_insitu_frame(pd.read_pickle(path)))
+
+@pytest.fixture(scope="session")
+def app_module():
+    from app import main
+    yield main
+    main.shutdown_executors()
+
+@pytest.fixture
+def api(app_module, raster_server, monkeypatch):
+    """
+    TestClient for the app with format_url pointed at raster_server. Startup
+    hooks don't run, so in situ routes see whatever a test sets on
+    app.main.INSITU_INDEX; the process-wide caches start empty.
+    """
+    from fastapi.testclient import TestClient
+    from app.utils import url_utils
+    from app.utils.dataset_cache import DATASET_CACHE
+    monkeypatch.setattr(url_utils, "LIS_DATA_BASE_URL", raster_server.url)
+    app_module.RESPONSE_CACHE.clear()
+    DATASET_CACHE.clear()
+    yield TestClient(app_module.app)
+    app_module.RESPONSE_CACHE.clear()
+    DATASET_CACHE.clear()
@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from app.utils.executor_utils import IO_EXECUTOR
+from benchmarks.common import fixture_lonlats
+from conftest import DATES
+
+@pytest.fixture
+def points():
+    lons, lats = fixture_lonlats(3, seed=4)
+    return [{"lat": float(lat), "lon": float(lon)} for lat, lon in zip(lats, lons)]
+
+@pytest.fixture
+def io_full(monkeypatch):
+    """Every io pool slot taken, as if other requests had filled its queue."""
+    monkeypatch.setattr(IO_EXECUTOR, "_slots", threading.Semaphore(0))
+
+def test_get_values_reads_each_point(api, points):
+    body = {"variable": "chl", "points": [{**p, "date": DATES[i]} for i, p in enumerate(points)]}
+
+    response = api.post("/get_values", json=body)
+
+    assert response.status_code == 200
+    values = response.json()["values"]
+    assert len(values) == 3
+    # DATES[2] has no raster
+    assert values[0] is not None and values[1] is not None and values[2] is None
+
+def test_get_values_caps_distinct_rasters(api, app_module, points, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_BATCH_RASTERS", 2)
+    body = {"variable": "chl", "points": [{**p, "date": DATES[i]} for i, p in enumerate(points)]}
+
+    response = api.post("/get_values", json=body)
+
+    assert response.status_code == 400
+
+def test_get_values_caps_points(api, app_module, points, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_BATCH_POINTS", 2)
+
+    response = api.post("/get_values", json={"variable": "chl", "date": DATES[0], "points": points})
+
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("method, path, kwargs", [
+    ("post", "/get_values", {"json": {"variable": "chl", "date": DATES[0], "points": [{"lat": 41.0, "lon": -73.0}]}}),
+    ("get", "/get_timeseries", {"params": {"lat": 41.0, "lon": -73.0, "variable": "chl",
+                                           "start_date": DATES[0], "end_date": DATES[-1]}}),
+    ("get", "/get_composite", {"params": {"variable": "chl", "start_date": DATES[0], "end_date": DATES[-1],
+                                          "format": "json"}}),
+])
+def test_full_io_queue_is_429(api, io_full, method, path, kwargs):
+    response = getattr(api, method)(path, **kwargs)
+
+    assert response.status_code == 429
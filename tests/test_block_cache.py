@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.utils.block_cache import BlockCache, ObjectChanged, RemoteBlocks
+from benchmarks.common import fixture_path, write_fixture_raster
+from conftest import DATES
+
+BLOCK = 4096
+
+@pytest.fixture
+def remote(tmp_path):
+    return RemoteBlocks(BlockCache(str(tmp_path / "blocks"), max_bytes=1 << 24, block_size=BLOCK), revalidate=300)
+
+def _object(raster_root, raster_server):
+    path = fixture_path(raster_root, DATES[0], "chl")
+    url = f"{raster_server.url}/{os.path.relpath(path, raster_root)}"
+    with open(path, "rb") as f:
+        return url, f.read()
+
+def test_ranges_are_assembled_from_blocks(remote, raster_root, raster_server):
+    url, content = _object(raster_root, raster_server)
+    size, version = remote.meta(url)
+    assert size == len(content)
+
+    rng = np.random.default_rng(0)
+    ranges = [(0, 1), (BLOCK - 1, BLOCK + 1), (5, 3 * BLOCK + 7), (size - 10, size), (size - 1, size + 50), (7, 7)]
+    ranges += [tuple(sorted(rng.integers(0, size, 2))) for _ in range(20)]
+    for start, stop in ranges:
+        assert remote.read(url, version, start, stop) == content[start:min(stop, size)]
+
+def test_cached_blocks_are_not_fetched_again(remote, raster_root, raster_server):
+    url, content = _object(raster_root, raster_server)
+    _, version = remote.meta(url)
+    remote.read(url, version, 0, 6 * BLOCK)
+    raster_server.reset_stats()
+
+    assert remote.read(url, version, BLOCK + 3, 5 * BLOCK) == content[BLOCK + 3:5 * BLOCK]
+    assert raster_server.stats["requests"] == 0
+    # One missing run in the middle is one origin request
+    assert remote.read(url, version, 4 * BLOCK, 9 * BLOCK) == content[4 * BLOCK:9 * BLOCK]
+    assert raster_server.stats["requests"] == 1
+
+def test_republished_object_gets_new_blocks(tmp_path, raster_server, raster_root):
+    remote = RemoteBlocks(BlockCache(str(tmp_path / "blocks"), max_bytes=1 << 24, block_size=BLOCK), revalidate=0)
+    path = fixture_path(raster_root, "2021-06-01", "chl")
+    url = f"{raster_server.url}/{os.path.relpath(path, raster_root)}"
+    write_fixture_raster(path, seed=1)
+    _, old_version = remote.meta(url)
+    remote.read(url, old_version, 0, 3 * BLOCK)
+
+    write_fixture_raster(path, seed=2)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    with open(path, "rb") as f:
+        content = f.read()
+
+    # A read pinned to the old version never mixes in new bytes
+    with pytest.raises(ObjectChanged):
+        remote.read(url, old_version, 3 * BLOCK, 4 * BLOCK)
+    size, version = remote.meta(url)
+    assert version != old_version and size == len(content)
+    assert remote.read(url, version, 0, size) == content
+
+def test_missing_object_raises(remote, raster_server):
+    with pytest.raises(FileNotFoundError):
+        remote.meta(f"{raster_server.url}/nope.tif")
@@ -0,0 +1,88 @@
+import asyncio
+
+import numpy as np
+import pytest
+import rasterio
+
+from app.utils import url_utils
+from app.utils.composite_utils import COMPOSITE_MEDIAN_BINS, BlockAccumulator, composite
+from benchmarks.common import fixture_path
+from conftest import DATES
+
+def _stack(rng, days=9, shape=(12, 10)):
+    data = rng.uniform(0, 20, (days,) + shape).astype("float32")
+    valid = rng.random(data.shape) > 0.3
+    valid[:, 0, 0] = False  # a pixel with no data on any day
+    return data, valid
+
+def test_accumulator_stats_match_numpy():
+    data, valid = _stack(np.random.default_rng(0))
+    acc = BlockAccumulator(data.shape[1:])
+    for day, mask in zip(data, valid):
+        acc.update(day, mask)
+    result = acc.result(("mean", "std", "min", "max", "count"))
+
+    masked = np.where(valid, data.astype("float64"), np.nan)
+    with np.errstate(all="ignore"), pytest.warns(RuntimeWarning):
+        expected = {
+            "mean": np.nanmean(masked, axis=0),
+            "std": np.nanstd(masked, axis=0),
+            "min": np.nanmin(masked, axis=0),
+            "max": np.nanmax(masked, axis=0),
+        }
+    for name, values in expected.items():
+        np.testing.assert_allclose(result[name], values, rtol=1e-5, atol=1e-5, equal_nan=True)
+    np.testing.assert_array_equal(result["count"], valid.sum(axis=0))
+
+def test_median_is_within_one_bin_of_the_middle_values():
+    lo, hi = 0.0, 20.0
+    width = (hi - lo) / COMPOSITE_MEDIAN_BINS
+    data, valid = _stack(np.random.default_rng(1), days=15)
+    acc = BlockAccumulator(data.shape[1:], median_range=(lo, hi))
+    for day, mask in zip(data, valid):
+        acc.update(day, mask)
+    median = acc.result(("median",))["median"]
+
+    assert np.isnan(median[0, 0])
+    for row, col in zip(*np.nonzero(valid.any(axis=0))):
+        values = np.sort(data[valid[:, row, col], row, col])
+        # Between the two middle values (equal for odd counts), up to one bin either side
+        lower, upper = values[(len(values) - 1) // 2], values[len(values) // 2]
+        assert lower - width - 1e-5 <= median[row, col] <= upper + width + 1e-5
+
+def test_composite_over_fixture_days(raster_root, monkeypatch):
+    monkeypatch.setattr(url_utils, "LIS_DATA_BASE_URL", str(raster_root))
+    result = asyncio.run(composite("chl", DATES, stats=("mean", "max", "count")))
+
+    days = []
+    for date in DATES:
+        path = fixture_path(raster_root, date, "chl")
+        if path.exists():
+            with rasterio.open(path) as src:
+                days.append(np.where(src.read(1) == src.nodata, np.nan, src.read(1)))
+    stack = np.stack(days).astype("float64")
+    assert len(result["dates"]) == len(days) < len(DATES)
+    with np.errstate(all="ignore"), pytest.warns(RuntimeWarning):
+        np.testing.assert_allclose(result["layers"]["mean"], np.nanmean(stack, axis=0), rtol=1e-5, equal_nan=True)
+        np.testing.assert_allclose(result["layers"]["max"], np.nanmax(stack, axis=0), equal_nan=True)
+    np.testing.assert_array_equal(result["layers"]["count"], np.isfinite(stack).sum(axis=0))
+
+def test_composite_route_tif_has_a_band_per_stat(api):
+    params = {"variable": "chl", "start_date": DATES[0], "end_date": DATES[-1], "stats": "mean,median,count"}
+
+    response = api.get("/get_composite", params=params)
+
+    assert response.status_code == 200
+    with rasterio.MemoryFile(response.content) as memfile, memfile.open() as src:
+        assert src.descriptions == ("mean", "median", "count")
+        assert src.tags()["dates"].split(",") == [d for i, d in enumerate(DATES) if i % 3 != 2]
+
+def test_composite_route_rejects_unknown_stats(api):
+    params = {"variable": "chl", "start_date": DATES[0], "end_date": DATES[-1], "stats": "mean,mode"}
+
+    assert api.get("/get_composite", params=params).status_code == 400
+
+def test_composite_route_without_data_is_404(api):
+    params = {"variable": "chl", "start_date": DATES[2], "end_date": DATES[2], "format": "json"}
+
+    assert api.get("/get_composite", params=params).status_code == 404
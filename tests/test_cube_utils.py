@@ -0,0 +1,96 @@
+import numpy as np
+import rasterio
+
+from app.utils.cube_utils import PixelCube
+from app.utils.projection_utils import grid_for
+from benchmarks.common import LIS_SHAPE, fixture_lonlats, fixture_path, make_fixture_tree, write_fixture_raster
+from conftest import DATES
+
+def test_history_matches_rasters_across_tiles_and_years(raster_root, tmp_path, monkeypatch):
+    # A tile size that does not divide the grid, so edge tiles are padded
+    monkeypatch.setattr("app.utils.cube_utils.CUBE_TILE", 24)
+    cube = PixelCube(str(tmp_path / "cube"), "chl")
+    dates = ["2021-12-31"] + DATES
+    paths = {date: fixture_path(raster_root, date, "chl") for date in DATES}
+    paths["2021-12-31"] = write_fixture_raster(fixture_path(tmp_path / "rasters", "2021-12-31", "chl"), seed=9)
+    days = {}
+    for date in dates:
+        path = paths[date]
+        if not path.exists():
+            cube.write_day(date, None)
+            continue
+        with rasterio.open(path) as src:
+            data = src.read(1)
+            data[data == src.nodata] = np.nan
+            cube.init_grid(src.crs, src.transform, src.shape)
+            grid = grid_for(src)
+        cube.write_day(date, data)
+        days[date] = data
+    assert cube.grid["tile"] == 24 and LIS_SHAPE[1] % 24
+
+    lons, lats = fixture_lonlats(30, seed=2)
+    rows, cols = grid.lonlat_to_pixel(lons, lats)
+    reader = PixelCube(str(tmp_path / "cube"), "chl")
+    for lon, lat, row, col in zip(lons, lats, rows.astype(int), cols.astype(int)):
+        history = reader.history(lat, lon, dates)
+        # Days without a raster are left to the remote read
+        assert set(history) == set(days) != set(dates)
+        for date, data in days.items():
+            value = data[row, col]
+            assert history[date] == (None if np.isnan(value) else float(value))
+
+def test_missing_days_are_not_served_from_the_cube(tmp_path):
+    cube = PixelCube(str(tmp_path / "cube"), "chl")
+    cube.write_day(DATES[0], None)
+
+    reader = PixelCube(str(tmp_path / "cube"), "chl")
+    assert reader.history(41.0, -73.0, [DATES[0]]) == {}
+    assert not reader.covers(DATES[0])
+
+def test_ingest_records_only_definite_misses_and_rechecks_them(tmp_path, monkeypatch):
+    from rasterio.errors import RasterioIOError
+    from app import ingest_cube
+    from app.utils import url_utils
+
+    root = make_fixture_tree(tmp_path / "rasters", DATES[:3], missing_every=3)  # DATES[2] unpublished
+    monkeypatch.setattr(url_utils, "LIS_DATA_BASE_URL", str(root))
+    flaky = str(fixture_path(root, DATES[1], "chl"))
+    open_raster = rasterio.open
+
+    def failing_open(path, *args, **kwargs):
+        if path == flaky:
+            raise RasterioIOError("HTTP response code: 503")
+        return open_raster(path, *args, **kwargs)
+
+    monkeypatch.setattr(ingest_cube.rasterio, "open", failing_open)
+    assert ingest_cube.ingest(str(tmp_path / "cube"), "chl", DATES[0], DATES[2]) == 1
+    cube = PixelCube(str(tmp_path / "cube"), "chl")
+    cube.refresh()
+    # The transient failure is not recorded; only the unpublished day is missing
+    assert (cube.dates, cube.missing) == ({DATES[0]}, {DATES[2]})
+
+    # Next incremental run: the failure has cleared and the missing day was published late
+    monkeypatch.setattr(ingest_cube.rasterio, "open", open_raster)
+    write_fixture_raster(fixture_path(root, DATES[2], "chl"), seed=5)
+    assert ingest_cube.ingest(str(tmp_path / "cube"), "chl", end=DATES[2]) == 2
+    cube.refresh()
+    assert cube.dates == set(DATES[:3]) and DATES[2] not in cube.missing
+
+def test_timeseries_reads_days_the_cube_has_as_missing_remotely(api, raster_root, tmp_path, monkeypatch):
+    from app.utils import cube_utils
+    monkeypatch.setattr(cube_utils, "CUBE_DIR", str(tmp_path / "cube"))
+    monkeypatch.setattr(cube_utils, "_cubes", {})
+    cube = PixelCube(str(tmp_path / "cube"), "chl")
+    with rasterio.open(fixture_path(raster_root, DATES[0], "chl")) as src:
+        cube.init_grid(src.crs, src.transform, src.shape)
+        data = src.read(1)
+        data[data == src.nodata] = np.nan
+    cube.write_day(DATES[0], data)
+    cube.write_day(DATES[1], None)  # published after it was checked
+
+    lons, lats = fixture_lonlats(1, seed=6)
+    response = api.get("/get_timeseries", params={"lat": lats[0], "lon": lons[0], "variable": "chl",
+                                                  "start_date": DATES[0], "end_date": DATES[1]})
+
+    assert response.status_code == 200
+    assert response.json()["dates"] == DATES[:2]
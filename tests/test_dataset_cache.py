@@ -0,0 +1,55 @@
+import os
+import time
+
+from app.utils import dataset_cache
+from app.utils.block_cache import REVALIDATE_SECONDS
+from app.utils.dataset_cache import DATASET_CACHE
+from app.utils.raster_utils import get_pixel_value
+from benchmarks.common import fixture_path, write_fixture_raster
+from conftest import pixel, pixel_lonlat, republish
+
+def _published(raster_root, raster_server, date):
+    path = fixture_path(raster_root, date, "chl")
+    write_fixture_raster(path, seed=1)
+    DATASET_CACHE.clear()
+    return path, f"{raster_server.url}/{os.path.relpath(path, raster_root)}"
+
+def test_republished_object_gets_a_new_handle(raster_root, raster_server, monkeypatch):
+    monkeypatch.setattr(DATASET_CACHE, "ttl", 300)
+    path, url = _published(raster_root, raster_server, "2021-06-01")
+    lon, lat = pixel_lonlat(40, 40)
+    assert get_pixel_value(url, lat, lon) == pixel(path, 40, 40)
+    old = pixel(path, 40, 40)
+
+    # Same pixel: the cached handle has it in GDAL's memory and would serve it as is
+    republish(path, seed=2)
+    time.sleep(REVALIDATE_SECONDS + 0.5)
+    stats = DATASET_CACHE.stats()
+
+    value = get_pixel_value(url, lat, lon)
+
+    assert value == pixel(path, 40, 40) != old
+    assert DATASET_CACHE.stats()["misses"] == stats["misses"] + 1
+    assert DATASET_CACHE.stats()["retries"] == stats["retries"]
+
+def test_failed_read_on_a_reused_handle_is_retried_on_a_fresh_one(raster_root, raster_server, monkeypatch):
+    path, url = _published(raster_root, raster_server, "2021-06-02")
+    lon, lat = pixel_lonlat(40, 40)
+    assert get_pixel_value(url, lat, lon) == pixel(path, 40, 40)
+    before = dataset_cache.object_version(url)
+
+    # A tile the cached handle has not read yet, so GDAL has to ask the block cache
+    lon, lat = pixel_lonlat(300, 600)
+    old = pixel(path, 300, 600)
+    republish(path, seed=2)
+    time.sleep(REVALIDATE_SECONDS + 0.5)
+    retries = DATASET_CACHE.stats()["retries"]
+    # Republished right after the checkout's version check: it still sees the old version
+    versions = iter([before])
+    real = dataset_cache.object_version
+    monkeypatch.setattr(dataset_cache, "object_version", lambda u: next(versions, None) or real(u))
+
+    value = get_pixel_value(url, lat, lon)
+
+    assert value == pixel(path, 300, 600) != old
+    assert DATASET_CACHE.stats()["retries"] == retries + 1
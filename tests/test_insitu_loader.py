@@ -0,0 +1,57 @@
+import asyncio
+import functools
+import os
+
+import pytest
+
+from app.utils.insitu_loader import load_insitu_frame
+from benchmarks.common import write_insitu_pickle
+from conftest import DATES
+
+@pytest.fixture
+def insitu(api, app_module, raster_root, raster_server, tmp_path, monkeypatch):
+    """The app loading its in situ pickle from raster_server; returns the pickle's path."""
+    path = raster_root / "insitu-loader.pkl"
+    write_insitu_pickle(path, DATES, stations=20)
+    for name in ("INSITU_DF", "INSITU_INDEX", "INSITU_VALIDATOR", "INSITU_GENERATION"):
+        monkeypatch.setattr(app_module, name, None)
+    monkeypatch.setattr(app_module, "load_insitu_frame", functools.partial(
+        load_insitu_frame, url=f"{raster_server.url}/insitu-loader.pkl", cache_dir=str(tmp_path / "cache")
+    ))
+    return path
+
+def test_in_situ_routes_are_503_until_loaded(api, insitu):
+    assert api.get("/get_available_dates", params={"variable": "chl"}).status_code == 503
+
+def test_refresh_swaps_in_republished_data(api, app_module, insitu):
+    asyncio.run(app_module.refresh_insitu_data())
+    first = api.get("/get_available_dates", params={"variable": "chl"})
+    assert first.status_code == 200 and first.json()["dates"] == DATES
+    generation = app_module.INSITU_GENERATION
+
+    # Unchanged object: nothing is reloaded and cached responses stay valid
+    index = app_module.INSITU_INDEX
+    asyncio.run(app_module.refresh_insitu_data())
+    assert app_module.INSITU_INDEX is index and app_module.INSITU_GENERATION == generation
+    assert api.get("/get_available_dates", params={"variable": "chl"}).headers["x-cache"] == "HIT"
+
+    write_insitu_pickle(insitu, DATES[:2], stations=20)
+    stat = os.stat(insitu)
+    os.utime(insitu, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    asyncio.run(app_module.refresh_insitu_data())
+
+    assert app_module.INSITU_GENERATION != generation
+    second = api.get("/get_available_dates", params={"variable": "chl"})
+    assert second.json()["dates"] == DATES[:2]
+    assert second.headers["x-cache"] == "MISS" and second.headers["etag"] != first.headers["etag"]
+
+def test_restart_loads_from_the_local_cache(insitu, raster_server, tmp_path):
+    url = f"{raster_server.url}/insitu-loader.pkl"
+    df, validator = load_insitu_frame(url=url, cache_dir=str(tmp_path / "restart"))
+    raster_server.reset_stats()
+
+    cached, cached_validator = load_insitu_frame(url=url, cache_dir=str(tmp_path / "restart"))
+
+    assert cached_validator == validator
+    assert len(cached) == len(df)
+    assert raster_server.stats["bytes"] == 0  # only the HEAD check
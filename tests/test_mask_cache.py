@@ -0,0 +1,44 @@
+import numpy as np
+from rasterio.windows import Window
+
+from app.utils.mask_cache import MASK_CACHE, MaskCache, pack_mask, unpack_mask
+from app.utils.url_utils import format_url
+from benchmarks.common import fixture_lonlats
+from conftest import DATES
+
+def _polygon(seed):
+    lons, lats = fixture_lonlats(1, seed=seed)
+    lon, lat = float(lons[0]), float(lats[0])
+    return {"type": "Polygon", "coordinates": [[
+        [lon - 0.04, lat - 0.02], [lon + 0.04, lat - 0.02], [lon, lat + 0.03], [lon - 0.04, lat - 0.02]
+    ]]}
+
+def test_pack_round_trip():
+    mask = np.random.default_rng(0).random((7, 13)) > 0.5
+    window, unpacked = unpack_mask(pack_mask(Window(3, 5, 13, 7), mask))
+
+    assert window == Window(3, 5, 13, 7)
+    np.testing.assert_array_equal(unpacked, mask)
+
+def test_cache_evicts_least_recently_used():
+    mask = np.ones((64, 64), dtype=bool)
+    cache = MaskCache(max_bytes=2 * np.packbits(mask).nbytes)
+    window = Window(0, 0, 64, 64)
+    for i in range(3):
+        cache.put(("grid",), {"id": i}, window, mask)
+
+    assert cache.get(("grid",), {"id": 0}) is None
+    assert cache.get(("grid",), {"id": 2}) is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_polygon_stats_reuse_the_api_process_mask(api):
+    body = {"url": format_url(DATES[0], "chl"), "polygon": _polygon(seed=11)}
+    before = MASK_CACHE.stats()
+
+    first = api.post("/get_polygon_stats", json=body)
+    second = api.post("/get_polygon_stats", json={**body, "url": format_url(DATES[1], "chl")})
+
+    assert first.status_code == second.status_code == 200
+    masks = api.get("/cache_stats").json()["masks"]
+    assert masks["misses"] == before["misses"] + 1
+    assert masks["hits"] == before["hits"] + 1
@@ -0,0 +1,41 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from app.utils.matchup_utils import MATCHUP_COLUMNS, _candidates
+from conftest import DATES
+
+@pytest.mark.parametrize("max_days", [0, 1, 3])
+def test_candidates_are_the_rows_within_max_days(insitu_index, max_days):
+    start, end = datetime.date.fromisoformat(DATES[1]), datetime.date.fromisoformat(DATES[4])
+    (var_index, rows), jobs = _candidates(insitu_index, "chl", start, end, max_days)
+
+    row_days = var_index.timestamps[rows].astype("datetime64[D]")
+    assert row_days.min() == np.datetime64(start) and row_days.max() == np.datetime64(end)
+    expected_days = {str(d + np.timedelta64(k, "D")) for d in np.unique(row_days) for k in range(-max_days, max_days + 1)}
+    assert set(jobs) == expected_days
+    for day, day_rows in jobs.items():
+        near = np.abs((row_days - np.datetime64(day, "D")).astype("int64")) <= max_days
+        np.testing.assert_array_equal(day_rows, rows[near])
+
+def test_candidates_outside_the_data_are_empty(insitu_index):
+    day = datetime.date(2020, 1, 1)
+
+    assert _candidates(insitu_index, "chl", day, day, 2) == (None, {})
+
+def test_matchups_route_pairs_samples_with_rasters(api, app_module, insitu_index, monkeypatch):
+    monkeypatch.setattr(app_module, "INSITU_INDEX", insitu_index)
+    params = {"variable": "chl", "start_date": DATES[0], "end_date": DATES[-1], "max_days": 1, "max_cv": 10}
+
+    response = api.get("/get_matchups", params=params)
+
+    assert response.status_code == 200
+    body = response.json()
+    table = body["matchups"]
+    assert set(table) == set(MATCHUP_COLUMNS)
+    assert 0 < body["counts"]["passed"] == len(table["raster_date"]) == body["summary"]["n"]
+    # Every third fixture day has no raster, so those samples use a neighbouring day
+    assert body["counts"]["days_missing"] > 0
+    assert all(abs(offset) <= 1 for offset in table["day_offset"])
+    assert {DATES[2], DATES[5]}.isdisjoint(table["raster_date"])
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from benchmarks.common import fixture_lonlats
+from conftest import DATES
+
+@pytest.fixture
+def polygon():
+    lons, lats = fixture_lonlats(1, seed=4)
+    lon, lat = float(lons[0]), float(lats[0])
+    return {"type": "Polygon", "coordinates": [[
+        [lon - 0.05, lat - 0.03], [lon + 0.05, lat - 0.03], [lon, lat + 0.03], [lon - 0.05, lat - 0.03]
+    ]]}
+
+def _request(polygon, start=DATES[0], end=DATES[-1]):
+    return {"polygon": polygon, "variable": "chl", "start_date": start, "end_date": end}
+
+def test_polygon_timeseries_streams_days_with_data(api, polygon):
+    response = api.post("/get_polygon_timeseries", json=_request(polygon))
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["date"] for line in lines) == [d for i, d in enumerate(DATES) if i % 3 != 2]
+    assert all(line["count"] > 0 and line["min"] <= line["mean"] <= line["max"] for line in lines)
+
+def test_polygon_timeseries_caps_the_date_range(api, app_module, polygon, monkeypatch):
+    monkeypatch.setattr(app_module, "POLYGON_TIMESERIES_MAX_DAYS", 3)
+
+    response = api.post("/get_polygon_timeseries", json=_request(polygon))
+
+    assert response.status_code == 400
+
+def test_polygon_timeseries_out_of_time_before_any_day_is_504(api, app_module, polygon, monkeypatch):
+    monkeypatch.setattr(app_module, "POLYGON_TIMESERIES_TIMEOUT", 0)
+
+    response = api.post("/get_polygon_timeseries", json=_request(polygon))
+
+    assert response.status_code == 504
+    assert response.json()["timed_out_dates"] == DATES
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio import features
+
+from app.utils.polygon_utils import RunningStats, get_polygon_stats
+from app.utils.projection_utils import grid_for
+from benchmarks.common import fixture_lonlats, fixture_path
+from conftest import DATES
+
+def test_running_stats_blocks_and_merge_match_numpy():
+    rng = np.random.default_rng(0)
+    blocks = [rng.normal(5, 2, n) for n in (1, 17, 0, 400, 3)]
+    values = np.concatenate(blocks)
+
+    fed = RunningStats()
+    for block in blocks:
+        fed.update(block)
+    merged = RunningStats()
+    for block in blocks:
+        part = RunningStats()
+        part.update(block)
+        merged.merge(part)
+    merged.merge(RunningStats())  # empty merge is a no-op
+
+    for stats in (fed, merged):
+        assert stats.count == values.size
+        assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+        assert stats.std == pytest.approx(values.std(), rel=1e-10)
+        assert (stats.min, stats.max) == (values.min(), values.max())
+
+def test_running_stats_empty():
+    stats = RunningStats()
+    stats.update(np.empty(0))
+    assert stats.count == 0 and np.isnan(stats.std)
+
+def test_polygon_stats_match_full_raster_mask(raster_root):
+    path = str(fixture_path(raster_root, DATES[0], "chl"))
+    lons, lats = fixture_lonlats(1, seed=4)
+    lon, lat = float(lons[0]), float(lats[0])
+    polygon = {"type": "Polygon", "coordinates": [[
+        [lon - 0.1, lat - 0.05], [lon + 0.1, lat - 0.05], [lon + 0.05, lat + 0.05], [lon - 0.1, lat - 0.05]
+    ]]}
+
+    result = get_polygon_stats(path, polygon)
+
+    with rasterio.open(path) as src:
+        data = src.read(1)
+        mask = features.geometry_mask([grid_for(src).project_geometry(polygon)], out_shape=data.shape,
+                                      transform=src.transform, invert=True)
+    values = data[mask & (data != src.nodata)].astype("float64")
+    assert result["count"] == values.size > 0
+    assert result["mean"] == pytest.approx(values.mean(), rel=1e-9)
+    assert result["std"] == pytest.approx(values.std(), rel=1e-9)
+    assert (result["min"], result["max"]) == (values.min(), values.max())
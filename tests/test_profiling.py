@@ -0,0 +1,45 @@
+import pytest
+
+from benchmarks.common import fixture_lonlats
+from conftest import DATES
+
+def _spans(response) -> dict:
+    """Server-Timing header as {name: calls}."""
+    spans = {}
+    for part in response.headers["Server-Timing"].split(", "):
+        name, *params = part.split(";")
+        desc = next((p for p in params if p.startswith("desc=")), None)
+        spans[name] = int(desc.split('"')[1].split()[0]) if desc else 0
+    return spans
+
+@pytest.fixture
+def point():
+    lons, lats = fixture_lonlats(1, seed=4)
+    return {"lat": float(lats[0]), "lon": float(lons[0])}
+
+def test_timeseries_profile_counts_each_days_read(api, point):
+    params = {**point, "variable": "chl", "start_date": DATES[0], "end_date": DATES[-1]}
+
+    response = api.get("/get_timeseries", params=params, headers={"x-profile": "1"})
+
+    assert response.status_code == 200
+    days = len(response.json()["dates"])
+    assert _spans(response)["read"] == days
+    assert int(response.headers["X-Raster-Bytes-Read"]) > 0
+
+def test_composite_profile_includes_block_reads(api):
+    params = {"variable": "chl", "start_date": DATES[0], "end_date": DATES[-1], "format": "json"}
+
+    response = api.get("/get_composite", params=params, headers={"x-profile": "1"})
+
+    assert response.status_code == 200
+    assert _spans(response)["read"] >= response.json()["dates_used"]
+    assert int(response.headers["X-Raster-Bytes-Read"]) > 0
+
+def test_profile_headers_only_on_request(api, point):
+    params = {**point, "variable": "chl", "start_date": DATES[0], "end_date": DATES[0]}
+
+    response = api.get("/get_timeseries", params=params)
+
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
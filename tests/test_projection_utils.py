@@ -0,0 +1,34 @@
+import warnings
+
+import numpy as np
+import rasterio
+
+from app.utils.projection_utils import grid_for
+from app.utils.url_utils import format_url
+from benchmarks.common import fixture_lonlats, fixture_path
+from conftest import DATES
+
+def test_single_points_project_like_arrays_without_warnings(raster_root):
+    with rasterio.open(fixture_path(raster_root, DATES[0], "chl")) as src:
+        grid = grid_for(src)
+    lons, lats = fixture_lonlats(5, seed=4)
+    rows, cols = grid.lonlat_to_pixel(lons, lats)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        for i in range(len(lons)):
+            for lon, lat in ((lons[i], lats[i]), ([lons[i]], [lats[i]]), (np.float64(lons[i]), np.float64(lats[i]))):
+                row, col = grid.lonlat_to_pixel(lon, lat)
+                assert np.shape(row) == np.shape(lon)
+                np.testing.assert_allclose([np.ravel(row)[0], np.ravel(col)[0]], [rows[i], cols[i]])
+        back_lons, back_lats = grid.pixel_to_lonlat([rows[0]], [cols[0]])
+    np.testing.assert_allclose([back_lons[0], back_lats[0]], [lons[0], lats[0]], atol=1e-9)
+
+def test_get_value_raises_no_deprecation_warning(api, recwarn):
+    lons, lats = fixture_lonlats(1, seed=4)
+    params = {"lat": float(lats[0]), "lon": float(lons[0]), "url": format_url(DATES[0], "chl")}
+
+    response = api.get("/get_value", params=params)
+
+    assert response.status_code == 200 and response.json()["value"] is not None
+    assert not [w for w in recwarn if issubclass(w.category, DeprecationWarning)]
@@ -0,0 +1,190 @@
+import fnmatch
+import gzip
+import os
+import time
+
+import brotli
+import pytest
+import redis
+
+from app.utils.block_cache import REVALIDATE_SECONDS
+from app.utils.dataset_cache import DATASET_CACHE
+from app.utils.response_cache import (
+    CACHE_KEY_PREFIX, CachedResponse, MemoryBackend, RedisBackend, ResponseCache, normalize_params
+)
+from app.utils.url_utils import format_google_url
+from benchmarks.common import fixture_path, write_fixture_raster
+from conftest import pixel, pixel_lonlat, republish
+
+def test_normalize_params_canonicalizes_numbers_and_order():
+    a = normalize_params([("lat", "41"), ("lon", "-73.50"), ("variable", "chl")])
+    b = normalize_params([("variable", "chl"), ("lon", "-73.5"), ("lat", " 41.000 ")])
+    assert a == b
+    assert normalize_params([("lat", "41")]) != normalize_params([("lat", "41.0001")])
+    # Non-numeric values are kept as given
+    assert normalize_params([("variable", "chl")]) != normalize_params([("variable", "CHL")])
+
+def test_normalize_params_applies_normalizers():
+    bucket_url = "https://storage.googleapis.com/lis-olci-netcdfs/2022/01/01/LIS_20220101_chl.tif"
+    normalizers = {"url": format_google_url}
+    assert (normalize_params([("url", bucket_url)], normalizers)
+            == normalize_params([("url", format_google_url(bucket_url))], normalizers))
+
+def test_key_and_etag_follow_route_generation_and_params():
+    cache = ResponseCache(MemoryBackend(1 << 20))
+    params = normalize_params([("lat", "41")])
+    key = cache.key("/get_value", "raster-a", params)
+    assert key == cache.key("/get_value", "raster-a", normalize_params([("lat", "41.0")]))
+    assert key != cache.key("/get_value", "raster-b", params)
+    assert key != cache.key("/get_transect", "raster-a", params)
+
+    entry = cache.put(key, b"x" * 2000, "application/json", {"Content-Disposition": "inline"})
+    assert entry.etag == cache.etag(key)
+    assert cache.get(key).headers == {"Content-Disposition": "inline"}
+
+    cache.invalidate("raster-a")
+    assert cache.get(key) is None
+
+def test_cached_response_encodings_and_round_trip():
+    body = b'{"values": [' + b"1.0, " * 500 + b"1.0]}"
+    entry = CachedResponse.build(body, "application/json", {"X-Extra": "1"}, etag='"abc"')
+    assert entry.encoded("gzip, deflate")[1] == "gzip"
+    assert entry.encoded("gzip, deflate, br")[1] == "br"
+    assert brotli.decompress(entry.encoded("br")[0]) == body
+    assert gzip.decompress(entry.encoded("gzip")[0]) == body
+    assert entry.encoded("gzip;q=0, identity") == (body, None)
+
+    copy = CachedResponse.from_bytes(entry.to_bytes())
+    assert (copy.body, copy.gzip, copy.media_type, copy.headers, copy.etag) == (
+        entry.body, entry.gzip, entry.media_type, entry.headers, entry.etag)
+
+def test_small_bodies_are_not_compressed():
+    entry = CachedResponse.build(b"{}", "application/json")
+    assert entry.encoded("gzip, br") == (b"{}", None)
+
+def test_memory_backend_evicts_least_recently_used_by_bytes():
+    backend = MemoryBackend(max_bytes=300)
+    for name in "abc":
+        backend.set(name, CachedResponse(b"x" * 100, "text/plain"))
+    backend.get("a")
+    backend.set("d", CachedResponse(b"x" * 100, "text/plain"))
+    assert backend.get("b") is None
+    assert all(backend.get(name) is not None for name in "acd")
+    assert backend.stats()["bytes"] == 300
+
+class FakeRedis:
+    """Stand-in for the redis client: the calls RedisBackend makes, on a dict."""
+
+    def __init__(self, down=False):
+        self.data = {}
+        self.expiry = {}
+        self.down = down
+
+    def _check(self):
+        if self.down:
+            raise redis.ConnectionError("connection refused")
+
+    def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self._check()
+        self.data[key], self.expiry[key] = value, ex
+
+    def scan_iter(self, match="*", count=None):
+        self._check()
+        return iter([key for key in list(self.data) if fnmatch.fnmatchcase(key, match)])
+
+    def delete(self, *keys):
+        self._check()
+        for key in keys:
+            self.data.pop(key, None)
+
+def _redis_backend(monkeypatch, client):
+    monkeypatch.setattr(redis.Redis, "from_url", classmethod(lambda cls, url, **kwargs: client))
+    return RedisBackend("redis://cache:6379/0")
+
+def test_redis_backend_round_trip_and_invalidation(monkeypatch):
+    client = FakeRedis()
+    cache = ResponseCache(_redis_backend(monkeypatch, client))
+    key = cache.key("/get_value", "raster-a", normalize_params([("lat", "41")]))
+    other = cache.key("/get_value", "raster-b", normalize_params([("lat", "41")]))
+    cache.put(key, b"x" * 2000, "application/json", {"Content-Disposition": "inline"})
+    cache.put(other, b"{}", "application/json")
+
+    entry = cache.get(key)
+    assert entry.body == b"x" * 2000 and entry.headers == {"Content-Disposition": "inline"}
+    assert all(k.startswith(CACHE_KEY_PREFIX) for k in client.data)
+    assert 0 < client.expiry[key] <= int(entry.expires - time.time()) + 1
+
+    cache.invalidate("raster-a")
+    assert cache.get(key) is None and cache.get(other) is not None
+    cache.clear()
+    assert client.data == {}
+
+def test_redis_backend_errors_are_misses(monkeypatch):
+    backend = _redis_backend(monkeypatch, FakeRedis(down=True))
+    cache = ResponseCache(backend)
+    key = cache.key("/get_value", "raster-a", normalize_params([("lat", "41")]))
+
+    cache.put(key, b"{}", "application/json")
+    assert cache.get(key) is None
+    cache.invalidate("raster-a")
+    assert backend.stats() == {"errors": 3}
+
+@pytest.fixture
+def scene(raster_root, raster_server, monkeypatch):
+    """(path, url) of a fixture raster of the test's own that it may republish, with long-lived handles."""
+    monkeypatch.setattr(DATASET_CACHE, "ttl", 300)
+
+    def publish(date):
+        path = fixture_path(raster_root, date, "chl")
+        write_fixture_raster(path, seed=1)
+        return path, f"{raster_server.url}/{os.path.relpath(path, raster_root)}"
+    return publish
+
+def test_get_value_is_cached_per_raster_version(api, scene):
+    path, url = scene("2021-07-01")
+    lon, lat = pixel_lonlat(60, 80)
+    params = {"url": url, "lat": lat, "lon": lon}
+
+    first = api.get("/get_value", params=params)
+    second = api.get("/get_value", params={**params, "lat": f"{lat!r}0"})
+    revalidated = api.get("/get_value", params=params, headers={"If-None-Match": first.headers["ETag"]})
+
+    assert first.headers["X-Cache"] == "MISS" and second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json() and first.json()["value"] == pixel(path, 60, 80)
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert revalidated.status_code == 304 and revalidated.headers["X-Cache"] == "REVALIDATED"
+
+    # A republished raster is a new generation: new value under a new ETag, never the old one
+    republish(path, seed=2)
+    time.sleep(REVALIDATE_SECONDS + 0.5)
+    third = api.get("/get_value", params=params, headers={"If-None-Match": first.headers["ETag"]})
+
+    assert third.status_code == 200 and third.headers["X-Cache"] == "MISS"
+    assert third.headers["ETag"] != first.headers["ETag"]
+    assert third.json()["value"] == pixel(path, 60, 80) != first.json()["value"]
+
+def test_get_value_for_a_local_path_is_not_cached(api, scene):
+    path, _ = scene("2021-07-02")
+    lon, lat = pixel_lonlat(60, 80)
+
+    response = api.get("/get_value", params={"url": str(path), "lat": lat, "lon": lon})
+
+    assert response.status_code == 200 and "X-Cache" not in response.headers
+
+def test_get_subset_etag_follows_the_raster_version(api, scene):
+    path, url = scene("2021-07-03")
+    params = {"url": url, "format": "f16", "max_size": 64}
+
+    first = api.get("/get_subset", params=params)
+    revalidated = api.get("/get_subset", params=params, headers={"If-None-Match": first.headers["ETag"]})
+    republish(path, seed=3)
+    time.sleep(REVALIDATE_SECONDS + 0.5)
+    second = api.get("/get_subset", params=params, headers={"If-None-Match": first.headers["ETag"]})
+
+    assert first.status_code == 200 and revalidated.status_code == 304
+    assert second.status_code == 200 and second.headers["ETag"] != first.headers["ETag"]
+    assert second.content != first.content
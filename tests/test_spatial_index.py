@@ -0,0 +1,132 @@
+import datetime
+
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import box
+
+from app.utils.spatial_index import haversine_m, parse_polygon
+from conftest import DATES
+
+def _brute_rows(var_index, inside, start=None, end=None):
+    days = var_index.timestamps.astype("datetime64[D]")
+    keep = inside.copy()
+    if start is not None:
+        keep &= days >= np.datetime64(start, "D")
+    if end is not None:
+        keep &= days <= np.datetime64(end, "D")
+    return np.flatnonzero(keep)
+
+@pytest.fixture
+def chl(insitu_index):
+    return insitu_index.get("chl"), insitu_index.spatial["chl"]
+
+def _bbox_around(var_index, size):
+    lon, lat = float(np.median(var_index.lon)), float(np.median(var_index.lat))
+    return lon - size, lat - size / 2, lon + size, lat + size / 2
+
+@pytest.mark.parametrize("start,end", [
+    (None, None),
+    (DATES[1], DATES[3]),
+    (DATES[2], DATES[2]),  # single day: per-date tree
+    ("2030-01-01", "2030-01-02"),
+])
+def test_bbox_query_matches_scan(chl, start, end):
+    var_index, spatial = chl
+    west, south, east, north = _bbox_around(var_index, 0.3)
+    inside = (var_index.lon >= west) & (var_index.lon <= east) & (var_index.lat >= south) & (var_index.lat <= north)
+    start = datetime.date.fromisoformat(start) if start else None
+    end = datetime.date.fromisoformat(end) if end else None
+
+    rows = spatial.query_rows(box(west, south, east, north), start, end)
+
+    np.testing.assert_array_equal(rows, _brute_rows(var_index, inside, start, end))
+
+def test_polygon_query_matches_scan(chl):
+    var_index, spatial = chl
+    west, south, east, north = _bbox_around(var_index, 0.4)
+    polygon = parse_polygon({"type": "Polygon", "coordinates": [[
+        [west, south], [east, south], [west, north], [west, south]
+    ]]})
+    inside = shapely.intersects(polygon, shapely.points(var_index.lon, var_index.lat))
+
+    rows = spatial.query_rows(polygon)
+
+    assert len(rows) > 0
+    np.testing.assert_array_equal(rows, _brute_rows(var_index, inside))
+
+def test_parse_polygon_rejects_other_geometries():
+    with pytest.raises(ValueError):
+        parse_polygon({"type": "Point", "coordinates": [0, 0]})
+
+@pytest.mark.parametrize("k,radius_m,start", [(5, None, None), (50, None, None), (10, 5000.0, None), (5, None, DATES[4])])
+def test_nearest_matches_brute_force(chl, k, radius_m, start):
+    var_index, spatial = chl
+    lon, lat = float(var_index.lon[0]) + 0.01, float(var_index.lat[0]) - 0.01
+    start = datetime.date.fromisoformat(start) if start else None
+
+    stations, distances, counts = spatial.nearest(lon, lat, k, radius_m, start, None)
+
+    # Brute force over the distinct positions with samples in range
+    rows = _brute_rows(var_index, np.ones(len(var_index), dtype=bool), start)
+    positions, samples = np.unique(np.stack([var_index.lon[rows], var_index.lat[rows]], axis=1),
+                                   axis=0, return_counts=True)
+    expected = haversine_m(lon, lat, positions[:, 0], positions[:, 1])
+    order = np.argsort(expected, kind="stable")
+    if radius_m is not None:
+        order = order[expected[order] <= radius_m]
+    order = order[:k]
+
+    np.testing.assert_allclose(distances, expected[order])
+    np.testing.assert_array_equal(np.stack([spatial.lon[stations], spatial.lat[stations]], axis=1), positions[order])
+    np.testing.assert_array_equal(counts, samples[order])
+
+@pytest.fixture
+def loaded(app_module, insitu_index, monkeypatch):
+    monkeypatch.setattr(app_module, "INSITU_INDEX", insitu_index)
+    monkeypatch.setattr(app_module, "INSITU_GENERATION", "insitu-test")
+
+def test_bbox_route_counts_and_truncates(api, app_module, loaded, chl, monkeypatch):
+    var_index, spatial = chl
+    west, south, east, north = _bbox_around(var_index, 0.3)
+    expected = spatial.query_rows(box(west, south, east, north))
+    monkeypatch.setattr(app_module, "INSITU_QUERY_MAX_ROWS", len(expected) - 1)
+    params = {"variable": "chl", "bbox": f"{west},{south},{east},{north}", "layout": "columns"}
+
+    response = api.get("/get_insitu_in_bbox", params=params)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == len(expected) and body["truncated"] is True
+    np.testing.assert_allclose(body["data"]["lat"], var_index.lat[expected[:-1]])
+
+def test_polygon_route_matches_the_bbox_route_for_a_rectangle(api, loaded, chl):
+    west, south, east, north = _bbox_around(chl[0], 0.3)
+    rectangle = {"type": "Polygon", "coordinates": [[
+        [west, south], [east, south], [east, north], [west, north], [west, south]
+    ]]}
+
+    by_bbox = api.get("/get_insitu_in_bbox", params={"variable": "chl", "bbox": f"{west},{south},{east},{north}"})
+    by_polygon = api.post("/get_insitu_in_polygon", json={"variable": "chl", "polygon": rectangle})
+
+    assert by_polygon.status_code == by_bbox.status_code == 200
+    assert by_polygon.json() == by_bbox.json()
+
+def test_nearby_route_is_closest_first(api, loaded, chl):
+    var_index, _ = chl
+    params = {"variable": "chl", "lat": float(var_index.lat[0]), "lon": float(var_index.lon[0]), "k": 5}
+
+    response = api.get("/get_insitu_nearby", params=params)
+
+    assert response.status_code == 200
+    stations = response.json()["stations"]
+    assert len(stations["distance_m"]) == 5 and stations["distance_m"][0] == pytest.approx(0.0, abs=1e-6)
+    assert stations["distance_m"] == sorted(stations["distance_m"])
+
+@pytest.mark.parametrize("params", [
+    {"variable": "chl", "bbox": "1,2,3"},
+    {"variable": "chl", "bbox": "-73,41,-72,42", "start_date": DATES[3], "end_date": DATES[1]},
+    {"variable": "salinity", "bbox": "-73,41,-72,42"},
+])
+def test_bbox_route_rejects_bad_queries(api, loaded, params):
+    assert api.get("/get_insitu_in_bbox", params=params).status_code == 400
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+from app.utils import timeseries_utils
+from benchmarks.common import fixture_lonlats
+from conftest import DATES
+
+@pytest.fixture
+def point():
+    lons, lats = fixture_lonlats(1, seed=4)
+    return {"lat": float(lats[0]), "lon": float(lons[0])}
+
+def _query(point, start=DATES[0], end=DATES[-1]):
+    return {**point, "variable": "chl", "start_date": start, "end_date": end}
+
+def _slow_on(dates, seconds):
+    read = timeseries_utils._read
+
+    def slow_read(url, lat, lon):
+        if any(f"LIS_{date.replace('-', '')}_" in url for date in dates):
+            time.sleep(seconds)
+        return read(url, lat, lon)
+    return slow_read
+
+def test_timeseries_skips_missing_days(api, point):
+    response = api.get("/get_timeseries", params=_query(point))
+
+    assert response.status_code == 200
+    body = response.json()
+    # Every third fixture day has no raster
+    assert body["dates"] == [d for i, d in enumerate(DATES) if i % 3 != 2]
+    assert len(body["values"]) == len(body["dates"])
+    assert body["partial"] is False and body["timed_out_dates"] == []
+
+def test_timeseries_reports_days_not_read_in_time(api, point, monkeypatch):
+    monkeypatch.setattr(timeseries_utils, "TIMESERIES_TIMEOUT", 1.0)
+    monkeypatch.setattr(timeseries_utils, "_read", _slow_on([DATES[3]], 3.0))
+
+    response = api.get("/get_timeseries", params=_query(point))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["partial"] is True
+    assert body["timed_out_dates"] == [DATES[3]]
+    assert body["dates"] == [DATES[0], DATES[1], DATES[4]]
+
+def test_timeseries_with_no_day_read_in_time_is_504(api, point, monkeypatch):
+    monkeypatch.setattr(timeseries_utils, "TIMESERIES_TIMEOUT", 0.2)
+    monkeypatch.setattr(timeseries_utils, "_read", _slow_on(DATES, 1.0))
+
+    response = api.get("/get_timeseries", params=_query(point, end=DATES[1]))
+
+    assert response.status_code == 504
+    assert response.json()["timed_out_dates"] == DATES[:2]
+
+def test_timeseries_without_data_is_404(api, point):
+    response = api.get("/get_timeseries", params=_query(point, DATES[2], DATES[2]))
+
+    assert response.status_code == 404